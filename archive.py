@@ -0,0 +1,181 @@
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from records import to_json
+
+# Announcements from before the current month, sealed into one segment file
+# per month (JSON lines, oldest first) and read back only when someone
+# scrolls or searches that far. manifest.json lists the segments, and the id
+# ranges of any dropped by retention.
+ARCHIVE_DIR = os.getenv('IEMS_ARCHIVE_DIR', 'announcement_archive')
+
+# Drop segments older than this many days (0 keeps everything)
+RETENTION_DAYS = float(os.getenv('IEMS_ANNOUNCEMENT_RETENTION_DAYS', '0'))
+
+# Segments kept in memory once read, most recently used last
+SEGMENT_CACHE_SIZE = int(os.getenv('IEMS_SEGMENT_CACHE_SIZE', '4'))
+
+# Period of announcements posted before they were timestamped; never dropped by retention
+UNDATED = 'undated'
+
+
+def period_of(announcement):
+    posted = announcement.get('posted')
+    if posted is None:
+        return UNDATED
+    return time.strftime('%Y-%m', time.localtime(posted))
+
+
+def _write_atomically(path, write):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        write(f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+class Archive:
+    def __init__(self, directory=ARCHIVE_DIR, retention_days=RETENTION_DAYS, cache_size=SEGMENT_CACHE_SIZE):
+        self.directory = directory
+        self.retention_days = retention_days
+        self.cache_size = cache_size
+        self.cache = OrderedDict()  # file name -> announcements
+        self.lock = threading.Lock()
+        self.segments, self.expired = self._read_manifest()
+
+    # The segments, and [first_id, last_id] of each one dropped by retention
+    def _read_manifest(self):
+        try:
+            with open(os.path.join(self.directory, 'manifest.json'), 'r') as f:
+                manifest = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return [], []
+        return manifest['segments'], manifest.get('expired', [])
+
+    def _write_manifest(self):
+        _write_atomically(os.path.join(self.directory, 'manifest.json'),
+                          lambda f: json.dump({'segments': self.segments, 'expired': self.expired}, f, indent=4))
+
+    # Announcements in a segment, read from disk on first use
+    def _load(self, segment):
+        name = segment['file']
+        with self.lock:
+            announcements = self.cache.get(name)
+            if announcements is not None:
+                self.cache.move_to_end(name)
+                return announcements
+
+        try:
+            with open(os.path.join(self.directory, name), 'r') as f:
+                announcements = [json.loads(line) for line in f]
+        except FileNotFoundError:
+            # Dropped by retention since we read the manifest
+            announcements = []
+
+        with self.lock:
+            self.cache[name] = announcements
+            while len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+        return announcements
+
+    # Archived announcements with first_id <= id <= last_id, oldest first
+    def get_range(self, first_id, last_id):
+        found = []
+        for segment in self.segments:
+            if segment['last_id'] < first_id or segment['first_id'] > last_id:
+                continue
+            # A segment holds a run of consecutive ids
+            offset = segment['first_id']
+            found.extend(self._load(segment)[max(first_id - offset, 0):last_id - offset + 1])
+        return found
+
+    def get(self, announcement_id):
+        found = self.get_range(announcement_id, announcement_id)
+        return found[0] if found else None
+
+    # Every archived announcement, oldest first, one segment at a time
+    # without keeping them cached (for rebuilding indexes)
+    def __iter__(self):
+        for segment in list(self.segments):
+            try:
+                with open(os.path.join(self.directory, segment['file']), 'r') as f:
+                    for line in f:
+                        yield json.loads(line)
+            except FileNotFoundError:
+                continue
+
+    # How many announcements at the start of `announcements` (oldest first)
+    # belong to earlier months than `now`
+    def sealable(self, announcements, now=None):
+        current = time.strftime('%Y-%m', time.localtime(now or time.time()))
+        count = 0
+        for announcement in announcements:
+            period = period_of(announcement)
+            if period != UNDATED and period >= current:
+                break
+            count += 1
+        return count
+
+    # Write the announcements from earlier months at the start of
+    # `announcements` to segments and apply the retention policy. Returns how
+    # many were sealed; the caller drops them from memory and the snapshot.
+    def seal(self, announcements, now=None):
+        now = now or time.time()
+        # Pick up segments other app instances have written
+        self.segments, self.expired = self._read_manifest()
+        count = self.sealable(announcements, now)
+        if count:
+            os.makedirs(self.directory, exist_ok=True)
+            start = 0
+            while start < count:
+                # One segment per run of announcements from the same month
+                period = period_of(announcements[start])
+                end = start
+                while end < count and period_of(announcements[end]) == period:
+                    end += 1
+                self._add_segment(period, announcements[start:end])
+                start = end
+
+        dropped = self._apply_retention(now)
+        if count or dropped:
+            self._write_manifest()
+        return count
+
+    def _add_segment(self, period, announcements):
+        first_id, last_id = announcements[0]['id'], announcements[-1]['id']
+        name = f'{period}.{first_id}-{last_id}.jsonl'
+        _write_atomically(os.path.join(self.directory, name),
+                          lambda f: f.writelines(json.dumps(announcement, default=to_json) + '\n'
+                                                 for announcement in announcements))
+
+        # Another app instance may already have sealed some of these
+        segments = [segment for segment in self.segments
+                    if segment['last_id'] < first_id or segment['first_id'] > last_id]
+        segments.append({'file': name, 'period': period, 'first_id': first_id, 'last_id': last_id,
+                         'count': len(announcements)})
+        self.segments = sorted(segments, key=lambda segment: segment['first_id'])
+
+    # Remove segments from months that ended before the retention period,
+    # noting their id ranges in `expired`; returns how many
+    def _apply_retention(self, now):
+        if not self.retention_days:
+            return 0
+        cutoff = time.strftime('%Y-%m', time.localtime(now - self.retention_days * 24 * 60 * 60))
+        expired = [segment for segment in self.segments
+                   if segment['period'] != UNDATED and segment['period'] < cutoff]
+        if not expired:
+            return 0
+        self.segments = [segment for segment in self.segments if segment not in expired]
+        self.expired.extend([segment['first_id'], segment['last_id']] for segment in expired)
+        for segment in expired:
+            with self.lock:
+                self.cache.pop(segment['file'], None)
+            try:
+                os.remove(os.path.join(self.directory, segment['file']))
+            except FileNotFoundError:
+                pass
+        return len(expired)
@@ -0,0 +1,255 @@
+import base64
+import hashlib
+import hmac
+import json
+import os
+import platform
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Which key derivation function new hashes use: 'pbkdf2' or 'scrypt'
+KDF = os.getenv('IEMS_KDF', 'pbkdf2')
+
+# Cost parameters. Left at 0 they are calibrated so one hash takes about
+# IEMS_HASH_BUDGET_MS on this machine, and remembered in PARAMS_FILE.
+PBKDF2_ITERATIONS = int(os.getenv('IEMS_PBKDF2_ITERATIONS', '0'))
+SCRYPT_N = int(os.getenv('IEMS_SCRYPT_N', '0'))
+SCRYPT_R = 8
+SCRYPT_P = 1
+HASH_BUDGET_MS = float(os.getenv('IEMS_HASH_BUDGET_MS', '250'))
+PARAMS_FILE = os.getenv('IEMS_KDF_PARAMS_FILE', 'kdf_params.json')
+
+# Never go below these, however slow the machine is
+MIN_PBKDF2_ITERATIONS = 100000
+MIN_SCRYPT_N = 2 ** 14
+
+HASH_WORKERS = int(os.getenv('IEMS_HASH_WORKERS', '2'))
+
+# How long a successful verification is remembered, and for how many logins
+VERIFY_CACHE_TTL = float(os.getenv('IEMS_VERIFY_CACHE_TTL', '60'))
+VERIFY_CACHE_SIZE = 1024
+
+SALT_BYTES = 16
+
+_params = None
+_params_lock = threading.Lock()
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _b64(raw):
+    return base64.b64encode(raw).decode()
+
+
+def _pbkdf2(password, salt, iterations):
+    return hashlib.pbkdf2_hmac('sha256', password.encode(), salt, iterations)
+
+
+def _scrypt(password, salt, n, r, p):
+    return hashlib.scrypt(password.encode(), salt=salt, n=n, r=r, p=p, maxmem=256 * n * r + 1024 * 1024)
+
+
+# Pick cost parameters that keep one hash within the latency budget on this host
+def calibrate(budget_ms=HASH_BUDGET_MS):
+    salt = os.urandom(SALT_BYTES)
+
+    start = time.perf_counter()
+    _pbkdf2('calibration', salt, 10000)
+    per_iteration = (time.perf_counter() - start) / 10000
+    iterations = int(budget_ms / 1000 / per_iteration)
+
+    # scrypt cost grows linearly with n, which has to be a power of two
+    n = MIN_SCRYPT_N
+    start = time.perf_counter()
+    _scrypt('calibration', salt, n, SCRYPT_R, SCRYPT_P)
+    elapsed = time.perf_counter() - start
+    while elapsed * 2 <= budget_ms / 1000:
+        n *= 2
+        elapsed *= 2
+
+    return {
+        'pbkdf2_iterations': max(iterations, MIN_PBKDF2_ITERATIONS),
+        'scrypt_n': n,
+    }
+
+
+# Cost parameters for this host: from the environment, the saved calibration, or a fresh one
+def get_params():
+    global _params
+    with _params_lock:
+        if _params is not None:
+            return _params
+
+        host = platform.node()
+        try:
+            with open(PARAMS_FILE, 'r') as f:
+                saved = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            saved = {}
+
+        params = saved.get(host)
+        if params is None or params.get('budget_ms') != HASH_BUDGET_MS:
+            params = calibrate()
+            params['budget_ms'] = HASH_BUDGET_MS
+            saved[host] = params
+            try:
+                with open(PARAMS_FILE, 'w') as f:
+                    json.dump(saved, f, indent=4)
+            except OSError as e:
+                print(f"Failed to save hashing parameters: {e}")
+
+        _params = dict(params)
+        if PBKDF2_ITERATIONS:
+            _params['pbkdf2_iterations'] = PBKDF2_ITERATIONS
+        if SCRYPT_N:
+            _params['scrypt_n'] = SCRYPT_N
+        return _params
+
+
+# Use these cost parameters instead of loading or calibrating them, e.g. in worker processes
+def use_params(params):
+    global _params
+    with _params_lock:
+        _params = dict(params)
+
+
+def is_legacy_hash(stored):
+    return '$' not in stored
+
+
+# Salted hash in a self-describing format, e.g. pbkdf2_sha256$<iterations>$<salt>$<hash>
+def hash_password(password):
+    params = get_params()
+    salt = os.urandom(SALT_BYTES)
+    if KDF == 'scrypt':
+        n = params['scrypt_n']
+        digest = _scrypt(password, salt, n, SCRYPT_R, SCRYPT_P)
+        return f'scrypt${n}${SCRYPT_R}${SCRYPT_P}${_b64(salt)}${_b64(digest)}'
+    iterations = params['pbkdf2_iterations']
+    digest = _pbkdf2(password, salt, iterations)
+    return f'pbkdf2_sha256${iterations}${_b64(salt)}${_b64(digest)}'
+
+
+def _check(password, stored):
+    if is_legacy_hash(stored):
+        # Unsalted SHA-256 from before salted hashing was introduced
+        expected = hashlib.sha256(password.encode()).hexdigest()
+        return hmac.compare_digest(expected, stored)
+
+    parts = stored.split('$')
+    if parts[0] == 'pbkdf2_sha256':
+        iterations, salt, digest = int(parts[1]), parts[2], parts[3]
+        actual = _pbkdf2(password, base64.b64decode(salt), iterations)
+    elif parts[0] == 'scrypt':
+        n, r, p, salt, digest = int(parts[1]), int(parts[2]), int(parts[3]), parts[4], parts[5]
+        actual = _scrypt(password, base64.b64decode(salt), n, r, p)
+    else:
+        return False
+    return hmac.compare_digest(actual, base64.b64decode(digest))
+
+
+# Remembers recent successful verifications. Entries are keyed by a keyed
+# hash of the password, so the cache never holds the password itself.
+class VerifyCache:
+    def __init__(self, ttl=VERIFY_CACHE_TTL, size=VERIFY_CACHE_SIZE):
+        self.ttl = ttl
+        self.size = size
+        self.key = os.urandom(32)
+        self.entries = {}
+        self.lock = threading.Lock()
+
+    def _key(self, password, stored):
+        return hmac.new(self.key, stored.encode() + b'\0' + password.encode(), hashlib.sha256).digest()
+
+    def hit(self, password, stored):
+        key = self._key(password, stored)
+        with self.lock:
+            expires = self.entries.get(key)
+            if expires is None:
+                return False
+            if expires < time.monotonic():
+                del self.entries[key]
+                return False
+            return True
+
+    def add(self, password, stored):
+        key = self._key(password, stored)
+        now = time.monotonic()
+        with self.lock:
+            if len(self.entries) >= self.size:
+                for old_key in [k for k, expires in self.entries.items() if expires < now]:
+                    del self.entries[old_key]
+                if len(self.entries) >= self.size:
+                    # Still full: drop the oldest entry
+                    del self.entries[next(iter(self.entries))]
+            self.entries[key] = now + self.ttl
+
+
+verify_cache = VerifyCache()
+
+
+def verify_password(password, stored):
+    if not stored:
+        return False
+    if verify_cache.hit(password, stored):
+        return True
+    if _check(password, stored):
+        verify_cache.add(password, stored)
+        return True
+    return False
+
+
+# Whether a hash should be replaced after a successful login: legacy SHA-256,
+# or weaker than the current cost parameters
+def needs_rehash(stored):
+    if is_legacy_hash(stored):
+        return True
+    parts = stored.split('$')
+    params = get_params()
+    if KDF == 'scrypt':
+        return parts[0] != 'scrypt' or int(parts[1]) < params['scrypt_n']
+    return parts[0] != 'pbkdf2_sha256' or int(parts[1]) < params['pbkdf2_iterations']
+
+
+# A fresh hash for `password` if `stored` is outdated, otherwise None
+def rehash_if_needed(password, stored):
+    if needs_rehash(stored):
+        return hash_password(password)
+    return None
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=HASH_WORKERS, thread_name_prefix='hash')
+        return _executor
+
+
+# hashlib releases the GIL while hashing, so worker threads keep the UI responsive.
+# These return concurrent.futures.Future objects. services.py sends all its
+# hashing through here, so HASH_WORKERS bounds how many hashes run at once.
+def hash_password_async(password):
+    return _get_executor().submit(hash_password, password)
+
+
+def verify_password_async(password, stored):
+    return _get_executor().submit(verify_password, password, stored)
+
+
+def rehash_if_needed_async(password, stored):
+    return _get_executor().submit(rehash_if_needed, password, stored)
+
+
+# Load or calibrate the cost parameters in the background so the first login doesn't wait
+def warm_up():
+    return _get_executor().submit(get_params)
+
+
+def shutdown():
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=False)
+            _executor = None
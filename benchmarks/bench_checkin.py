@@ -0,0 +1,128 @@
+# Load generator for event check-in.
+#
+# Seeds a throwaway store with that many students (as bench_data.py does),
+# books an event, then has several gate threads scan every student in once,
+# in random order, with a share of them scanned a second time, as happens at
+# a busy entrance. Prints JSON lines like bench_data.py: the sustained
+# check-ins per second, scan latency, how many second scans were turned away,
+# and how many check-ins went into each write to the store.
+#
+#   python benchmarks/bench_checkin.py [--students 5000] [--gates 8] [--rescans 0.05] [--backend json]
+
+import argparse
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import auth  # noqa: E402
+import checkin  # noqa: E402
+import services  # noqa: E402
+import sessions  # noqa: E402
+import storage  # noqa: E402
+from bench_data import BENCH_PARAMS, open_bench_store, seed, summarize  # noqa: E402
+
+
+# Every scan, split between the gates: each student once, plus a share scanned again shortly after
+def scans(students, gates, rescans):
+    numbers = [f'{i:08d}' for i in range(students)]
+    random.shuffle(numbers)
+    order = list(enumerate(numbers))
+    for position in random.sample(range(students), int(students * rescans)):
+        order.append((position + random.randrange(1, 50) + 0.5, numbers[position]))
+    order.sort()
+    return [[number for _, number in order[gate::gates]] for gate in range(gates)]
+
+
+def gate(store, token, event_id, numbers, samples, outcomes):
+    for number in numbers:
+        start = time.perf_counter()
+        _, error = services.check_in(store, token, event_id, number)
+        samples.append(time.perf_counter() - start)
+        outcomes[error or 'admitted'] = outcomes.get(error or 'admitted', 0) + 1
+
+
+def run(backend, students, gates, rescans, capacity):
+    directory = tempfile.mkdtemp(prefix='iems-bench-')
+    try:
+        seed(backend, directory, students)
+        store = open_bench_store(backend, directory)
+
+        # Count the writes the check-ins are grouped into
+        batches = []
+        add_checkins = store.add_checkins
+
+        def counting_add_checkins(records):
+            batches.append(len(records))
+            add_checkins(records)
+        store.add_checkins = counting_add_checkins
+
+        try:
+            event = {'title': 'Load test', 'venue': 'Main gate', 'department': 'Benchmarks',
+                     'start': time.time(), 'end': time.time() + 3 * 60 * 60, 'capacity': capacity}
+            store.add_event(event)
+            token, _ = sessions.get_cache().create('representative', {'username': 'gate',
+                                                                       'department_name': 'Benchmarks'})
+            checkin.attendance_for(store)
+
+            lanes = scans(students, gates, rescans)
+            samples = [[] for _ in lanes]
+            outcomes = [{} for _ in lanes]
+            threads = [threading.Thread(target=gate, args=(store, token, event['id'], lane, lane_samples, lane_outcomes))
+                       for lane, lane_samples, lane_outcomes in zip(lanes, samples, outcomes)]
+            start = time.perf_counter()
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            elapsed = time.perf_counter() - start
+        finally:
+            checkin.close_all()
+            store.close()
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+    totals = {}
+    for lane_outcomes in outcomes:
+        for outcome, count in lane_outcomes.items():
+            totals[outcome] = totals.get(outcome, 0) + count
+    scan_count = sum(totals.values())
+    return [
+        dict(backend=backend, students=students, gates=gates, operation='check_in',
+             **summarize([sample for lane_samples in samples for sample in lane_samples])),
+        {'backend': backend, 'students': students, 'gates': gates, 'operation': 'gate',
+         'scans': scan_count, 'seconds': elapsed, 'scans_per_sec': scan_count / elapsed,
+         'check_ins_per_sec': totals.get('admitted', 0) / elapsed, 'outcomes': totals,
+         'writes': len(batches), 'mean_batch': sum(batches) / len(batches) if batches else 0,
+         'max_batch': max(batches, default=0)},
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Simulate gates checking students in to one event.')
+    parser.add_argument('--students', type=int, default=5000, help='students in the store, each scanned in once')
+    parser.add_argument('--gates', type=int, default=8, help='gates scanning at the same time')
+    parser.add_argument('--rescans', type=float, default=0.05, help='share of students scanned a second time')
+    parser.add_argument('--capacity', type=int, help='event capacity (default: no limit)')
+    parser.add_argument('--backend', default='json', choices=sorted(storage.STORES))
+    parser.add_argument('--output', help='also write all results to this JSON file')
+    args = parser.parse_args()
+
+    auth.use_params(BENCH_PARAMS)
+    results = run(args.backend, args.students, args.gates, args.rescans, args.capacity)
+    for result in results:
+        print(json.dumps(result), flush=True)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=4)
+
+
+if __name__ == '__main__':
+    main()
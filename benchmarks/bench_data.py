@@ -0,0 +1,245 @@
+# Headless benchmarks for the data and auth paths.
+#
+# For each backend and store size, seeds a throwaway store with that many
+# students and announcements, then times the operations behind the screens:
+# opening the store, login lookups, full logins, registration, posting an
+# announcement, loading dashboard feed pages (everything, and one student's
+# targeted feed against filtering everything on read), searching
+# announcements, and booking and listing events.
+# Results are printed as one JSON object per measurement, and optionally
+# saved with --output, so runs can be compared to catch regressions.
+#
+#   python benchmarks/bench_data.py [--sizes 1000,100000,1000000] [--backends json,sqlite]
+
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import auth  # noqa: E402
+import events  # noqa: E402
+import feeds  # noqa: E402
+import search  # noqa: E402
+import services  # noqa: E402
+import sessions  # noqa: E402
+import storage  # noqa: E402
+
+PASSWORD = 'benchmark-password'
+
+# Hashing cost used while benchmarking; the real cost is a deliberate per-host
+# setting and would only measure the KDF
+BENCH_PARAMS = {'pbkdf2_iterations': 1000, 'scrypt_n': 2 ** 14}
+
+
+def student_record(i, password_hash):
+    return {
+        'name': f'Student {i}',
+        'student_number': f'{i:08d}',
+        'section': f'Section {i % 40}',
+        'password': password_hash,
+        'email': f'student{i}@example.com',
+    }
+
+
+def announcement_record(i):
+    return {'department': f'Department {i % 12}', 'announcement': f'Announcement number {i}'}
+
+
+# Seeded announcements: one in 8 for everyone, the rest for one of the 40 sections
+def audience_for(i):
+    return [feeds.EVERYONE] if i % 8 == 0 else [feeds.section_audience(f'Section {i % 40}')]
+
+
+# One page of a student's feed the way it would be without precomputed feeds:
+# newest first through every announcement, keeping those for the student
+def filter_on_read(store, audiences, limit=50):
+    found = []
+    before = None
+    while len(found) < limit:
+        page = store.get_announcements(before=before, limit=limit * 4)
+        if not page:
+            break
+        found += [announcement for announcement in page if feeds.is_for(announcement, audiences)]
+        before = page[-1]['id']
+    return found[:limit]
+
+
+# Events start here and are spread over VENUES rooms, one every EVENT_SPACING seconds in each
+EVENTS_START = 1.8e9
+VENUES = 50
+EVENT_SPACING = 2 * 60 * 60
+
+
+def event_record(i):
+    start = EVENTS_START + i // VENUES * EVENT_SPACING
+    return {'title': f'Event {i}', 'venue': f'Room {i % VENUES}', 'department': f'Department {i % 12}',
+            'start': start, 'end': start + EVENT_SPACING / 2}
+
+
+# Arguments to services.create_event for a half-hour booking in the gap after
+# one of the seeded events, different for each i, so none of them clash
+def booking(store, token, i):
+    start = EVENTS_START + i // VENUES * EVENT_SPACING + EVENT_SPACING / 2
+    return (store, token, f'Booking {i}', f'Room {i % VENUES}',
+            time.strftime('%Y-%m-%d', time.localtime(start)),
+            time.strftime('%H:%M', time.localtime(start)),
+            time.strftime('%H:%M', time.localtime(start + 30 * 60)))
+
+
+# Fill a store in the given directory with `size` students, announcements and events
+def seed(backend, directory, size):
+    password_hash = auth.hash_password(PASSWORD)
+    students = [student_record(i, password_hash) for i in range(size)]
+    announcements = [dict(announcement_record(i), audience=audience_for(i)) for i in range(size)]
+    scheduled = [event_record(i) for i in range(size)]
+
+    if backend == 'json':
+        data = storage.empty_data()
+        data['students'] = students
+        data['announcements'] = announcements
+        data['events'] = scheduled
+        storage.save_data(data, os.path.join(directory, storage.DATA_FILE))
+        return
+
+    store = storage.SqliteStore(os.path.join(directory, 'bench.db'))
+    try:
+        store.add_students(students)
+        with store.lock, store.conn:
+            store.conn.executemany('INSERT INTO announcements (id, department, announcement, audience) VALUES (?, ?, ?, ?)',
+                                   [(i, a['department'], a['announcement'], json.dumps(a['audience']))
+                                    for i, a in enumerate(announcements, 1)])
+            store.conn.executemany('INSERT INTO feed_entries (audience, announcement_id) VALUES (?, ?)',
+                                   [(key, i) for i, a in enumerate(announcements, 1) for key in a['audience']])
+            store.conn.executemany('INSERT INTO events (title, venue, department, start, "end") VALUES (?, ?, ?, ?, ?)',
+                                   [(e['title'], e['venue'], e['department'], e['start'], e['end']) for e in scheduled])
+    finally:
+        store.close()
+
+
+def open_bench_store(backend, directory):
+    if backend == 'json':
+        return storage.JsonStore(os.path.join(directory, storage.DATA_FILE),
+                                 os.path.join(directory, storage.JOURNAL_FILE), snapshot_format='json')
+    return storage.SqliteStore(os.path.join(directory, 'bench.db'))
+
+
+def summarize(samples):
+    samples = sorted(samples)
+    count = len(samples)
+    total = sum(samples)
+    return {
+        'samples': count,
+        'ops_per_sec': count / total if total else None,
+        'mean_us': total / count * 1e6,
+        'p50_us': samples[count // 2] * 1e6,
+        'p95_us': samples[min(int(count * 0.95), count - 1)] * 1e6,
+        'max_us': samples[-1] * 1e6,
+    }
+
+
+def timed(operation, arguments):
+    samples = []
+    for args in arguments:
+        start = time.perf_counter()
+        operation(*args)
+        samples.append(time.perf_counter() - start)
+    return summarize(samples)
+
+
+def run(backend, size, samples):
+    directory = tempfile.mkdtemp(prefix='iems-bench-')
+    results = {}
+    try:
+        start = time.perf_counter()
+        seed(backend, directory, size)
+        seed_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        store = open_bench_store(backend, directory)
+        results['open_store'] = summarize([time.perf_counter() - start])
+        results['open_store']['seed_seconds'] = seed_seconds
+
+        try:
+            numbers = [f'{random.randrange(size):08d}' for _ in range(samples)]
+            results['lookup'] = timed(store.get_student, [(number,) for number in numbers])
+            results['login'] = timed(services.login, [(store, 'student', number, PASSWORD) for number in numbers])
+            results['register_student'] = timed(services.register_student, [
+                (store, f'New {i}', f'N{i:08d}', 'Section 1', f'new{i}@example.com', PASSWORD)
+                for i in range(samples)])
+
+            rep_token, _ = sessions.get_cache().create('representative', {'username': 'bench',
+                                                                          'department_name': 'Department 1'})
+            results['post_announcement'] = timed(services.post_announcement,
+                                                 [(store, rep_token, f'Benchmark post {i}') for i in range(samples)])
+
+            # A representative's feed has every announcement
+            results['feed_first_page'] = timed(services.load_feed, [(store, rep_token)] * samples)
+            oldest = [random.randrange(services.FEED_PAGE_SIZE + 1, size + 1) for _ in range(samples)]
+            results['feed_older_page'] = timed(services.load_feed, [(store, rep_token, before) for before in oldest])
+            students = [feeds.student_audiences({'section': f'Section {random.randrange(40)}'})
+                        for _ in range(samples)]
+            results['student_feed_page'] = timed(store.get_feed, [(audiences, None, services.FEED_PAGE_SIZE)
+                                                                  for audiences in students])
+            results['student_feed_filter_on_read'] = timed(filter_on_read, [(store, audiences)
+                                                                            for audiences in students])
+
+            start = time.perf_counter()
+            search.index_for(store).ready.wait()
+            results['search_index_build'] = summarize([time.perf_counter() - start])
+            queries = [f'department {random.randrange(12)} number {random.randrange(size)}' for _ in range(samples)]
+            results['search'] = timed(services.search_announcements, [(store, rep_token, query) for query in queries])
+
+            results['create_event'] = timed(services.create_event, [booking(store, rep_token, i) for i in range(samples)])
+            last = EVENTS_START + size // VENUES * EVENT_SPACING
+            weeks = [events.week_of(random.uniform(EVENTS_START, last)) for _ in range(samples)]
+            results['events_this_week'] = timed(services.events_between, [(store, *week) for week in weeks])
+            results['upcoming_events'] = timed(services.upcoming_events, [(store, start) for start, _ in weeks])
+        finally:
+            store.close()
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the data and auth paths without a display.')
+    parser.add_argument('--sizes', default='1000,100000,1000000',
+                        help='comma-separated record counts (default: 1000,100000,1000000)')
+    parser.add_argument('--backends', default=','.join(storage.STORES),
+                        help='comma-separated storage backends (default: all)')
+    parser.add_argument('--samples', type=int, default=200, help='operations timed per measurement')
+    parser.add_argument('--output', help='also write all results to this JSON file')
+    args = parser.parse_args()
+
+    auth.use_params(BENCH_PARAMS)
+    services.ANNOUNCEMENT_EMAIL = False
+    # Every login would otherwise be answered from the verification cache
+    auth.verify_cache.ttl = 0
+
+    report = {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'kdf': auth.KDF,
+        'results': [],
+    }
+    for backend in args.backends.split(','):
+        for size in (int(size) for size in args.sizes.split(',')):
+            for operation, stats in run(backend, size, args.samples).items():
+                result = dict(backend=backend, size=size, operation=operation, **stats)
+                report['results'].append(result)
+                print(json.dumps(result), flush=True)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=4)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+# Memory benchmark for the JSON store's in-memory layout.
+#
+# For each size, builds the JSON text of a store with that many students and
+# announcements (plus a representative per department), then measures the
+# memory the loaded records take with tracemalloc in two layouts: the plain
+# dicts json.load gives, as the store used to keep them, and the columns of
+# records.py the store keeps now. Prints one JSON object per measurement,
+# like bench_data.py.
+#
+#   python benchmarks/bench_memory.py [--sizes 1000,100000]
+
+import argparse
+import gc
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import records  # noqa: E402
+from bench_data import announcement_record, student_record  # noqa: E402
+
+# Looks like a real stored hash, so its size is realistic
+PASSWORD_HASH = 'scrypt$16384$8$1$' + 'ab' * 16 + '$' + 'cd' * 32
+
+
+def store_text(size):
+    data = {
+        'students': [student_record(i, PASSWORD_HASH) for i in range(size)],
+        'representatives': [{'username': f'rep{i}', 'department_name': f'Department {i}', 'password': PASSWORD_HASH}
+                            for i in range(12)],
+        'announcements': [dict(announcement_record(i), id=i + 1, posted=1.7e9 + i) for i in range(size)],
+    }
+    return json.dumps(data)
+
+
+def as_dicts(text):
+    return json.loads(text)
+
+
+def as_columns(text):
+    data = json.loads(text)
+    for collection, record_type in records.RECORD_TYPES.items():
+        data[collection] = records.Table(record_type, data.get(collection, ()))
+    return data
+
+
+# Bytes still allocated once `load` has returned and everything temporary is gone
+def measure(load, text):
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    data = load(text)
+    seconds = time.perf_counter() - start
+    gc.collect()
+    allocated = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    count = sum(len(collection) for collection in data.values())
+    del data
+    return {'bytes': allocated, 'bytes_per_record': allocated / count, 'records': count, 'load_seconds': seconds}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare the memory held by dict and columnar records.')
+    parser.add_argument('--sizes', default='1000,100000', help='comma-separated record counts (default: 1000,100000)')
+    parser.add_argument('--output', help='also write all results to this JSON file')
+    args = parser.parse_args()
+
+    results = []
+    for size in (int(size) for size in args.sizes.split(',')):
+        text = store_text(size)
+        for layout, load in (('dicts', as_dicts), ('columns', as_columns)):
+            result = dict(size=size, layout=layout, **measure(load, text))
+            results.append(result)
+            print(json.dumps(result), flush=True)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=4)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,142 @@
+# Load test for server mode over loopback.
+#
+# Seeds a throwaway store, starts server.py on it in a separate process, then
+# connects many simulated kiosks at once. Each one keeps a persistent
+# connection and works through a mix of feed loads, logins and posts. Prints
+# one JSON object per operation with throughput and latency, like
+# bench_data.py, plus one for the run as a whole.
+#
+#   python benchmarks/bench_server.py [--clients 200] [--requests 50] [--size 10000] [--backend json]
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import auth  # noqa: E402
+import storage  # noqa: E402
+from bench_data import BENCH_PARAMS, PASSWORD, seed, summarize  # noqa: E402
+from client import Connection  # noqa: E402
+from server import MAX_LINE  # noqa: E402
+
+# Relative weights of the operations each simulated kiosk sends
+MIX = {'load_feed': 70, 'login': 20, 'post_announcement': 10}
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def start_server(backend, directory, port):
+    env = dict(os.environ,
+               IEMS_STORAGE=backend,
+               IEMS_DB_FILE='bench.db',
+               IEMS_PBKDF2_ITERATIONS=str(BENCH_PARAMS['pbkdf2_iterations']),
+               IEMS_SCRYPT_N=str(BENCH_PARAMS['scrypt_n']),
+               IEMS_VERIFY_CACHE_TTL='0',
+               IEMS_ANNOUNCEMENT_EMAIL='0')
+    return subprocess.Popen([sys.executable, os.path.join(ROOT, 'server.py'), '--port', str(port)],
+                            cwd=directory, env=env, stdout=subprocess.DEVNULL)
+
+
+async def wait_for_server(port, timeout=60):
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        except OSError:
+            if time.monotonic() > deadline:
+                raise
+            await asyncio.sleep(0.1)
+            continue
+        writer.close()
+        return
+
+
+def request_for(operation, size, client_number, rep_token, student_token):
+    if operation == 'load_feed':
+        return [student_token, None if random.random() < 0.5 else random.randrange(size) + 1, 50]
+    if operation == 'login':
+        return ['student', f'{random.randrange(size):08d}', PASSWORD]
+    return [rep_token, f'Load test post from kiosk {client_number}']
+
+
+async def kiosk(client_number, port, requests, size, samples):
+    reader, writer = await asyncio.open_connection('127.0.0.1', port, limit=MAX_LINE)
+    connection = Connection(reader, writer)
+    operations, weights = zip(*MIX.items())
+    try:
+        # Each kiosk posts as its own representative and reads the feed as one of the seeded students
+        username = f'kiosk{client_number}'
+        await connection.request('register_rep', [f'Department {client_number % 12}', username, PASSWORD])
+        rep_session, _ = await connection.request('login', ['representative', username, PASSWORD])
+        student_session, _ = await connection.request('login', ['student', f'{client_number % size:08d}', PASSWORD])
+        for operation in random.choices(operations, weights, k=requests):
+            start = time.perf_counter()
+            await connection.request(operation, request_for(operation, size, client_number,
+                                                            rep_session['token'], student_session['token']))
+            samples[operation].append(time.perf_counter() - start)
+    finally:
+        connection.close()
+
+
+async def load(port, clients, requests, size):
+    await wait_for_server(port)
+    samples = {operation: [] for operation in MIX}
+    start = time.perf_counter()
+    await asyncio.gather(*(kiosk(i, port, requests, size, samples) for i in range(clients)))
+    return samples, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load-test server mode with many concurrent clients over loopback.')
+    parser.add_argument('--clients', type=int, default=200, help='simulated kiosks connected at once')
+    parser.add_argument('--requests', type=int, default=50, help='requests each kiosk sends')
+    parser.add_argument('--size', type=int, default=10000, help='students and announcements in the store')
+    parser.add_argument('--backend', default='json', choices=sorted(storage.STORES))
+    parser.add_argument('--output', help='also write all results to this JSON file')
+    args = parser.parse_args()
+
+    auth.use_params(BENCH_PARAMS)
+    directory = tempfile.mkdtemp(prefix='iems-bench-')
+    port = free_port()
+    server = None
+    try:
+        seed(args.backend, directory, args.size)
+        server = start_server(args.backend, directory, port)
+        samples, elapsed = asyncio.run(load(port, args.clients, args.requests, args.size))
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+        shutil.rmtree(directory, ignore_errors=True)
+
+    results = []
+    for operation, times in samples.items():
+        if times:
+            results.append(dict(backend=args.backend, clients=args.clients, operation=operation, **summarize(times)))
+    total = sum(len(times) for times in samples.values())
+    results.append({'backend': args.backend, 'clients': args.clients, 'operation': 'all',
+                    'samples': total, 'ops_per_sec': total / elapsed, 'seconds': elapsed})
+    for result in results:
+        print(json.dumps(result), flush=True)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=4)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,111 @@
+# Benchmark for the JSON store's snapshot formats.
+#
+# For each size, seeds the same students and announcements as bench_data.py
+# into a pretty-printed JSON snapshot and a binary one (see binsnap.py), then
+# measures each: the file size, how long saving it takes, opening the store
+# on it, reading every record, and a login's lookup of one student straight
+# after opening. Prints one JSON object per measurement, like bench_data.py.
+#
+#   python benchmarks/bench_snapshot.py [--sizes 1000,100000] [--lookups 1000]
+
+import argparse
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import binsnap  # noqa: E402
+import storage  # noqa: E402
+from bench_data import announcement_record, student_record, summarize  # noqa: E402
+from bench_memory import PASSWORD_HASH  # noqa: E402
+
+FORMATS = {
+    'json': (storage.DATA_FILE, storage.save_data),
+    'binary': (storage.BINARY_DATA_FILE, storage.save_binary),
+}
+
+
+def timed(function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - start
+
+
+def open_store(directory, snapshot_format):
+    filename, _ = FORMATS[snapshot_format]
+    return storage.JsonStore(os.path.join(directory, filename), os.path.join(directory, storage.JOURNAL_FILE),
+                             snapshot_format=snapshot_format)
+
+
+def read_all(path, snapshot_format):
+    if snapshot_format == 'binary':
+        return binsnap.load(path)
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
+def run(size, snapshot_format, lookups):
+    data = storage.empty_data()
+    data['students'] = [student_record(i, PASSWORD_HASH) for i in range(size)]
+    data['announcements'] = [dict(announcement_record(i), posted=time.time()) for i in range(size)]
+    filename, save = FORMATS[snapshot_format]
+
+    directory = tempfile.mkdtemp(prefix='iems-bench-')
+    try:
+        path = os.path.join(directory, filename)
+        _, save_seconds = timed(save, data, path)
+        size_bytes = os.path.getsize(path)
+        _, read_seconds = timed(read_all, path, snapshot_format)
+
+        # Each lookup on a freshly opened store, as the first login after a start would be
+        open_samples = []
+        lookup_samples = []
+        for _ in range(max(1, lookups // 100)):
+            store, seconds = timed(open_store, directory, snapshot_format)
+            open_samples.append(seconds)
+            try:
+                for _ in range(100):
+                    number = f'{random.randrange(size):08d}'
+                    student, seconds = timed(store.get_student, number)
+                    assert student is not None
+                    lookup_samples.append(seconds)
+            finally:
+                store.close()
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+    common = {'size': size, 'format': snapshot_format}
+    return [
+        dict(common, operation='save', bytes=size_bytes, seconds=save_seconds),
+        dict(common, operation='read_all', seconds=read_seconds),
+        dict(common, operation='open', **summarize(open_samples)),
+        dict(common, operation='get_student', **summarize(lookup_samples)),
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare the JSON and binary snapshot formats.')
+    parser.add_argument('--sizes', default='1000,100000', help='comma-separated record counts (default: 1000,100000)')
+    parser.add_argument('--lookups', type=int, default=1000, help='student lookups per format and size')
+    parser.add_argument('--output', help='also write all results to this JSON file')
+    args = parser.parse_args()
+
+    results = []
+    for size in (int(size) for size in args.sizes.split(',')):
+        for snapshot_format in FORMATS:
+            for result in run(size, snapshot_format, args.lookups):
+                results.append(result)
+                print(json.dumps(result), flush=True)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=4)
+
+
+if __name__ == '__main__':
+    main()
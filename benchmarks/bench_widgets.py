@@ -0,0 +1,95 @@
+# Frame-time benchmark for RoundedButton.
+#
+# Simulates the pos/size updates a button goes through during layout and the
+# press/release animations, and compares the current RoundedButton (canvas
+# instructions created once, then moved) with the old one that cleared and
+# rebuilt its canvas on every update. Prints one JSON object per variant.
+#
+#   python benchmarks/bench_widgets.py [--frames N] [--output results.json]
+
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('KIVY_NO_ARGS', '1')
+
+import main as iems  # noqa: E402
+from kivy.graphics import Color, RoundedRectangle  # noqa: E402
+from kivy.uix.button import Button  # noqa: E402
+
+created = {'count': 0}
+
+
+# Count every canvas instruction built while the benchmark runs
+def counting(instruction_cls):
+    def build(*args, **kwargs):
+        created['count'] += 1
+        return instruction_cls(*args, **kwargs)
+    return build
+
+
+# The button as it was before, rebuilding its background on every event
+class LegacyRoundedButton(Button):
+    def __init__(self, **kwargs):
+        super(LegacyRoundedButton, self).__init__(**kwargs)
+        self.bind(size=self._update_rounded_rect, pos=self._update_rounded_rect)
+
+    def _update_rounded_rect(self, *args):
+        self.canvas.before.clear()
+        with self.canvas.before:
+            LegacyColor(0.2, 0.6, 0.8, 1)
+            LegacyRoundedRectangle(pos=self.pos, size=self.size, radius=[20])
+
+
+LegacyColor = counting(Color)
+LegacyRoundedRectangle = counting(RoundedRectangle)
+iems.Color = counting(Color)
+iems.RoundedRectangle = counting(RoundedRectangle)
+
+
+def run(name, button_cls, frames):
+    button = button_cls(text="Benchmark", size=(200, 50))
+    created['count'] = 0
+    frame_times = []
+
+    for frame in range(frames):
+        # One step of a press/release animation followed by a layout pass
+        scale = 1 + 0.05 * ((frame % 10) / 10)
+        start = time.perf_counter()
+        button.size = (200 * scale, 50 * scale)
+        button.pos = (frame % 7, frame % 5)
+        frame_times.append(time.perf_counter() - start)
+
+    frame_times.sort()
+    return {
+        'benchmark': 'rounded_button_frames',
+        'variant': name,
+        'frames': frames,
+        'instructions_per_frame': created['count'] / frames,
+        'mean_frame_us': sum(frame_times) / frames * 1e6,
+        'p99_frame_us': frame_times[int(frames * 0.99) - 1] * 1e6,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='RoundedButton frame-time benchmark')
+    parser.add_argument('--frames', type=int, default=10000)
+    parser.add_argument('--output', help='also write all results to this JSON file')
+    args = parser.parse_args()
+
+    results = []
+    for name, button_cls in (('legacy', LegacyRoundedButton), ('retained', iems.RoundedButton)):
+        result = run(name, button_cls, args.frames)
+        results.append(result)
+        print(json.dumps(result), flush=True)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=4)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,217 @@
+import argparse
+import json
+import mmap
+import os
+import struct
+
+# A binary alternative to the pretty-printed JSON snapshot (set
+# IEMS_SNAPSHOT_FORMAT=binary, see storage.py). Each collection's records are
+# stored one after another as compact JSON, each preceded by its length,
+# with a table of where each record starts. Collections with a key field
+# also get their keys in sorted order, so one record can be found by binary
+# search. The file is memory-mapped and nothing is parsed until it is asked
+# for: logging in reads one student, not all of them.
+#
+# Layout: the collections' records and tables, then a JSON header describing
+# them, then the header's offset and MAGIC. Numbers are little-endian.
+#
+# The store converts its snapshot by itself when IEMS_SNAPSHOT_FORMAT changes;
+# to convert one by hand:
+#   python binsnap.py to-binary student_data.json student_data.snap
+#   python binsnap.py to-json student_data.snap student_data.json
+
+MAGIC = b'IEMSSNP1'
+VERSION = 1
+
+_LENGTH = struct.Struct('<I')
+_OFFSET = struct.Struct('<Q')
+_ROW = struct.Struct('<I')
+_TRAILER = struct.Struct('<Q8s')
+
+_DECODER = json.JSONDecoder()
+
+
+class FormatError(ValueError):
+    pass
+
+
+def _encode(record):
+    return json.dumps(record, separators=(',', ':')).encode()
+
+
+# Rows of a collection as dicts; tables (see records.py) hand out rows still
+# sitting in their snapshot without keeping them, and lists can hold record views
+def _rows(collection):
+    row_dict = getattr(collection, 'row_dict', None)
+    if row_dict is not None:
+        return (row_dict(row) for row in range(len(collection)))
+    return (record if isinstance(record, dict) else dict(record) for record in collection)
+
+
+def _write(f, data, key_fields):
+    header = {'version': VERSION, 'meta': {}, 'collections': {}}
+    position = 0
+
+    def write(content):
+        nonlocal position
+        f.write(content)
+        position += len(content)
+
+    for name, collection in data.items():
+        if not isinstance(collection, list) and not hasattr(collection, 'row_dict'):
+            header['meta'][name] = collection
+            continue
+
+        key_field = key_fields.get(name)
+        offsets = []
+        keys = []
+        for row, record in enumerate(_rows(collection)):
+            encoded = _encode(record)
+            offsets.append(position)
+            write(_LENGTH.pack(len(encoded)) + encoded)
+            if key_field is not None and record.get(key_field) is not None:
+                keys.append((str(record[key_field]).encode(), row))
+
+        section = {'count': len(offsets), 'offsets': position}
+        write(b''.join(_OFFSET.pack(offset) for offset in offsets))
+
+        if key_field is not None:
+            keys.sort()
+            key_offsets = []
+            for key, _ in keys:
+                key_offsets.append(position)
+                write(_LENGTH.pack(len(key)) + key)
+            section.update(key_field=key_field, keys=len(keys), key_offsets=position)
+            write(b''.join(_OFFSET.pack(offset) for offset in key_offsets))
+            section['key_rows'] = position
+            write(b''.join(_ROW.pack(row) for _, row in keys))
+        header['collections'][name] = section
+
+    header_offset = position
+    write(json.dumps(header).encode())
+    write(_TRAILER.pack(header_offset, MAGIC))
+
+
+# Write `data` (a snapshot: lists or tables of records, plus plain values) to
+# `path`, through a temporary file so a crash never leaves half a snapshot
+def save(data, path, key_fields=None):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        _write(f, data, key_fields or {})
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+# One collection in a snapshot
+class Section:
+    def __init__(self, buffer, description):
+        self.buffer = buffer
+        self.count = description['count']
+        self.offsets = description['offsets']
+        self.key_field = description.get('key_field')
+        self.keys = description.get('keys', 0)
+        self.key_offsets = description.get('key_offsets')
+        self.key_rows = description.get('key_rows')
+
+    def __len__(self):
+        return self.count
+
+    def raw(self, row):
+        offset = _OFFSET.unpack_from(self.buffer, self.offsets + row * _OFFSET.size)[0]
+        length = _LENGTH.unpack_from(self.buffer, offset)[0]
+        return self.buffer[offset + _LENGTH.size:offset + _LENGTH.size + length]
+
+    def record(self, row):
+        return _DECODER.decode(str(self.raw(row), 'utf-8'))
+
+    # Every record, parsed as one JSON array: much quicker than one at a time
+    def __iter__(self):
+        buffer = self.buffer
+        parts = []
+        for offset in struct.unpack_from(f'<{self.count}Q', buffer, self.offsets):
+            length = _LENGTH.unpack_from(buffer, offset)[0]
+            parts.append(buffer[offset + _LENGTH.size:offset + _LENGTH.size + length])
+        return iter(_DECODER.decode('[' + str(b','.join(parts), 'utf-8') + ']'))
+
+    def _key(self, position):
+        offset = _OFFSET.unpack_from(self.buffer, self.key_offsets + position * _OFFSET.size)[0]
+        length = _LENGTH.unpack_from(self.buffer, offset)[0]
+        return self.buffer[offset + _LENGTH.size:offset + _LENGTH.size + length]
+
+    # The row of the record whose key field equals `key`, or None
+    def find(self, key):
+        if self.key_field is None:
+            raise TypeError('collection has no key field')
+        key = str(key).encode()
+        low, high = 0, self.keys
+        while low < high:
+            middle = (low + high) // 2
+            if self._key(middle) < key:
+                low = middle + 1
+            else:
+                high = middle
+        if low < self.keys and self._key(low) == key:
+            return _ROW.unpack_from(self.buffer, self.key_rows + low * _ROW.size)[0]
+        return None
+
+
+# A snapshot file opened for reading. Windows won't replace a file that is
+# mapped, which compaction has to do, so there it is read into memory instead.
+class Snapshot:
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            # An empty file can't be mapped, so check the size before trying
+            if os.fstat(f.fileno()).st_size < _TRAILER.size:
+                raise FormatError(f'{path} is too short to be a snapshot')
+            if os.name == 'nt':
+                self.buffer = f.read()
+            else:
+                self.buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            header_offset, magic = _TRAILER.unpack_from(self.buffer, len(self.buffer) - _TRAILER.size)
+            if magic != MAGIC:
+                raise FormatError(f'{path} is not a binary snapshot')
+            try:
+                header = json.loads(self.buffer[header_offset:len(self.buffer) - _TRAILER.size])
+            except ValueError:
+                raise FormatError(f'{path} has a damaged header')
+            if header['version'] != VERSION:
+                raise FormatError(f'{path} is snapshot version {header["version"]}, expected {VERSION}')
+        except BaseException:
+            if isinstance(self.buffer, mmap.mmap):
+                self.buffer.close()
+            raise
+        # The mapping is closed once nothing reads from it any more
+        self.meta = header['meta']
+        self.sections = {name: Section(self.buffer, description)
+                         for name, description in header['collections'].items()}
+
+
+# Everything in a snapshot, parsed, in the same shape as the JSON snapshot
+def load(path):
+    snapshot = Snapshot(path)
+    data = dict(snapshot.meta)
+    for name, section in snapshot.sections.items():
+        data[name] = list(section)
+    return data
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Convert a snapshot between JSON and the binary format.')
+    parser.add_argument('direction', choices=['to-binary', 'to-json'])
+    parser.add_argument('source')
+    parser.add_argument('destination')
+    args = parser.parse_args()
+
+    from storage import KEY_FIELDS, save_data
+    if args.direction == 'to-binary':
+        with open(args.source, 'r') as f:
+            data = json.load(f)
+        save(data, args.destination, KEY_FIELDS)
+    else:
+        save_data(load(args.source), args.destination)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,205 @@
+import threading
+import time
+import weakref
+
+# RSVPs and check-ins at events. Each event's counters live in memory: how
+# many places are taken against its capacity, and bitmaps of who has RSVPed
+# and who has checked in, indexed by the store's number for each student
+# (store.student_index), so telling a second scan from a first is O(1).
+#
+# Every RSVP and check-in is also written to the store, but not one at a
+# time: callers queue their record and wait while a writer thread saves
+# everything queued so far in one batch (one journal write and fsync, or one
+# SQLite transaction), so a gate scanning hundreds of students a minute costs
+# a handful of writes rather than hundreds.
+#
+# The counters belong to this process, so gates at the same event should
+# all go through one app instance or a shared server (see server.py).
+
+RSVP = 'rsvp'
+CHECK_IN = 'check_in'
+
+# Most records written in one batch
+MAX_BATCH = 1000
+
+# Seconds to wait before trying a failed write again
+RETRY_DELAY = 1.0
+
+_attendance = weakref.WeakKeyDictionary()
+_attendance_lock = threading.Lock()
+
+
+def _is_set(bits, index):
+    byte = index >> 3
+    return byte < len(bits) and bits[byte] >> (index & 7) & 1
+
+
+def _set(bits, index):
+    byte = index >> 3
+    if byte >= len(bits):
+        # Grow ahead of need so a run of new indexes doesn't grow it every time
+        bits.extend(bytes(max(byte + 1 - len(bits), len(bits) // 2)))
+    bits[byte] |= 1 << (index & 7)
+
+
+class EventCounts:
+    __slots__ = ('capacity', 'held', 'rsvps', 'checked_in', 'rsvped', 'arrived')
+
+    def __init__(self, capacity):
+        self.capacity = capacity  # None means no limit
+        self.held = 0        # places taken: RSVPs plus check-ins without one
+        self.rsvps = 0
+        self.checked_in = 0
+        self.rsvped = bytearray()
+        self.arrived = bytearray()
+
+    def full(self):
+        return self.capacity is not None and self.held >= self.capacity
+
+    def rsvp(self, index):
+        _set(self.rsvped, index)
+        self.rsvps += 1
+        self.held += 1
+
+    def check_in(self, index):
+        if not _is_set(self.rsvped, index):
+            self.held += 1
+        _set(self.arrived, index)
+        self.checked_in += 1
+
+    def summary(self):
+        return {'capacity': self.capacity, 'taken': self.held, 'rsvps': self.rsvps, 'checked_in': self.checked_in}
+
+
+class Attendance:
+    def __init__(self, store):
+        self.store = store
+        self.events = {}  # event id -> EventCounts
+        self.lock = threading.Lock()
+        self.saved = threading.Condition(self.lock)
+        self.pending = []
+        self.queued = 0   # records queued so far
+        self.written = 0  # of those, how many are saved
+        self.closing = False
+
+        for record in store.iter_checkins():
+            index = store.student_index(record['student_number'])
+            counts = self._counts(record['event_id'])
+            if index is None or counts is None:
+                continue
+            if record['kind'] == RSVP:
+                counts.rsvp(index)
+            else:
+                counts.check_in(index)
+
+        self.writer = threading.Thread(target=self._write_batches, name='checkin-writer', daemon=True)
+        self.writer.start()
+
+    # Called with the lock held
+    def _counts(self, event_id):
+        counts = self.events.get(event_id)
+        if counts is None:
+            event = self.store.get_event(event_id)
+            if event is None:
+                return None
+            counts = self.events[event_id] = EventCounts(event.get('capacity'))
+        return counts
+
+    # Reserve a place at an event. Returns (counts, None), or (None, error message).
+    def rsvp(self, event_id, student_number):
+        index = self.store.student_index(student_number)
+        if index is None:
+            return None, 'Unknown student number.'
+        with self.lock:
+            counts = self._counts(event_id)
+            if counts is None:
+                return None, 'No such event.'
+            if _is_set(counts.rsvped, index):
+                return None, 'Already RSVPed.'
+            if _is_set(counts.arrived, index):
+                return None, 'Already checked in.'
+            if counts.full():
+                return None, 'The event is full.'
+            counts.rsvp(index)
+            self._save(event_id, student_number, RSVP)
+            return counts.summary(), None
+
+    # Let a student in at the gate. Students who RSVPed always have a place;
+    # others get one if any are left. Returns (counts, None), or (None, error message).
+    def check_in(self, event_id, student_number):
+        index = self.store.student_index(student_number)
+        if index is None:
+            return None, 'Unknown student number.'
+        with self.lock:
+            counts = self._counts(event_id)
+            if counts is None:
+                return None, 'No such event.'
+            if _is_set(counts.arrived, index):
+                return None, 'Already checked in.'
+            if not _is_set(counts.rsvped, index) and counts.full():
+                return None, 'The event is full.'
+            counts.check_in(index)
+            self._save(event_id, student_number, CHECK_IN)
+            return counts.summary(), None
+
+    def summary(self, event_id):
+        with self.lock:
+            counts = self._counts(event_id)
+            return None if counts is None else counts.summary()
+
+    # Called with the lock held: queue the record, then wait until it is saved
+    def _save(self, event_id, student_number, kind):
+        self.pending.append({'event_id': event_id, 'student_number': student_number, 'kind': kind,
+                             'time': time.time()})
+        self.queued += 1
+        ticket = self.queued
+        self.saved.notify_all()
+        while self.written < ticket:
+            self.saved.wait()
+
+    def _write_batches(self):
+        while True:
+            with self.lock:
+                while not self.pending and not self.closing:
+                    self.saved.wait()
+                if not self.pending:
+                    return
+                batch = self.pending[:MAX_BATCH]
+                del self.pending[:MAX_BATCH]
+
+            # Whatever is queued while this is written goes in the next batch
+            while True:
+                try:
+                    self.store.add_checkins(batch)
+                    break
+                except Exception as e:
+                    print(f"Failed to save check-ins, retrying: {e}")
+                    time.sleep(RETRY_DELAY)
+
+            with self.lock:
+                self.written += len(batch)
+                self.saved.notify_all()
+
+    # Save whatever is still queued and stop the writer
+    def close(self):
+        with self.lock:
+            self.closing = True
+            self.saved.notify_all()
+        self.writer.join()
+
+
+# The attendance counters for a store, loaded from its saved check-ins on first use
+def attendance_for(store):
+    with _attendance_lock:
+        attendance = _attendance.get(store)
+        if attendance is None:
+            attendance = _attendance[store] = Attendance(store)
+        return attendance
+
+
+def close_all():
+    with _attendance_lock:
+        attendances = list(_attendance.values())
+        _attendance.clear()
+    for attendance in attendances:
+        attendance.close()
@@ -0,0 +1,177 @@
+import asyncio
+import itertools
+import json
+import os
+import threading
+
+from server import MAX_LINE, encode, parse_address
+
+# Persistent connections each app instance keeps open to the server
+POOL_SIZE = int(os.getenv('IEMS_SERVER_CONNECTIONS', '4'))
+
+# Seconds to wait for an answer before giving up on a request
+REQUEST_TIMEOUT = float(os.getenv('IEMS_SERVER_TIMEOUT', '30'))
+
+
+class ServerError(Exception):
+    pass
+
+
+# One connection to the server. Requests are tagged with ids so several can
+# be in flight at once; events are handed to `on_event` as they arrive.
+class Connection:
+    def __init__(self, reader, writer, on_event=None):
+        self.reader = reader
+        self.writer = writer
+        self.on_event = on_event
+        self.ids = itertools.count(1)
+        self.pending = {}
+        self.closed = False
+        self.reading = asyncio.ensure_future(self._read())
+
+    async def request(self, operation, args=()):
+        if self.closed:
+            raise ServerError('Lost the connection to the server')
+        request_id = next(self.ids)
+        future = self.pending[request_id] = asyncio.get_running_loop().create_future()
+        self.writer.write(encode({'id': request_id, 'op': operation, 'args': list(args)}))
+        try:
+            await self.writer.drain()
+            return await future
+        finally:
+            self.pending.pop(request_id, None)
+
+    async def _read(self):
+        try:
+            while True:
+                line = await self.reader.readline()
+                if not line:
+                    break
+                message = json.loads(line)
+                if 'event' in message:
+                    if self.on_event is not None:
+                        self.on_event(message)
+                    continue
+
+                future = self.pending.get(message.get('id'))
+                if future is None or future.done():
+                    continue
+                if 'error' in message:
+                    future.set_exception(ServerError(message['error']))
+                else:
+                    future.set_result(message['result'])
+        except (ConnectionError, ValueError):
+            pass
+        finally:
+            self.closed = True
+            for future in self.pending.values():
+                if not future.done():
+                    future.set_exception(ServerError('Lost the connection to the server'))
+            self.writer.close()
+
+    def close(self):
+        self.closed = True
+        self.writer.close()
+
+
+# Runs services.OPERATIONS on a server (see server.py) instead of in this
+# process, with the same methods as services.LocalService. Requests are
+# spread over a pool of persistent connections, driven by an event loop on
+# a background thread, so callers on the UI thread only ever get a Future.
+class ServiceClient:
+    def __init__(self, address, pool_size=POOL_SIZE):
+        self.host, self.port = parse_address(address)
+        self.pool = [None] * pool_size
+        self.pool_locks = None
+        self.next_slot = itertools.cycle(range(pool_size))
+        self.subscribers = []
+
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, name='server-client', daemon=True)
+        self.thread.start()
+
+    # The open connection in `slot`, connecting first if there isn't one.
+    # Slot 0 also carries the announcement subscription.
+    async def _connection(self, slot):
+        if self.pool_locks is None:
+            self.pool_locks = [asyncio.Lock() for _ in self.pool]
+
+        async with self.pool_locks[slot]:
+            connection = self.pool[slot]
+            if connection is not None and not connection.closed:
+                return connection
+            try:
+                reader, writer = await asyncio.open_connection(self.host, self.port, limit=MAX_LINE)
+            except OSError as e:
+                raise ServerError(f"Can't reach the server at {self.host}:{self.port} ({e.strerror or e})")
+            connection = self.pool[slot] = Connection(reader, writer, self._on_event)
+            if slot == 0 and self.subscribers:
+                await connection.request('subscribe')
+            return connection
+
+    async def _call(self, operation, args):
+        connection = await self._connection(next(self.next_slot))
+        try:
+            return await asyncio.wait_for(connection.request(operation, args), REQUEST_TIMEOUT)
+        except asyncio.TimeoutError:
+            raise ServerError('The server took too long to answer')
+
+    # Returns a concurrent.futures.Future
+    def call(self, operation, *args):
+        return asyncio.run_coroutine_threadsafe(self._call(operation, args), self.loop)
+
+    def _on_event(self, message):
+        if message['event'] == 'announcements':
+            for callback in list(self.subscribers):
+                callback(message['announcements'])
+
+    # Callbacks run on the client's thread
+    def subscribe(self, callback):
+        self.subscribers.append(callback)
+        if len(self.subscribers) == 1:
+            self._in_background(self._subscribe('subscribe'))
+
+    def unsubscribe(self, callback):
+        if callback in self.subscribers:
+            self.subscribers.remove(callback)
+            if not self.subscribers:
+                self._in_background(self._subscribe('unsubscribe'))
+
+    async def _subscribe(self, operation):
+        connection = self.pool[0]
+        if connection is None or connection.closed:
+            # Connecting subscribes by itself if anyone is listening
+            await self._connection(0)
+        else:
+            await connection.request(operation)
+
+    # The server pushes new announcements, so all there is to do is make
+    # sure the subscription survives the server going away and coming back
+    def refresh(self):
+        connection = self.pool[0]
+        if self.subscribers and (connection is None or connection.closed):
+            self._in_background(self._subscribe('subscribe'))
+
+    def _in_background(self, coroutine):
+        future = asyncio.run_coroutine_threadsafe(coroutine, self.loop)
+        future.add_done_callback(self._report_failure)
+
+    def _report_failure(self, future):
+        if not future.cancelled() and future.exception() is not None:
+            print(f"Server request failed: {future.exception()}")
+
+    def close(self):
+        # Wait for each connection's reader to finish before stopping the
+        # loop, or the loop is stopped with the reader still pending
+        async def close_all():
+            readers = []
+            for connection in self.pool:
+                if connection is not None:
+                    connection.close()
+                    connection.reading.cancel()
+                    readers.append(connection.reading)
+            await asyncio.gather(*readers, return_exceptions=True)
+
+        asyncio.run_coroutine_threadsafe(close_all(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
@@ -0,0 +1,165 @@
+import itertools
+import random
+import threading
+import time
+
+# Events are dicts with an id, title, venue, department and start and end
+# times (seconds since the epoch; an event runs from start up to end). The
+# index keeps them in interval trees, one over every event and one per venue,
+# so range, conflict and upcoming queries cost O(log n) plus the events found.
+
+# How many upcoming events a dashboard lists
+UPCOMING_LIMIT = 20
+
+
+# A treap ordered by (start, id), where each node also knows the latest end
+# in its subtree. Subtrees that end before a query starts are skipped whole.
+class _Node:
+    __slots__ = ('key', 'end', 'event', 'priority', 'left', 'right', 'max_end')
+
+    def __init__(self, event):
+        self.key = (event['start'], event['id'])
+        self.end = event['end']
+        self.event = event
+        self.priority = random.random()
+        self.left = None
+        self.right = None
+        self.max_end = self.end
+
+
+def _update(node):
+    node.max_end = node.end
+    if node.left is not None and node.left.max_end > node.max_end:
+        node.max_end = node.left.max_end
+    if node.right is not None and node.right.max_end > node.max_end:
+        node.max_end = node.right.max_end
+
+
+def _rotate_right(node):
+    left = node.left
+    node.left, left.right = left.right, node
+    _update(node)
+    _update(left)
+    return left
+
+
+def _rotate_left(node):
+    right = node.right
+    node.right, right.left = right.left, node
+    _update(node)
+    _update(right)
+    return right
+
+
+def _insert(node, new):
+    if node is None:
+        return new
+    if new.key < node.key:
+        node.left = _insert(node.left, new)
+        if node.left.priority > node.priority:
+            return _rotate_right(node)
+    else:
+        node.right = _insert(node.right, new)
+        if node.right.priority > node.priority:
+            return _rotate_left(node)
+    _update(node)
+    return node
+
+
+# Events overlapping [start, end), in start order: an in-order walk that
+# skips subtrees ending too early and stops at the first node starting too late
+def _overlapping(node, start, end):
+    stack = []
+    while True:
+        while node is not None and node.max_end > start:
+            stack.append(node)
+            node = node.left
+        if not stack:
+            return
+        node = stack.pop()
+        if node.key[0] >= end:
+            return
+        if node.end > start:
+            yield node.event
+        node = node.right
+
+
+class IntervalTree:
+    def __init__(self):
+        self.root = None
+        self.size = 0
+
+    def insert(self, event):
+        self.root = _insert(self.root, _Node(event))
+        self.size += 1
+
+    def overlapping(self, start, end):
+        return _overlapping(self.root, start, end)
+
+    def __len__(self):
+        return self.size
+
+
+def venue_key(venue):
+    return ' '.join(venue.split()).casefold()
+
+
+class EventIndex:
+    def __init__(self, events=()):
+        self.all = IntervalTree()
+        self.venues = {}
+        self.lock = threading.Lock()
+        self.add_many(events)
+
+    def add(self, event):
+        self.add_many([event])
+
+    def add_many(self, events):
+        with self.lock:
+            for event in events:
+                self.all.insert(event)
+                venue = venue_key(event['venue'])
+                tree = self.venues.get(venue)
+                if tree is None:
+                    tree = self.venues[venue] = IntervalTree()
+                tree.insert(event)
+
+    # Events booked at `venue` that overlap [start, end)
+    def conflicts(self, venue, start, end):
+        with self.lock:
+            tree = self.venues.get(venue_key(venue))
+            return [] if tree is None else list(tree.overlapping(start, end))
+
+    # Events on at any time in [start, end), by start time
+    def between(self, start, end):
+        with self.lock:
+            return list(self.all.overlapping(start, end))
+
+    # Events that haven't ended by `now`, soonest first
+    def upcoming(self, now, limit=UPCOMING_LIMIT):
+        with self.lock:
+            return list(itertools.islice(self.all.overlapping(now, float('inf')), limit))
+
+    def __len__(self):
+        return len(self.all)
+
+
+# Midnight on the Monday starting the week `timestamp` falls in, and a week after that (local time)
+def week_of(timestamp):
+    day = time.localtime(timestamp)
+    monday = time.mktime((day.tm_year, day.tm_mon, day.tm_mday - day.tm_wday, 0, 0, 0, 0, 0, -1))
+    following = time.mktime((day.tm_year, day.tm_mon, day.tm_mday - day.tm_wday + 7, 0, 0, 0, 0, 0, -1))
+    return monday, following
+
+
+# Seconds since the epoch from a date ('YYYY-MM-DD') and a time ('HH:MM'), in
+# local time. Raises ValueError if either doesn't parse.
+def parse_time(date, clock):
+    return time.mktime(time.strptime(f'{date.strip()} {clock.strip()}', '%Y-%m-%d %H:%M'))
+
+
+def format_event(event):
+    start = time.localtime(event['start'])
+    end = time.localtime(event['end'])
+    ends = time.strftime('%H:%M' if start[:3] == end[:3] else '%a %d %b %H:%M', end)
+    return f"{time.strftime('%a %d %b %H:%M', start)}-{ends}  {event['title']} ({event['venue']})"
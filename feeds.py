@@ -0,0 +1,123 @@
+import bisect
+import threading
+from array import array
+
+# Who an announcement is for. Announcements carry an 'audience': a list of
+# audience keys, EVERYONE or one per section or department it is for;
+# announcements posted before audiences existed have none and are for
+# everyone. A student is in EVERYONE, their section's audience and, if they
+# gave one, their department's.
+#
+# The index keeps, for each audience, the ids of its announcements in
+# ascending order, added to as each announcement is posted (fan-out on
+# write). A student's feed is then those three lists merged, and a page of
+# it costs O(log n) per list plus the page, however many announcements are
+# for other people.
+
+EVERYONE = 'everyone'
+
+# What representatives can pick when posting
+AUDIENCE_CHOICES = ('Everyone', 'My department', 'Sections')
+
+
+def _normalize(name):
+    return ' '.join(name.split()).casefold()
+
+
+def section_audience(section):
+    return 'section:' + _normalize(section)
+
+
+def department_audience(department):
+    return 'department:' + _normalize(department)
+
+
+def audiences_of(announcement):
+    return announcement.get('audience') or [EVERYONE]
+
+
+def student_audiences(student):
+    audiences = [EVERYONE]
+    if student.get('section'):
+        audiences.append(section_audience(student['section']))
+    if student.get('department'):
+        audiences.append(department_audience(student['department']))
+    return audiences
+
+
+def is_for(announcement, audiences):
+    return any(audience in audiences for audience in audiences_of(announcement))
+
+
+# The audience keys for one of AUDIENCE_CHOICES, with the posting
+# representative's department and the sections typed in (comma-separated).
+# Returns (audience, None), or (None, error message).
+def parse_audience(choice, department, sections=''):
+    if choice in (None, '', 'Everyone'):
+        return [EVERYONE], None
+    if choice == 'My department':
+        if not department:
+            return None, 'Your account has no department.'
+        return [department_audience(department)], None
+    if choice == 'Sections':
+        names = [name for name in (name.strip() for name in sections.split(',')) if name]
+        if not names:
+            return None, 'Enter the sections, separated by commas.'
+        return sorted({section_audience(name) for name in names}), None
+    return None, f'Unknown audience {choice!r}.'
+
+
+class FeedIndex:
+    # `feeds` maps audience keys to ascending announcement ids already indexed
+    def __init__(self, feeds=None):
+        self.feeds = {audience: array('q', ids) for audience, ids in (feeds or {}).items()}
+        self.lock = threading.Lock()
+
+    def add(self, announcement):
+        self.add_many([announcement])
+
+    # Announcements must come in id order, after any already added
+    def add_many(self, announcements):
+        with self.lock:
+            for announcement in announcements:
+                for audience in audiences_of(announcement):
+                    feed = self.feeds.get(audience)
+                    if feed is None:
+                        feed = self.feeds[audience] = array('q')
+                    feed.append(announcement['id'])
+
+    # Ids of the announcements for any of `audiences`, newest first, optionally
+    # only those older than the id `before`
+    def page(self, audiences, before=None, limit=None):
+        found = set()
+        with self.lock:
+            for audience in audiences:
+                feed = self.feeds.get(audience)
+                if feed is None:
+                    continue
+                end = len(feed) if before is None else bisect.bisect_left(feed, before)
+                start = 0 if limit is None else max(end - limit, 0)
+                found.update(feed[start:end])
+        ids = sorted(found, reverse=True)
+        return ids if limit is None else ids[:limit]
+
+    # Ids for any of `audiences` above `after`, oldest first
+    def after(self, audiences, after):
+        found = set()
+        with self.lock:
+            for audience in audiences:
+                feed = self.feeds.get(audience)
+                if feed is not None:
+                    found.update(feed[bisect.bisect_right(feed, after):])
+        return sorted(found)
+
+    # Take the ids from `first` to `last` out of every feed
+    def discard(self, first, last):
+        with self.lock:
+            for feed in self.feeds.values():
+                del feed[bisect.bisect_left(feed, first):bisect.bisect_right(feed, last)]
+
+    # Every feed cut off after the id `last`, as lists, to be saved
+    def through(self, last):
+        with self.lock:
+            return {audience: feed[:bisect.bisect_right(feed, last)].tolist() for audience, feed in self.feeds.items()}
@@ -0,0 +1,123 @@
+# Bulk-register students from a CSV roster without opening the app.
+#
+#   python import_students.py roster.csv [--workers N] [--no-email] [--send-now]
+#
+# The CSV needs the columns name, student_number, section, email and password,
+# and can have a department column too.
+# Rows are validated and de-duplicated against each other and the existing
+# store, passwords are hashed across a process pool, every new student is
+# added in one write, and welcome emails are queued in the mail outbox.
+
+import argparse
+import csv
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import auth
+import mailer
+from storage import open_store
+
+FIELDS = ('name', 'student_number', 'section', 'email', 'password')
+
+# Rows hashed per round trip to the worker processes
+HASH_CHUNK = 64
+
+# Welcome emails written to the outbox per insert
+EMAIL_BATCH = 500
+
+
+# Yields (line_number, row) for rows that have every field, reporting the rest
+def read_roster(path, problems):
+    with open(path, newline='', encoding='utf-8-sig') as f:
+        reader = csv.DictReader(f)
+        missing = [field for field in FIELDS if field not in (reader.fieldnames or [])]
+        if missing:
+            raise SystemExit(f"{path}: missing column(s): {', '.join(missing)}")
+
+        for row in reader:
+            values = {field: (row.get(field) or '').strip() for field in FIELDS}
+            values['password'] = row.get('password') or ''
+            values['department'] = (row.get('department') or '').strip()
+            empty = [field for field in FIELDS if not values[field]]
+            if empty:
+                problems.append((reader.line_num, f"missing {', '.join(empty)}"))
+            elif '@' not in values['email']:
+                problems.append((reader.line_num, f"invalid email {values['email']!r}"))
+            else:
+                yield reader.line_num, values
+
+
+def import_students(path, store, workers=None, send_email=True):
+    problems = []
+    rows = []
+    seen = set()
+    for line_number, row in read_roster(path, problems):
+        number = row['student_number']
+        if number in seen or store.get_student(number):
+            problems.append((line_number, f"student number {number} is already registered"))
+            continue
+        seen.add(number)
+        rows.append(row)
+
+    # Settle the hashing parameters once, then hand them to every worker
+    params = auth.get_params()
+    with ProcessPoolExecutor(max_workers=workers, initializer=auth.use_params, initargs=(params,)) as pool:
+        hashes = pool.map(auth.hash_password, [row['password'] for row in rows], chunksize=HASH_CHUNK)
+        students = [{
+            'name': row['name'],
+            'student_number': row['student_number'],
+            'section': row['section'],
+            'password': password_hash,
+            'email': row['email'],
+        } for row, password_hash in zip(rows, hashes)]
+        for student, row in zip(students, rows):
+            if row['department']:
+                student['department'] = row['department']
+
+    added = store.add_students(students)
+
+    if send_email and added:
+        outbox = mailer.Outbox()
+        try:
+            for start in range(0, len(added), EMAIL_BATCH):
+                outbox.add_many([(student['email'],) + mailer.welcome_message(student['name'])
+                                 for student in added[start:start + EMAIL_BATCH]])
+        finally:
+            outbox.close()
+
+    return added, problems
+
+
+# Run the mail dispatcher until everything queued has been sent or has given up
+def send_queued_mail():
+    dispatcher = mailer.get_dispatcher()
+    while dispatcher.outbox.pending_count():
+        time.sleep(1)
+    mailer.shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Register students in bulk from a CSV roster.')
+    parser.add_argument('roster', help='CSV file with name, student_number, section, email and password columns')
+    parser.add_argument('--workers', type=int, default=None, help='hashing processes (default: one per CPU)')
+    parser.add_argument('--no-email', action='store_true', help="don't queue welcome emails")
+    parser.add_argument('--send-now', action='store_true', help='send the queued emails before exiting')
+    args = parser.parse_args()
+
+    store = open_store()
+    start = time.perf_counter()
+    try:
+        added, problems = import_students(args.roster, store, args.workers, not args.no_email)
+    finally:
+        store.close()
+
+    for line_number, problem in problems:
+        print(f"line {line_number}: skipped, {problem}")
+    print(f"Imported {len(added)} student(s) in {time.perf_counter() - start:.1f}s, skipped {len(problems)}.")
+
+    if args.send_now and added and not args.no_email:
+        send_queued_mail()
+
+
+if __name__ == '__main__':
+    main()
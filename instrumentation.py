@@ -0,0 +1,182 @@
+import bisect
+import functools
+import json
+import os
+import threading
+import time
+
+# Opt-in timing of UI callbacks, screen construction, service operations,
+# storage reads and writes and SMTP calls, plus frame times. Set
+# IEMS_INSTRUMENT=1 to turn it on; the numbers are saved to DUMP_FILE every
+# DUMP_INTERVAL seconds and when the app stops. Turned off, timed() hands
+# functions back untouched, so there is no cost at all.
+ENABLED = os.getenv('IEMS_INSTRUMENT') == '1'
+DUMP_FILE = os.getenv('IEMS_INSTRUMENT_FILE', 'instrumentation.json')
+DUMP_INTERVAL = float(os.getenv('IEMS_INSTRUMENT_INTERVAL', '30'))
+
+# Set IEMS_PROFILE=1 to run the whole session under cProfile and save the
+# stats to PROFILE_FILE (open with python -m pstats). Only the UI thread is profiled.
+PROFILE = os.getenv('IEMS_PROFILE') == '1'
+PROFILE_FILE = os.getenv('IEMS_PROFILE_FILE', 'session.pstats')
+
+# Frames that take longer than this count as slow
+SLOW_FRAME = 1 / 30
+
+# Histogram bucket upper bounds in seconds: 1-2-5 steps from 10us to 100s
+BOUNDS = [mantissa * 10.0 ** exponent for exponent in range(-5, 2) for mantissa in (1, 2, 5)] + [100.0]
+
+
+class Histogram:
+    def __init__(self):
+        self.counts = [0] * (len(BOUNDS) + 1)  # the last bucket is everything above 100s
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.lock = threading.Lock()
+
+    def add(self, seconds):
+        bucket = bisect.bisect_left(BOUNDS, seconds)
+        with self.lock:
+            self.counts[bucket] += 1
+            self.count += 1
+            self.total += seconds
+            if seconds > self.max:
+                self.max = seconds
+
+    # Upper bound of the bucket holding the given fraction of samples, capped at the maximum seen
+    def percentile(self, fraction):
+        rank = fraction * self.count
+        seen = 0
+        for bound, count in zip(BOUNDS + [self.max], self.counts):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+    def summary(self):
+        with self.lock:
+            if not self.count:
+                return {'count': 0}
+            return {
+                'count': self.count,
+                'mean_ms': self.total / self.count * 1000,
+                'p50_ms': self.percentile(0.5) * 1000,
+                'p90_ms': self.percentile(0.9) * 1000,
+                'p99_ms': self.percentile(0.99) * 1000,
+                'max_ms': self.max * 1000,
+                # Samples per bucket, keyed by the bucket's upper bound in ms
+                'buckets': {f'{bound * 1000:g}': count
+                            for bound, count in zip(BOUNDS + [float('inf')], self.counts) if count},
+            }
+
+
+histograms = {}
+_histograms_lock = threading.Lock()
+frames = {'count': 0, 'slow': 0}
+_dumping = None
+_profiler = None
+
+
+def histogram(name):
+    found = histograms.get(name)
+    if found is None:
+        with _histograms_lock:
+            found = histograms.setdefault(name, Histogram())
+    return found
+
+
+def record(name, seconds):
+    if ENABLED:
+        histogram(name).add(seconds)
+
+
+# Decorator recording how long each call takes under `name`
+def timed(name):
+    def decorate(function):
+        if not ENABLED:
+            return function
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                histogram(name).add(time.perf_counter() - start)
+
+        return wrapper
+    return decorate
+
+
+# Context manager recording how long its block takes under `name`
+class span:
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        record(self.name, time.perf_counter() - self.start)
+
+
+# Schedule with Clock.schedule_interval(frame, 0): dt is the time between frames
+def frame(dt):
+    histogram('frame').add(dt)
+    frames['count'] += 1
+    if dt > SLOW_FRAME:
+        frames['slow'] += 1
+
+
+def snapshot():
+    with _histograms_lock:
+        names = sorted(histograms)
+    return {
+        'time': time.time(),
+        'frames': dict(frames, slow_threshold_ms=SLOW_FRAME * 1000),
+        'timings': {name: histograms[name].summary() for name in names},
+    }
+
+
+def dump(path=None):
+    path = path or DUMP_FILE
+    tmp_path = path + '.tmp'
+    try:
+        with open(tmp_path, 'w') as f:
+            json.dump(snapshot(), f, indent=4)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        print(f"Failed to save instrumentation: {e}")
+
+
+def _dump_periodically(stopping):
+    while not stopping.wait(DUMP_INTERVAL):
+        dump()
+
+
+# Start the periodic dump (if instrumentation is on) and the profiler (if profiling is on)
+def start():
+    global _dumping, _profiler
+    if ENABLED and _dumping is None:
+        stopping = threading.Event()
+        thread = threading.Thread(target=_dump_periodically, args=(stopping,), name='instrumentation', daemon=True)
+        thread.start()
+        _dumping = stopping
+    if PROFILE and _profiler is None:
+        import cProfile
+        _profiler = cProfile.Profile()
+        _profiler.enable()
+
+
+# Stop both and save what they collected
+def stop():
+    global _dumping, _profiler
+    if _dumping is not None:
+        _dumping.set()
+        _dumping = None
+        dump()
+    if _profiler is not None:
+        _profiler.disable()
+        _profiler.dump_stats(PROFILE_FILE)
+        _profiler = None
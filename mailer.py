@@ -0,0 +1,436 @@
+import os
+import queue
+import smtplib
+import sqlite3
+import threading
+import time
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+
+import instrumentation
+
+OUTBOX_FILE = os.getenv('IEMS_OUTBOX_FILE', 'mail_outbox.db')
+
+# Email configuration
+SMTP_SERVER = os.getenv('SMTP_SERVER', 'smtp.gmail.com')
+SMTP_PORT = int(os.getenv('SMTP_PORT', '587'))
+SMTP_STARTTLS = os.getenv('SMTP_STARTTLS', '1') == '1'
+
+# Delivery tuning
+BATCH_SIZE = int(os.getenv('IEMS_MAIL_BATCH', '50'))
+MAX_ATTEMPTS = int(os.getenv('IEMS_MAIL_MAX_ATTEMPTS', '5'))
+BACKOFF_BASE = float(os.getenv('IEMS_MAIL_BACKOFF', '2'))
+BACKOFF_MAX = 300
+IDLE_TIMEOUT = 60
+
+# Sending threads (each with its own pooled connection) and the overall send
+# rate they share, in messages per second (0 means no limit)
+MAIL_WORKERS = int(os.getenv('IEMS_MAIL_WORKERS', '2'))
+MAIL_RATE = float(os.getenv('IEMS_MAIL_RATE', '10'))
+
+# Recipients written to the outbox at a time when fanning out an announcement
+FANOUT_BATCH = 500
+
+
+# Messages waiting to be sent, kept on disk so a restart doesn't lose them
+class Outbox:
+    def __init__(self, path=OUTBOX_FILE):
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        with self.conn:
+            self.conn.execute('''
+                CREATE TABLE IF NOT EXISTS messages (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    recipient TEXT,
+                    subject TEXT,
+                    body TEXT,
+                    attempts INTEGER DEFAULT 0,
+                    next_attempt REAL DEFAULT 0,
+                    status TEXT DEFAULT 'pending'
+                )
+            ''')
+            self.conn.execute('CREATE INDEX IF NOT EXISTS messages_due ON messages (status, next_attempt)')
+            # Anything claimed by a sender that never finished goes back in the queue
+            self.conn.execute("UPDATE messages SET status = 'pending' WHERE status = 'sending'")
+
+    def add(self, recipient, subject, body):
+        self.add_many([(recipient, subject, body)])
+
+    def add_many(self, messages):
+        with self.lock, self.conn:
+            self.conn.executemany('INSERT INTO messages (recipient, subject, body) VALUES (?, ?, ?)', messages)
+
+    # Claim up to `limit` messages that are due, so no other sender picks them up
+    def claim(self, limit):
+        with self.lock, self.conn:
+            rows = self.conn.execute(
+                "SELECT id, recipient, subject, body, attempts FROM messages "
+                "WHERE status = 'pending' AND next_attempt <= ? ORDER BY id LIMIT ?",
+                (time.time(), limit)).fetchall()
+            self.conn.executemany("UPDATE messages SET status = 'sending' WHERE id = ?",
+                                  [(row[0],) for row in rows])
+        return rows
+
+    def sent(self, message_id):
+        with self.lock, self.conn:
+            self.conn.execute('DELETE FROM messages WHERE id = ?', (message_id,))
+
+    def retry(self, message_id, attempts, delay):
+        with self.lock, self.conn:
+            self.conn.execute(
+                "UPDATE messages SET status = 'pending', attempts = ?, next_attempt = ? WHERE id = ?",
+                (attempts, time.time() + delay, message_id))
+
+    def failed(self, message_id, attempts):
+        with self.lock, self.conn:
+            self.conn.execute("UPDATE messages SET status = 'failed', attempts = ? WHERE id = ?",
+                              (attempts, message_id))
+
+    # Seconds until the next pending message is due, or None if there are none
+    def next_due(self):
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT MIN(next_attempt) FROM messages WHERE status = 'pending'").fetchone()
+        if row[0] is None:
+            return None
+        return max(0, row[0] - time.time())
+
+    def pending_count(self):
+        with self.lock:
+            return self.conn.execute(
+                "SELECT COUNT(*) FROM messages WHERE status IN ('pending', 'sending')").fetchone()[0]
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+
+# Keeps logged-in SMTP connections around instead of reconnecting for every message
+class SMTPPool:
+    def __init__(self, host=SMTP_SERVER, port=SMTP_PORT, username=None, password=None,
+                 starttls=SMTP_STARTTLS, size=1, timeout=30):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.starttls = starttls
+        self.timeout = timeout
+        self.idle = []
+        self.slots = threading.BoundedSemaphore(size)
+        self.lock = threading.Lock()
+
+    @instrumentation.timed('smtp.connect')
+    def _connect(self):
+        server = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        try:
+            if self.starttls:
+                server.starttls()
+            if self.username and self.password:
+                server.login(self.username, self.password)
+        except Exception:
+            server.close()
+            raise
+        return server
+
+    def acquire(self):
+        self.slots.acquire()
+        with self.lock:
+            idle = self.idle.pop() if self.idle else None
+
+        if idle is not None:
+            server, released_at = idle
+            if time.monotonic() - released_at < IDLE_TIMEOUT:
+                return server
+            # The server may have dropped a connection that sat idle for a while
+            try:
+                if server.noop()[0] == 250:
+                    return server
+            except smtplib.SMTPException:
+                pass
+            server.close()
+
+        try:
+            return self._connect()
+        except Exception:
+            self.slots.release()
+            raise
+
+    # Hand a connection back; broken ones are dropped rather than reused
+    def release(self, server, broken=False):
+        if broken:
+            server.close()
+        else:
+            with self.lock:
+                self.idle.append((server, time.monotonic()))
+        self.slots.release()
+
+    def close(self):
+        with self.lock:
+            idle, self.idle = self.idle, []
+        for server, _ in idle:
+            try:
+                server.quit()
+            except smtplib.SMTPException:
+                server.close()
+
+
+# Subject and body of the email sent to newly registered students
+def welcome_message(name):
+    body = f'Dear {name},\n\nYou have successfully registered as a student.\n\nBest regards,\nICCT College'
+    return 'Registration Successful', body
+
+
+# Token bucket: on average `rate` messages per second, with bursts of up to `burst`
+class RateLimiter:
+    def __init__(self, rate=MAIL_RATE, burst=None, clock=time.monotonic, sleep=time.sleep):
+        self.rate = rate
+        self.capacity = burst or max(rate, 1)
+        self.tokens = self.capacity
+        self.clock = clock
+        self.sleep = sleep
+        self.updated = clock()
+        self.lock = threading.Lock()
+
+    # Wait until another message may be sent
+    def acquire(self):
+        if not self.rate:
+            return
+        while True:
+            with self.lock:
+                now = self.clock()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            self.sleep(wait)
+
+
+def backoff_delay(attempts):
+    return min(BACKOFF_BASE * 2 ** (attempts - 1), BACKOFF_MAX)
+
+
+# Sends queued mail from background threads, so callers never wait on the network
+class MailDispatcher:
+    def __init__(self, outbox=None, pool=None, sender=None, workers=MAIL_WORKERS, batch_size=BATCH_SIZE,
+                 limiter=None):
+        self.sender = sender or os.getenv('SENDER_EMAIL')
+        self.outbox = outbox or Outbox()
+        self.pool = pool or SMTPPool(username=self.sender, password=os.getenv('SENDER_PASSWORD'),
+                                     size=workers)
+        self.limiter = limiter or RateLimiter()
+        self.workers = workers
+        self.batch_size = batch_size
+        self.wakeup = threading.Condition()
+        self.running = False
+        self.threads = []
+
+    def start(self):
+        self.running = True
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._run, name=f'mail-{i}', daemon=True)
+            thread.start()
+            self.threads.append(thread)
+
+    def stop(self, timeout=5):
+        self.running = False
+        with self.wakeup:
+            self.wakeup.notify_all()
+        for thread in self.threads:
+            thread.join(timeout)
+        sending = [thread for thread in self.threads if thread.is_alive()]
+        self.threads = []
+        if sending:
+            # Don't close the outbox under a worker still in the middle of a
+            # send; close it once the last one has finished
+            threading.Thread(target=self._close_after, args=(sending,), name='mail-close', daemon=True).start()
+        else:
+            self._close()
+
+    def _close_after(self, threads):
+        for thread in threads:
+            thread.join()
+        self._close()
+
+    def _close(self):
+        self.pool.close()
+        self.outbox.close()
+
+    def enqueue(self, recipient, subject, body):
+        self.enqueue_many([(recipient, subject, body)])
+
+    def enqueue_many(self, messages):
+        self.outbox.add_many(messages)
+        with self.wakeup:
+            self.wakeup.notify_all()
+
+    def _run(self):
+        while self.running:
+            batch = self.outbox.claim(self.batch_size)
+            if batch:
+                self._send_batch(batch)
+                continue
+
+            with self.wakeup:
+                if self.running:
+                    self.wakeup.wait(self.outbox.next_due())
+
+    def _build_message(self, recipient, subject, body):
+        msg = MIMEMultipart()
+        msg['From'] = self.sender
+        msg['To'] = recipient
+        msg['Subject'] = subject
+        msg.attach(MIMEText(body, 'plain'))
+        return msg.as_string()
+
+    def _send_batch(self, batch):
+        try:
+            server = self.pool.acquire()
+        except Exception as e:
+            print(f"Failed to connect to mail server: {e}")
+            for message_id, _, _, _, attempts in batch:
+                self._retry(message_id, attempts + 1)
+            return
+
+        broken = False
+        try:
+            for index, (message_id, recipient, subject, body, attempts) in enumerate(batch):
+                try:
+                    self.limiter.acquire()
+                    with instrumentation.span('smtp.send'):
+                        server.sendmail(self.sender, recipient, self._build_message(recipient, subject, body))
+                except smtplib.SMTPRecipientsRefused as e:
+                    # The address itself was rejected, so trying again won't help
+                    print(f"Failed to send email to {recipient}: {e}")
+                    self.outbox.failed(message_id, attempts + 1)
+                    continue
+                except (smtplib.SMTPServerDisconnected, OSError) as e:
+                    # The connection is gone; requeue this and the rest of the batch
+                    print(f"Failed to send email: {e}")
+                    broken = True
+                    self._retry(message_id, attempts + 1)
+                    self._requeue(batch[index + 1:])
+                    return
+                except smtplib.SMTPException as e:
+                    print(f"Failed to send email to {recipient}: {e}")
+                    self._retry(message_id, attempts + 1)
+                    continue
+                except Exception as e:
+                    # Anything else leaves the connection in an unknown state, so
+                    # drop it, and don't leave the rest of the batch claimed
+                    print(f"Failed to send email to {recipient}: {e}")
+                    broken = True
+                    self._retry(message_id, attempts + 1)
+                    self._requeue(batch[index + 1:])
+                    return
+                self.outbox.sent(message_id)
+        finally:
+            self.pool.release(server, broken=broken)
+
+    def _retry(self, message_id, attempts):
+        if attempts >= MAX_ATTEMPTS:
+            self.outbox.failed(message_id, attempts)
+        else:
+            self.outbox.retry(message_id, attempts, backoff_delay(max(attempts, 1)))
+
+    # Put messages that were claimed but never tried back in the queue as they were
+    def _requeue(self, batch):
+        for message_id, _, _, _, attempts in batch:
+            self.outbox.retry(message_id, attempts, 0)
+
+
+# Turns one message for many recipients into queued emails on a background
+# thread, a batch at a time, so the caller never waits on a long recipient list
+class FanOut:
+    def __init__(self, dispatcher, batch_size=FANOUT_BATCH):
+        self.dispatcher = dispatcher
+        self.batch_size = batch_size
+        self.jobs = queue.Queue()
+        self.thread = threading.Thread(target=self._run, name='mail-fanout', daemon=True)
+        self.thread.start()
+
+    # `recipients` is any iterable of email addresses; it is consumed on the fan-out thread
+    def submit(self, subject, body, recipients):
+        self.jobs.put((subject, body, recipients))
+
+    def stop(self):
+        self.jobs.put(None)
+        self.thread.join()
+
+    def _run(self):
+        while True:
+            job = self.jobs.get()
+            if job is None:
+                return
+            subject, body, recipients = job
+            batch = []
+            try:
+                for recipient in recipients:
+                    batch.append((recipient, subject, body))
+                    if len(batch) >= self.batch_size:
+                        self.dispatcher.enqueue_many(batch)
+                        batch = []
+                if batch:
+                    self.dispatcher.enqueue_many(batch)
+            except Exception as e:
+                print(f"Failed to queue emails for {subject!r}: {e}")
+
+
+# Subject and body of the email sent to students about a new announcement
+def announcement_message(announcement):
+    department = announcement.get('department', 'ICCT College')
+    body = f"{announcement.get('announcement', '')}\n\n- {department}\nICCT College"
+    return f'New Announcement from {department}', body
+
+
+_dispatcher = None
+_fanout = None
+_dispatcher_lock = threading.Lock()
+
+
+# The process-wide dispatcher, started on first use
+def get_dispatcher():
+    global _dispatcher
+    with _dispatcher_lock:
+        if _dispatcher is None:
+            _dispatcher = MailDispatcher()
+            _dispatcher.start()
+        return _dispatcher
+
+
+# Email an announcement to every address in `recipients` without blocking the caller
+def send_announcement(announcement, recipients):
+    global _fanout
+    dispatcher = get_dispatcher()
+    with _dispatcher_lock:
+        if _fanout is None:
+            _fanout = FanOut(dispatcher)
+    subject, body = announcement_message(announcement)
+    _fanout.submit(subject, body, recipients)
+
+
+# Start delivering if an earlier run (or the bulk importer) left mail in the outbox
+def resume_pending():
+    if not os.path.exists(OUTBOX_FILE):
+        return False
+    outbox = Outbox()
+    try:
+        pending = outbox.pending_count()
+    finally:
+        outbox.close()
+    if pending:
+        get_dispatcher()
+    return bool(pending)
+
+
+def shutdown():
+    global _dispatcher, _fanout
+    with _dispatcher_lock:
+        if _fanout is not None:
+            _fanout.stop()
+            _fanout = None
+        if _dispatcher is not None:
+            _dispatcher.stop()
+            _dispatcher = None
@@ -1,656 +1,1141 @@
-import json
-import hashlib
-import os
-from kivy.app import App
-from kivy.uix.boxlayout import BoxLayout
-from kivy.uix.label import Label
-from kivy.uix.textinput import TextInput
-from kivy.uix.button import Button
-from kivy.uix.popup import Popup
-from kivy.uix.floatlayout import FloatLayout
-from kivy.uix.image import Image
-from kivy.core.window import Window
-from kivy.graphics import Color, RoundedRectangle
-from kivy.animation import Animation
-from plyer import notification
-from kivy.uix.scrollview import ScrollView
-import smtplib
-from email.mime.multipart import MIMEMultipart
-from email.mime.text import MIMEText
-
-# Define the cleared JSON structure
-cleared_json = {
-    "students": [],
-    "representatives": [],
-    "announcements": []
-}
-
-# Write the cleared structure to the JSON file
-with open('student_data.json', 'w') as f:
-    json.dump(cleared_json, f, indent=4)
-
-print("JSON file cleared successfully.")
-
-# Set window background color (ICCT color scheme example)
-Window.clearcolor = (0.9, 0.9, 1, 1)  # Light blue background
-
-# Load student and representative data from JSON with error handling
-def load_data():
-    try:
-        with open('student_data.json', 'r') as f:
-            return json.load(f)
-    except (FileNotFoundError, json.JSONDecodeError):
-        return {"students": [], "representatives": [], "announcements": []}
-
-data = load_data()
-
-def save_data():
-    with open('student_data.json', 'w') as f:
-        json.dump(data, f, indent=4)
-
-# Function to hash passwords
-def hash_password(password):
-    return hashlib.sha256(password.encode()).hexdigest()
-
-class RoundedButton(Button):
-    def __init__(self, **kwargs):
-        super(RoundedButton, self).__init__(**kwargs)
-        self.bind(size=self._update_rounded_rect, pos=self._update_rounded_rect)
-
-    def _update_rounded_rect(self, *args):
-        self.canvas.before.clear()
-        with self.canvas.before:
-            Color(0.2, 0.6, 0.8, 1)  # Change to desired color
-            RoundedRectangle(pos=self.pos, size=self.size, radius=[20])
-
-    def _update_rect(self, instance, value):
-        self.rect.pos = self.pos
-        self.rect.size = self.size
-
-    def animate_button_press(self, instance):
-        anim = Animation(size=(self.width * 1.05, self.height * 1.05), t='out_back', duration=0.1)
-        anim.start(self)
-
-    def animate_button_release(self, instance):
-        anim = Animation(size=(self.width, self.height), t='out_back', duration=0.1)
-        anim.start(self)
-
-class LoginScreen(FloatLayout):
-    def __init__(self, **kwargs):
-        super(LoginScreen, self).__init__(**kwargs)
-
-        gradient = Image(source='gradient_bg.png', allow_stretch=True, keep_ratio=False)
-        self.add_widget(gradient)
-
-        logo = Image(source='icct_logo.png', size_hint=(0.5, 0.3), pos_hint={'center_x': 0.5, 'top': 0.9})
-        self.add_widget(logo)
-
-        title_label = Label(text="ICCT College Event Management System",
-                            font_size=32, bold=True,
-                            size_hint=(0.8, 0.1),
-                            pos_hint={'center_x': 0.5, 'top': 0.85},
-                            color=(0, 0, 0, 1))
-        self.add_widget(title_label)
-
-        form_layout = BoxLayout(orientation='vertical', spacing=20, size_hint=(0.8, 0.5), pos_hint={'center_x': 0.5, 'top': 0.65})
-
-        self.user_type_input = TextInput(hint_text="Enter 'student' or 'representative'",
-                                          multiline=False, size_hint=(1, None),
-                                          height=40,
-                                          background_color=(1, 1, 1, 0.9),
-                                          padding_y=[10, 10],
-                                          foreground_color=(0, 0, 0, 1),
-                                          hint_text_color=(0.5, 0.5, 0.5, 1))
-        form_layout.add_widget(self.user_type_input)
-
-        self.student_number_input = TextInput(hint_text="Enter Student Number or Username",
-                                              multiline=False, size_hint=(1, None),
-                                              height=40,
-                                              background_color=(1, 1, 1, 0.9),
-                                              padding_y=[10, 10],
-                                              foreground_color=(0, 0, 0, 1),
-                                              hint_text_color=(0.5, 0.5, 0.5, 1))
-        form_layout.add_widget(self.student_number_input)
-
-        self.password_input = TextInput(hint_text="Enter Password",
-                                        multiline=False, password=True, size_hint=(1, None),
-                                        height=40,
-                                        background_color=(1, 1, 1, 0.9),
-                                        padding_y=[10, 10],
-                                        foreground_color=(0, 0, 0, 1),                                        hint_text_color=(0.5, 0.5, 0.5, 1))
-        form_layout.add_widget(self.password_input)
-
-        self.login_button = RoundedButton(text="Login", size_hint=(1, None), height=50,
-                                          on_press=self.validate_user)
-        form_layout.add_widget(self.login_button)
-
-        self.register_button = RoundedButton(text="Register as Representative", size_hint=(1, None), height=50,
-                                             on_press=self.show_registration)
-        form_layout.add_widget(self.register_button)
-
-        self.register_student_button = RoundedButton(text="Register as Student", size_hint=(1, None), height=50,
-                                                     on_press=self.show_student_registration)
-        form_layout.add_widget(self.register_student_button)
-
-        self.error_message = Label(text='', color=(1, 0, 0, 1), size_hint=(1, None), height=30, pos_hint={'center_x': 0.5, 'top': 0.2})
-        self.add_widget(self.error_message)
-
-        self.add_widget(form_layout)
-
-    def validate_user(self, instance):
-        self.error_message.text = ''
-        user_type = self.user_type_input.text.lower()
-        student_number = self.student_number_input.text
-        password = hash_password(self.password_input.text)
-
-        if not student_number or not self.password_input.text:
-            self.error_message.text = "Please fill in all fields."
-            return
-
-        if user_type == "student":
-            student_info = next((student for student in data['students']
-                                 if student.get('student_number') == student_number and student.get('password') == password), None)
-
-            if student_info:
-                self.show_dashboard(student_info)
-            else:
-                self.error_message.text = 'Invalid Student Number or Password'
-        
-        elif user_type == "representative":
-            rep_info = next((rep for rep in data['representatives']
-                             if rep.get('username') == student_number and rep.get('password') == password), None)
-
-            if rep_info:
-                self.show_rep_dashboard(rep_info)
-            else:
-                self.error_message.text = 'Invalid Representative Username or Password'
-        
-        else:
-            self.error_message.text = "Please enter 'student' or 'representative'"
-
-    def show_dashboard(self, student_info):
-        dashboard = DashboardScreen(student_info)
-        self.clear_widgets()
-        self.add_widget(dashboard)
-
-    def show_rep_dashboard(self, rep_info):
-        rep_dashboard = RepresentativeDashboardScreen(rep_info)
-        self.clear_widgets()
-        self.add_widget(rep_dashboard)
-
-    def show_registration(self, instance):
-        registration_screen = RegistrationScreen()
-        self.clear_widgets()
-        self.add_widget(registration_screen)
-
-    def show_student_registration(self, instance):
-        student_registration_screen = StudentRegistrationScreen()
-        self.clear_widgets()
-        self.add_widget(student_registration_screen)
-
-class DashboardScreen(FloatLayout):
-    def __init__(self, student_info, **kwargs):
-        super(DashboardScreen, self).__init__(**kwargs)
-
-         # Gradient background
-        gradient = Image(source='gradient_bg.png', allow_stretch=True, keep_ratio=False)
-        self.add_widget(gradient)
-
-        # Welcome message for students
-        welcome_label = Label(
-            text=f"Welcome {student_info.get('name', 'Student')}, Section: {student_info.get('section', 'N/A')}",
-            font_size=24,
-            color=(0, 0, 0, 1),
-            bold=True,
-            size_hint=(0.8, 0.1),
-            pos_hint={'center_x': 0.5, 'top': 0.9}
-        )
-        self.add_widget(welcome_label)
-
-         # Announcement Section Title
-        announcement_title = Label(
-            text="Announcements:",
-            font_size=22,
-            color=(0, 0, 0, 1),
-            bold=True,
-            size_hint=(0.8, 0.1),
-            pos_hint={'center_x': 0.5, 'top': 0.8}
-        )
-        self.add_widget(announcement_title)
-
-        # Announcement container with rounded corners
-        self.announcement_box = ScrollView(
-            size_hint=(0.9, 0.6),
-            pos_hint={'center_x': 0.5, 'top': 0.7},
-            bar_width=10,
-            bar_color=(0.2, 0.6, 0.8, 1),
-            bar_inactive_color=(0.2, 0.6, 0.8, 0.5),
-            effect_cls='ScrollEffect',
-            scroll_type=['bars', 'content']
-        )
-
-        self.announcement_layout = BoxLayout(
-            orientation='vertical',
-            spacing=10,
-            size_hint_y=None
-        )
-
-        self.announcement_box.add_widget(self.announcement_layout)
-
-        self.add_widget(self.announcement_box)
-
-         # Fetch and display announcements
-        self.display_announcements()
-
-        # Logout button
-        self.logout_button = RoundedButton(text="Logout", size_hint=(0.5, None), height=50,
-                                            on_press=self.logout,
-                                            pos_hint={'center_x': 0.5, 'bottom': 0.05})  # Position it at the bottom
-        self.add_widget(self.logout_button)
-
-    def display_announcements(self):
-        announcements = data.get('announcements', [])
-        if announcements:
-            for announcement in announcements:
-                announcement_label = Label(
-                    text=announcement.get('announcement', 'No message'),
-                    size_hint_y=None,
-                    height=40,
-                    color=(0, 0, 0, 1)  # Black text color for visibility
-                )
-                self.announcement_layout.add_widget(announcement_label)
-                self.announcement_layout.height += announcement_label.height
-        else:
-            no_announcement_label = Label(
-                text="No announcements available.",
-                size_hint_y=None,
-                height=40,
-                color=(1, 0, 0, 1)  # Red text color for "No announcements"
-            )
-            self.announcement_layout.add_widget(no_announcement_label)
-            self.announcement_layout.height += no_announcement_label.height
-
-    def logout(self, instance):
-        # Go back to the login screen
-        app = App.get_running_app()
-        app.root.clear_widgets()
-        app.root.add_widget(LoginScreen())
-
-class RepresentativeDashboardScreen(FloatLayout):
-    def __init__(self, rep_info, **kwargs):
-        super(RepresentativeDashboardScreen, self).__init__(**kwargs)
-        self.rep_info = rep_info
-
-        # Gradient background
-        gradient = Image(source='gradient_bg.png', allow_stretch=True, keep_ratio=False)
-        self.add_widget(gradient)
-
-        # Welcome message for representatives
-        welcome_label = Label(
-            text=f"Welcome {self.rep_info.get('name', 'Representative')}",  # Use self.rep_info here
-            font_size=24,
-            color=(0, 0, 0, 1),
-            bold=True,
-            size_hint=(0.8, 0.1),
-            pos_hint={'center_x': 0.5, 'top': 0.9}
-        )
-        self.add_widget(welcome_label)
-
-        # Layout for buttons
-        button_layout = BoxLayout(orientation='vertical', spacing=20, size_hint=(0.8, 0.3),
-                                  pos_hint={'center_x': 0.5, 'top': 0.5})
-
-        # Post Announcement Button
-        post_announcement_button = RoundedButton(text="Post Announcement", size_hint=(1, None), height=50,
-                                                 on_press=self.post_announcement)
-        button_layout.add_widget(post_announcement_button)
-
-        # Logout Button
-        logout_button = RoundedButton(text="Logout", size_hint=(1, None), height=50,
-                                      on_press=self.confirm_logout)
-        button_layout.add_widget(logout_button)
-
-        self.add_widget(button_layout)
-
-    def confirm_logout(self, instance):
-        # Create a confirmation popup
-        content = BoxLayout(orientation='vertical', padding=10)
-        content.add_widget(Label(text="Are you sure you want to logout?", size_hint_y=None, height=40))
-        
-        button_layout = BoxLayout(orientation='horizontal', spacing=10)
-
-        yes_button = Button(text="Yes", on_press=self.logout)
-        no_button = Button(text="No", on_press=lambda x: self.popup.dismiss())
-
-        button_layout.add_widget(yes_button)
-        button_layout.add_widget(no_button)
-        content.add_widget(button_layout)
-
-        self.popup = Popup(title="Logout Confirmation", content=content, size_hint=(0.8, 0.4))
-        self.popup.open()
-
-    def logout(self, instance):
-        # Go back to the login screen
-        app = App.get_running_app()
-        app.root.clear_widgets()
-        app.root.add_widget(LoginScreen())
-
-    def post_announcement(self, instance):
-        # Create a popup for entering an announcement
-        content = BoxLayout(orientation='vertical', spacing=10, padding=10)
-
-        self.announcement_input = TextInput(hint_text="Enter Announcement", size_hint=(1, None), height=100)
-        content.add_widget(self.announcement_input)
-
-        # Add Submit and Cancel buttons
-        button_layout = BoxLayout(orientation='horizontal', spacing=10)
-
-        submit_button = Button(text="Submit", on_press=self.submit_announcement)
-        cancel_button = Button(text="Cancel", on_press=lambda x: self.popup.dismiss())
-        
-        button_layout.add_widget(submit_button)
-        button_layout.add_widget(cancel_button)
-
-        content.add_widget(button_layout)
-
-        self.popup = Popup(title="Post Announcement", content=content, size_hint=(0.8, 0.5))
-        self.popup.open()
-
-    def submit_announcement(self, instance):
-        announcement = self.announcement_input.text
-
-        if announcement:
-            # Add the announcement to the data
-            data['announcements'].append({
-                'department': self.rep_info.get('department_name', 'Unknown Department'),
-                'announcement': announcement
-            })
-
-            # Save the updated data to the JSON file
-            with open('student_data.json', 'w') as f:
-                json.dump(data, f, indent=4)
-
-            # Close the popup
-            self.popup.dismiss()
-
-            # Show success message
-            popup = Popup(title="Success",
-                          content=Label(text="Announcement posted successfully!"),
-                          size_hint=(None, None), size=(400, 200))
-            popup.open()
-
-            # Notify the user about the new announcement
-            try:
-                notification.notify(
-                    title="New Announcement",
-                    message=announcement,
-                    timeout=10  # Display notification for 10 seconds
-                )
-            except Exception as e:
-                print(f"Failed to send notification: {e}")
-
-        else:
-            # Error handling if announcement is empty
-            popup = Popup(title="Error",
-                          content=Label(text="Announcement cannot be empty!"),
-                          size_hint=(None, None), size=(400, 200))
-            popup.open()
-
-class RegistrationScreen(FloatLayout):
-    def __init__(self, **kwargs):
-        super(RegistrationScreen, self).__init__(**kwargs)
-        # Placeholder for registration screen
-        self.add_widget(Label(text="Registration Screen"))
-
-        # Add gradient background
-        
-        gradient = Image(source='gradient_bg.png', allow_stretch=True, keep_ratio=False)
-        self.add_widget(gradient)
-
-        # Add logo image
-        logo = Image(source='icct_logo.png', size_hint=(0.5, 0.3), pos_hint={'center_x': 0.5, 'top': 0.9})
-        self.add_widget(logo)
-
-        # Title label
-        title_label = Label(text="Register as Department Representative",
-                            font_size=28, bold=True,
-                            size_hint=(0.8, 0.1),
-                            pos_hint={'center_x': 0.5, 'top': 0.8},
-                            color=(0, 0, 0, 1))  # Dark text color
-        self.add_widget(title_label)
-
-        # Layout for form elements
-        form_layout = BoxLayout(orientation='vertical', spacing=15, size_hint=(0.8, 0.5), pos_hint={'center_x': 0.5, 'top': 0.65})
-
-        # Department Name input
-        self.department_name_input = TextInput(hint_text="Enter Department Name",
-                                               multiline=False, size_hint=(1, 0.2),
-                                               background_color=(1, 1, 1, 0.7),
-                                               padding_y=[10, 10],
-                                               foreground_color=(0, 0, 0, 1),
-                                               hint_text_color=(0.5, 0.5, 0.5, 1))
-        form_layout.add_widget(self.department_name_input)
-
-        # Username input
-        self.username_input = TextInput(hint_text="Enter Department Username",
-                                        multiline=False, size_hint=(1, 0.2),
-                                        background_color=(1, 1, 1, 0.7),
-                                        padding_y=[10, 10],
-                                        foreground_color=(0, 0, 0, 1),
-                                        hint_text_color=(0.5, 0.5, 0.5, 1))
-        form_layout.add_widget(self.username_input)
-
-        # Password input
-        self.password_input = TextInput(hint_text="Enter Password", password=True,
-                                        multiline=False, size_hint=(1, 0.2),
-                                        background_color=(1, 1, 1, 0.7),
-                                        padding_y=[10, 10],
-                                        foreground_color=(0, 0, 0, 1),
-                                        hint_text_color=(0.5, 0.5, 0.5, 1))
-        form_layout.add_widget(self.password_input)
-
-        # Confirm button
-        confirm_button = RoundedButton(text="Confirm Registration", size_hint=(1, None), height=50,
-                                       on_press=self.register_rep)
-        form_layout.add_widget(confirm_button)
-
-        # Back button
-        back_button = RoundedButton(text="Back", size_hint=(1, None), height=50,
-                                    on_press=self.back_to_login)
-        form_layout.add_widget(back_button)
-
-        # Error message label
-        self.error_message = Label(text='', color=(1, 0, 0, 1), size_hint=(1, None), height=30, pos_hint={'center_x': 0.5, 'top': 0.2})
-        self.add_widget(self.error_message)
-
-        self.add_widget(form_layout)
-
-    def register_rep(self, instance):
-        department_name = self.department_name_input.text
-        username = self.username_input.text
-        password = hash_password(self.password_input.text)
-
-        # Validate fields
-        if department_name and username and password:
-            # Add new representative to data
-            data['representatives'].append({
-                'department_name': department_name,
-                'username': username,
-                'password': password
-            })
-
-            # Save to JSON
-            with open('student_data.json', 'w') as f:
-                json.dump(data, f, indent=4)
-
-            # Success message
-            popup = Popup(title='Registration Successful',
-                          content=Label                          (text='You have successfully registered as a Department Representative.'),
-                          size_hint=(None, None), size=(400, 200))
-            popup.open()
-            self.back_to_login(None)
-        else:
-            self.error_message.text = 'Please fill in all fields.'
-
-    def back_to_login(self, instance):
-        self.clear_widgets()
-        self.add_widget(LoginScreen())
-
-class StudentRegistrationScreen(FloatLayout):
-    def __init__(self, **kwargs):
-        super(StudentRegistrationScreen, self).__init__(**kwargs)
-        # Placeholder for student registration screen
-        self.add_widget(Label(text="Student Registration Screen"))
-
-        # Add gradient background
-        gradient = Image(source='gradient_bg.png', allow_stretch=True, keep_ratio=False)
-        self.add_widget(gradient)
-
-        # Add logo image
-        logo = Image(source='icct_logo.png', size_hint=(0.5, 0.3), pos_hint={'center_x': 0.5, 'top': 0.9})
-        self.add_widget(logo)
-
-        # Title label
-        title_label = Label(text="Register as Student",
-                            font_size=28, bold=True,
-                            size_hint=(0.8, 0.1),
-                            pos_hint={'center_x': 0.5, 'top': 0.8},
-                            color=(0, 0, 0, 1))  # Dark text color
-        self.add_widget(title_label)
-
-        # Layout for form elements
-        form_layout = BoxLayout(orientation='vertical', spacing=15, size_hint=(0.8, 0.5), pos_hint={'center_x': 0.5, 'top': 0.65})
-
-        # Name input
-        self.name_input = TextInput(hint_text="Enter Full Name",
-                                    multiline=False, size_hint=(1, 0.2),
-                                    background_color=(1, 1, 1, 0.7),
-                                    padding_y=[10, 10],
-                                    foreground_color=(0, 0, 0, 1),
-                                    hint_text_color=(0.5, 0.5, 0.5, 1))
-        form_layout.add_widget(self.name_input)
-
-        # Student number input
-        self.student_number_input = TextInput(hint_text="Enter Student Number",
-                                              multiline=False, size_hint=(1, 0.2),
-                                              background_color=(1, 1, 1, 0.7),
-                                              padding_y=[10, 10],
-                                              foreground_color=(0, 0, 0, 1),
-                                              hint_text_color=(0.5, 0.5, 0.5, 1))
-        form_layout.add_widget(self.student_number_input)
-
-         # Add email input field
-        self.email_input = TextInput(hint_text="Enter Email",
-                                     multiline=False, size_hint=(1, 0.2),
-                                     background_color=(1, 1, 1, 0.7),
-                                     padding_y=[10, 10],
-                                     foreground_color=(0, 0, 0, 1),
-                                     hint_text_color=(0.5, 0.5, 0.5, 1))
-        form_layout.add_widget(self.email_input)
-
-        # Section input
-        self.section_input = TextInput(hint_text="Enter Section",
-                                       multiline=False, size_hint=(1, 0.2),
-                                       background_color=(1, 1, 1, 0.7),
-                                       padding_y=[10, 10],
-                                       foreground_color=(0, 0, 0, 1),
-                                       hint_text_color=(0.5, 0.5, 0.5, 1))
-        form_layout.add_widget(self.section_input)
-
-        # Password input
-        self.password_input = TextInput(hint_text="Enter Password", password=True,
-                                        multiline=False, size_hint=(1, 0.2),
-                                        background_color=(1, 1, 1, 0.7),
-                                        padding_y=[10, 10],
-                                        foreground_color=(0, 0, 0, 1),
-                                        hint_text_color=(0.5, 0.5, 0.5, 1))
-        form_layout.add_widget(self.password_input)
-
-        # Confirm button
-        confirm_button = RoundedButton(text="Confirm Registration", size_hint=(1, None), height=50,
-                                       on_press=self.register_student)
-        form_layout.add_widget(confirm_button)
-
-        # Back button
-        back_button = RoundedButton(text="Back", size_hint=(1, None), height=50,
-                                    on_press=self.back_to_login)
-        form_layout.add_widget(back_button)
-
-        # Error message label
-        self.error_message = Label(text='', color=(1, 0, 0, 1), size_hint=(1, None), height=30, pos_hint={'center_x': 0.5, 'top': 0.2})
-        self.add_widget(self.error_message)
-
-        self.add_widget(form_layout)
-
-    def register_student(self, instance):
-        name = self.name_input.text
-        student_number = self.student_number_input.text
-        section = self.section_input.text
-        password = hash_password(self.password_input.text)
-        email = self.email_input.text  # Get the email from the email input field
-
-        # Validate fields
-        if name and student_number and section and password and email:
-            # Add new student to data
-            data['students'].append({
-                'name': name,
-                'student_number': student_number,
-                'section': section,
-                'password': password,
-                'email': email  # Add the email to the student data
-            })
-
-            # Save to JSON
-            with open('student_data.json', 'w') as f:
-                json.dump(data, f, indent=4)
-
-            # Send email notification
-            self.send_email_notification(name, email)
-
-            # Success message
-            popup = Popup(title='Registration Successful',
-                          content=Label(text='You have successfully registered as a student.'),
-                          size_hint=(None, None), size=(400, 200))
-            popup.open()
-            self.back_to_login(None)
-        else:
-            self.error_message.text = 'Please fill in all fields.'
-
-    def send_email_notification(self, name, email):
-        # Email configuration
-        sender_email = os.getenv('SENDER_EMAIL')
-        sender_password = os.getenv('SENDER_PASSWORD')
-        smtp_server = 'smtp.gmail.com'
-        smtp_port = 587
-
-        # Create message
-        msg = MIMEMultipart()
-        msg['From'] = sender_email
-        msg['To'] = email
-        msg['Subject'] = 'Registration Successful'
-
-        body = f'Dear {name},\n\nYou have successfully registered as a student.\n\nBest regards,\nICCT College'
-        msg.attach(MIMEText(body, 'plain'))
-
-        # Send email
-        try:
-            server = smtplib.SMTP(smtp_server, smtp_port)
-            server.starttls()
-            server.login(sender_email, sender_password)
-            text = msg.as_string()
-            server.sendmail(sender_email, email, text)
-        except Exception as e:
-            print(f"Failed to send email: {e}")
-        finally:
-            server.quit()
-
-    def back_to_login(self, instance):
-        self.clear_widgets()
-        self.add_widget(LoginScreen())
-
-class MyApp(App):
-    def build(self):
-        return LoginScreen()
-
-if __name__ == '__main__':
+# Imported first so startup timings begin as early as possible
+import startup
+import os
+import sys
+import threading
+import time
+from kivy.app import App
+from kivy.uix.boxlayout import BoxLayout
+from kivy.uix.label import Label
+from kivy.uix.textinput import TextInput
+from kivy.uix.button import Button
+from kivy.uix.floatlayout import FloatLayout
+from kivy.uix.image import Image
+from kivy.core.image import Image as CoreImage
+from kivy.core.window import Window
+from kivy.graphics import Color, RoundedRectangle
+from kivy.clock import Clock, mainthread
+from kivy.properties import BooleanProperty, NumericProperty, StringProperty
+from kivy.uix.recycleview import RecycleView
+from kivy.uix.recycleboxlayout import RecycleBoxLayout
+import auth
+import events
+import feeds
+import instrumentation
+import services
+import sessions
+from readstate import ReadState
+from storage import LazyStore
+
+# Popups, animations, notifications and mail are imported where they are
+# first used, to keep them off the path to the first frame
+
+startup.record('imports', startup.since_start())
+
+# Set window background color (ICCT color scheme example)
+Window.clearcolor = (0.9, 0.9, 1, 1)  # Light blue background
+
+# The student, representative and announcement store (JSON file or SQLite, see IEMS_STORAGE).
+# It is opened in the background once the login screen is up.
+store = LazyStore()
+
+# What the screens send their requests to: the store above, or a shared
+# server when IEMS_SERVER is set to its host:port (see server.py)
+SERVER_ADDRESS = os.getenv('IEMS_SERVER')
+if SERVER_ADDRESS:
+    from client import ServiceClient
+    service = ServiceClient(SERVER_ADDRESS)
+else:
+    service = services.LocalService(store)
+
+# Hand the result of a background job (a Future) to callback on the UI thread.
+# If the job failed, the error is shown and `failed` is called instead.
+def when_done(future, callback, failed=None):
+    def finish(dt):
+        try:
+            result = future.result()
+        except Exception as e:
+            show_message("Error", str(e))
+            if failed is not None:
+                failed()
+            return
+        callback(result)
+
+    future.add_done_callback(lambda f: Clock.schedule_once(finish))
+
+# Decoded images shared by every screen, so each file is only decoded once
+textures = {}
+
+def shared_texture(source):
+    texture = textures.get(source)
+    if texture is None:
+        texture = textures[source] = CoreImage(source).texture
+    return texture
+
+def background_image():
+    return Image(texture=shared_texture('gradient_bg.png'), allow_stretch=True, keep_ratio=False)
+
+def logo_image():
+    return Image(texture=shared_texture('icct_logo.png'), size_hint=(0.5, 0.3), pos_hint={'center_x': 0.5, 'top': 0.9})
+
+# Show a short message in a popup
+def show_message(title, text):
+    from kivy.uix.popup import Popup
+    popup = Popup(title=title,
+                  content=Label(text=text),
+                  size_hint=(None, None), size=(400, 200))
+    popup.open()
+
+class RoundedButton(Button):
+    def __init__(self, **kwargs):
+        super(RoundedButton, self).__init__(**kwargs)
+
+        # Draw the background once; layout and animation only move the existing rectangle
+        with self.canvas.before:
+            self.rect_color = Color(0.2, 0.6, 0.8, 1)  # Change to desired color
+            self.rect = RoundedRectangle(pos=self.pos, size=self.size, radius=[20])
+        self.bind(size=self._update_rect, pos=self._update_rect)
+
+    def _update_rect(self, instance, value):
+        self.rect.pos = self.pos
+        self.rect.size = self.size
+
+    def animate_button_press(self, instance):
+        from kivy.animation import Animation
+        anim = Animation(size=(self.width * 1.05, self.height * 1.05), t='out_back', duration=0.1)
+        anim.start(self)
+
+    def animate_button_release(self, instance):
+        from kivy.animation import Animation
+        anim = Animation(size=(self.width, self.height), t='out_back', duration=0.1)
+        anim.start(self)
+
+# How often to check the store for announcements posted by other app instances
+REFRESH_INTERVAL = 2
+
+# How many announcements are fetched at a time as the student scrolls back
+ANNOUNCEMENT_PAGE_SIZE = services.FEED_PAGE_SIZE
+ANNOUNCEMENT_ROW_HEIGHT = 40
+ANNOUNCEMENT_SPACING = 10
+
+# Seconds of no typing before the search box runs its search
+SEARCH_DELAY = 0.3
+
+# Unread announcements are shown bold in this color
+UNREAD_COLOR = (0.1, 0.3, 0.8, 1)
+
+class AnnouncementFeed(RecycleView):
+    # Only the rows in view get Label widgets, and they are reused as the list scrolls.
+    # Newest announcements are at the top; older pages are fetched on reaching the bottom.
+    def __init__(self, **kwargs):
+        super(AnnouncementFeed, self).__init__(**kwargs)
+        self.viewclass = 'Label'
+
+        layout = RecycleBoxLayout(orientation='vertical',
+                                  spacing=ANNOUNCEMENT_SPACING,
+                                  default_size=(None, ANNOUNCEMENT_ROW_HEIGHT),
+                                  default_size_hint=(1, None),
+                                  size_hint_y=None)
+        layout.bind(minimum_height=layout.setter('height'))
+        self.add_widget(layout)
+
+        self.oldest_id = None
+        self.exhausted = False
+        self.empty = False
+        self.query = None
+        self.loading = False
+        self.generation = 0  # bumped on reset, so pages requested before it are dropped
+
+        # Unread announcements are highlighted when this is set (a readstate.ReadState),
+        # and on_shown is called with each batch of announcements put on screen
+        self.read_state = None
+        self.on_shown = None
+        self.bind(scroll_y=self._on_scroll_y)
+
+    def announcement_row(self, announcement):
+        unread = self.read_state is not None and not self.read_state.is_read(announcement.get('id', 0))
+        return {
+            'text': announcement.get('announcement', 'No message'),
+            'color': UNREAD_COLOR if unread else (0, 0, 0, 1),  # Black text color for visibility
+            'bold': unread
+        }
+
+    # Take the highlighting off every row
+    def show_all_read(self):
+        if not self.empty:
+            self.data = [dict(row, color=(0, 0, 0, 1), bold=False) for row in self.data]
+
+    def content_height(self, rows):
+        return max(rows * (ANNOUNCEMENT_ROW_HEIGHT + ANNOUNCEMENT_SPACING) - ANNOUNCEMENT_SPACING, 0)
+
+    # With a query, show the matching announcements (best match first) instead of the latest
+    def reset(self, query=None):
+        self.query = query or None
+        self.oldest_id = None
+        self.exhausted = False
+        self.empty = False
+        self.loading = False
+        self.generation += 1
+        self.data = []
+        self.scroll_y = 1
+        self.load_page()
+
+    # Ask for the next page; it is added when it arrives
+    def load_page(self):
+        if self.loading or self.exhausted:
+            return
+        self.loading = True
+        generation = self.generation
+        if self.query:
+            future = service.call('search_announcements', App.get_running_app().session_token,
+                                  self.query, len(self.data), ANNOUNCEMENT_PAGE_SIZE)
+            when_done(future, lambda result: self.show_page(generation, result[1]),
+                      lambda: self.page_failed(generation))
+        else:
+            future = service.call('load_feed', App.get_running_app().session_token,
+                                  self.oldest_id, ANNOUNCEMENT_PAGE_SIZE)
+            when_done(future, lambda announcements: self.show_page(generation, announcements),
+                      lambda: self.page_failed(generation))
+
+    @instrumentation.timed('ui.show_page')
+    def show_page(self, generation, announcements):
+        if generation != self.generation:
+            # The feed was reset while this page was on its way
+            return
+        self.loading = False
+        if len(announcements) < ANNOUNCEMENT_PAGE_SIZE:
+            self.exhausted = True
+        if not announcements:
+            if not self.data:
+                self.empty = True
+                self.data = [{
+                    'text': "No matching announcements." if self.query else "No announcements available.",
+                    'color': (1, 0, 0, 1),  # Red text color for "No announcements"
+                    'bold': False
+                }]
+            return
+        self.oldest_id = announcements[-1]['id']
+
+        # Keep the rows currently in view where they are while the list grows below them
+        offset = (1 - self.scroll_y) * max(self.content_height(len(self.data)) - self.height, 0)
+        self.data.extend(self.announcement_row(announcement) for announcement in announcements)
+        scrollable = self.content_height(len(self.data)) - self.height
+        if scrollable > 0:
+            self.scroll_y = 1 - offset / scrollable
+        if self.on_shown is not None:
+            self.on_shown(announcements)
+
+    def page_failed(self, generation):
+        if generation == self.generation:
+            self.loading = False
+
+    # Put newly posted announcements (oldest first) at the top without reloading the rest
+    def add_new(self, announcements):
+        if self.query or (self.loading and self.oldest_id is None):
+            # Search results stay as they are until the search changes, and
+            # a first page still on its way will include these anyway
+            return
+        if self.empty:
+            self.data = []
+            self.empty = False
+        self.data[0:0] = [self.announcement_row(announcement) for announcement in reversed(announcements)]
+        if self.on_shown is not None:
+            self.on_shown(announcements)
+
+    def _on_scroll_y(self, instance, scroll_y):
+        if scroll_y <= 0 and not self.exhausted:
+            self.load_page()
+
+class EventRow(BoxLayout):
+    # A row of the events list: a heading, or an event with an RSVP button when
+    # `event_id` is set (events that have already ended don't get one)
+    text = StringProperty('')
+    bold = BooleanProperty(False)
+    event_id = NumericProperty(0)
+
+    def __init__(self, **kwargs):
+        super(EventRow, self).__init__(orientation='horizontal', spacing=10, **kwargs)
+        self.label = Label(halign='left', valign='middle')
+        self.label.bind(size=self.label.setter('text_size'))
+        self.add_widget(self.label)
+        self.rsvp_button = Button(text="RSVP", size_hint=(None, 1), width=80, on_press=self.rsvp)
+        self.add_widget(self.rsvp_button)
+        self.bind(text=self.label.setter('text'), bold=self.label.setter('bold'), event_id=self._show_button)
+        self._show_button(self, self.event_id)
+
+    def _show_button(self, instance, event_id):
+        self.rsvp_button.disabled = not event_id
+        self.rsvp_button.opacity = 1 if event_id else 0
+
+    def rsvp(self, instance):
+        when_done(service.call('rsvp', App.get_running_app().session_token, int(self.event_id)),
+                  self.finish_rsvp)
+
+    def finish_rsvp(self, result):
+        counts, error = result
+        if error:
+            show_message("Error", error)
+            return
+        show_message("RSVP", f"You're on the list.\n{format_attendance(counts)}")
+
+# An event's places taken and how many have RSVPed and checked in (see services.attendance)
+def format_attendance(counts):
+    places = f"{counts['taken']} of {counts['capacity']}" if counts['capacity'] is not None else str(counts['taken'])
+    return f"{places} places taken, {counts['rsvps']} RSVPs, {counts['checked_in']} checked in"
+
+# Text field in the style shared by the forms; keyword arguments override the defaults
+def form_input(hint_text, **kwargs):
+    options = {
+        'multiline': False,
+        'size_hint': (1, 0.2),
+        'background_color': (1, 1, 1, 0.7),
+        'padding_y': [10, 10],
+        'foreground_color': (0, 0, 0, 1),
+        'hint_text_color': (0.5, 0.5, 0.5, 1),
+    }
+    options.update(kwargs)
+    return TextInput(hint_text=hint_text, **options)
+
+class Navigator(FloatLayout):
+    # The app's root widget. Each screen is built once, then reset and swapped
+    # back in whenever it is shown again.
+    def __init__(self, **kwargs):
+        super(Navigator, self).__init__(**kwargs)
+        self.screens = {}
+
+    def show(self, screen_cls, *args):
+        screen = self.screens.get(screen_cls)
+        if screen is None:
+            with instrumentation.span(f'ui.build.{screen_cls.__name__}'):
+                screen = self.screens[screen_cls] = screen_cls()
+        screen.reset(*args)
+        self.clear_widgets()
+        self.add_widget(screen)
+        return screen
+
+# Switch to a screen, passing any arguments on to its reset()
+def navigate(screen_cls, *args):
+    return App.get_running_app().root.show(screen_cls, *args)
+
+# Keep the session from logging in (or a relaunch) and open its dashboard
+def start_session(session):
+    app = App.get_running_app()
+    app.session_token = session['token']
+    sessions.remember(session['token'])
+    if session['user_type'] == "student":
+        navigate(DashboardScreen, session['user'])
+    else:
+        navigate(RepresentativeDashboardScreen, session['user'])
+
+# End the session and go back to the login screen
+def end_session():
+    app = App.get_running_app()
+    if app.session_token:
+        service.call('logout', app.session_token)
+        app.session_token = None
+    sessions.forget()
+    navigate(LoginScreen)
+
+class LoginScreen(FloatLayout):
+    def __init__(self, **kwargs):
+        super(LoginScreen, self).__init__(**kwargs)
+
+        self.add_widget(background_image())
+        self.add_widget(logo_image())
+
+        title_label = Label(text="ICCT College Event Management System",
+                            font_size=32, bold=True,
+                            size_hint=(0.8, 0.1),
+                            pos_hint={'center_x': 0.5, 'top': 0.85},
+                            color=(0, 0, 0, 1))
+        self.add_widget(title_label)
+
+        form_layout = BoxLayout(orientation='vertical', spacing=20, size_hint=(0.8, 0.5), pos_hint={'center_x': 0.5, 'top': 0.65})
+
+        self.user_type_input = form_input("Enter 'student' or 'representative'", size_hint=(1, None), height=40,
+                                          background_color=(1, 1, 1, 0.9))
+        form_layout.add_widget(self.user_type_input)
+
+        self.student_number_input = form_input("Enter Student Number or Username", size_hint=(1, None), height=40,
+                                               background_color=(1, 1, 1, 0.9))
+        form_layout.add_widget(self.student_number_input)
+
+        self.password_input = form_input("Enter Password", password=True, size_hint=(1, None), height=40,
+                                         background_color=(1, 1, 1, 0.9))
+        form_layout.add_widget(self.password_input)
+
+        self.login_button = RoundedButton(text="Login", size_hint=(1, None), height=50,
+                                          on_press=self.validate_user)
+        form_layout.add_widget(self.login_button)
+
+        self.register_button = RoundedButton(text="Register as Representative", size_hint=(1, None), height=50,
+                                             on_press=self.show_registration)
+        form_layout.add_widget(self.register_button)
+
+        self.register_student_button = RoundedButton(text="Register as Student", size_hint=(1, None), height=50,
+                                                     on_press=self.show_student_registration)
+        form_layout.add_widget(self.register_student_button)
+
+        self.error_message = Label(text='', color=(1, 0, 0, 1), size_hint=(1, None), height=30, pos_hint={'center_x': 0.5, 'top': 0.2})
+        self.add_widget(self.error_message)
+
+        self.add_widget(form_layout)
+
+    def reset(self):
+        self.user_type_input.text = ''
+        self.student_number_input.text = ''
+        self.password_input.text = ''
+        self.error_message.text = ''
+        self.login_button.disabled = False
+
+    @instrumentation.timed('ui.validate_user')
+    def validate_user(self, instance):
+        self.error_message.text = ''
+        user_type = self.user_type_input.text.lower()
+        password = self.password_input.text
+
+        # Checking the password is deliberately slow, so it runs off the UI thread
+        self.login_button.disabled = True
+        when_done(service.call('login', user_type, self.student_number_input.text, password),
+                  self.finish_login,
+                  lambda: setattr(self.login_button, 'disabled', False))
+
+    def finish_login(self, result):
+        self.login_button.disabled = False
+        session, error = result
+        if error:
+            self.error_message.text = error
+            return
+        start_session(session)
+
+    def show_registration(self, instance):
+        navigate(RegistrationScreen)
+
+    def show_student_registration(self, instance):
+        navigate(StudentRegistrationScreen)
+
+class DashboardScreen(FloatLayout):
+    def __init__(self, **kwargs):
+        super(DashboardScreen, self).__init__(**kwargs)
+
+         # Gradient background
+        self.add_widget(background_image())
+
+        # Welcome message for students
+        self.welcome_label = Label(
+            font_size=24,
+            color=(0, 0, 0, 1),
+            bold=True,
+            size_hint=(0.8, 0.1),
+            pos_hint={'center_x': 0.5, 'top': 0.9}
+        )
+        self.add_widget(self.welcome_label)
+
+         # Announcement Section Title, with the unread count
+        self.announcement_title = Label(
+            text="Announcements:",
+            font_size=22,
+            color=(0, 0, 0, 1),
+            bold=True,
+            size_hint=(0.8, 0.1),
+            pos_hint={'center_x': 0.5, 'top': 0.8}
+        )
+        self.add_widget(self.announcement_title)
+
+        self.mark_all_button = RoundedButton(text="Mark all read", size_hint=(0.2, None), height=40,
+                                             on_press=self.mark_all_read,
+                                             pos_hint={'right': 0.95, 'top': 0.79})
+        self.add_widget(self.mark_all_button)
+
+        # This week's and upcoming events
+        self.add_widget(RoundedButton(text="Events", size_hint=(0.2, None), height=40,
+                                      on_press=self.show_events,
+                                      pos_hint={'x': 0.05, 'top': 0.79}))
+
+        # Search box; the feed is filtered once typing pauses
+        self.search_input = form_input("Search announcements", size_hint=(0.9, None), height=40,
+                                       pos_hint={'center_x': 0.5, 'top': 0.72})
+        self.search_trigger = Clock.create_trigger(self.search_announcements, SEARCH_DELAY)
+        self.search_input.bind(text=lambda instance, text: self.search_trigger())
+        self.add_widget(self.search_input)
+
+        # Announcement list; only the visible rows are turned into widgets
+        self.announcement_feed = AnnouncementFeed(
+            size_hint=(0.9, 0.55),
+            pos_hint={'center_x': 0.5, 'top': 0.65},
+            bar_width=10,
+            bar_color=(0.2, 0.6, 0.8, 1),
+            bar_inactive_color=(0.2, 0.6, 0.8, 0.5),
+            effect_cls='ScrollEffect',
+            scroll_type=['bars', 'content']
+        )
+        self.announcement_feed.on_shown = self.mark_seen
+        self.add_widget(self.announcement_feed)
+
+        # Logout button
+        self.logout_button = RoundedButton(text="Logout", size_hint=(0.5, None), height=50,
+                                            on_press=self.logout,
+                                            pos_hint={'center_x': 0.5, 'bottom': 0.05})  # Position it at the bottom
+        self.add_widget(self.logout_button)
+
+    def reset(self, student_info):
+        self.welcome_label.text = f"Welcome {student_info.get('name', 'Student')}, Section: {student_info.get('section', 'N/A')}"
+        self.audiences = feeds.student_audiences(student_info)
+
+        # Find out what the student has read, fetch and display announcements, then listen for new ones
+        self.search_input.text = ''
+        self.search_trigger.cancel()
+        self.announcement_feed.read_state = None
+        self.show_unread(None)
+        when_done(service.call('read_status', App.get_running_app().session_token),
+                  self.show_read_status, self.display_announcements)
+        service.unsubscribe(self.on_new_announcements)
+        service.subscribe(self.on_new_announcements)
+
+    def show_read_status(self, status):
+        self.show_unread(status)
+        if status is not None:
+            self.announcement_feed.read_state = ReadState.decode(status['read_state'])
+        self.display_announcements()
+
+    def show_unread(self, status):
+        if status and status['unread']:
+            self.announcement_title.text = f"Announcements ({status['unread']} unread):"
+        else:
+            self.announcement_title.text = "Announcements:"
+
+    @instrumentation.timed('ui.display_announcements')
+    def display_announcements(self):
+        # Show the newest page; older ones are loaded as the student scrolls down
+        self.announcement_feed.reset()
+
+    # Announcements count as read once they have been on screen; they stay
+    # highlighted until the dashboard is next opened
+    def mark_seen(self, announcements):
+        read_state = self.announcement_feed.read_state
+        if read_state is None:
+            return
+        unread = [announcement['id'] for announcement in announcements
+                  if not read_state.is_read(announcement['id'])]
+        if unread:
+            when_done(service.call('mark_read', App.get_running_app().session_token, unread), self.show_unread)
+
+    def mark_all_read(self, instance):
+        when_done(service.call('mark_all_read', App.get_running_app().session_token), self.finish_mark_all_read)
+
+    def finish_mark_all_read(self, status):
+        self.show_unread(status)
+        if status is not None:
+            self.announcement_feed.read_state = ReadState.decode(status['read_state'])
+        self.announcement_feed.show_all_read()
+
+    def search_announcements(self, *args):
+        self.announcement_feed.reset(self.search_input.text.strip())
+
+    # Fetch this week's events, then the ones after it, then show both
+    def show_events(self, instance):
+        week_start, week_end = events.week_of(time.time())
+        when_done(service.call('events_between', week_start, week_end),
+                  lambda this_week: when_done(service.call('upcoming_events', week_end),
+                                              lambda later: self.show_events_popup(this_week, later, week_end)))
+
+    def show_events_popup(self, this_week, later, week_end):
+        now = time.time()
+
+        def event_row(event):
+            return {'text': events.format_event(event), 'bold': False,
+                    'event_id': event['id'] if event['end'] > now else 0}
+
+        rows = [{'text': "This week", 'bold': True, 'event_id': 0}]
+        rows += [event_row(event) for event in this_week] or [{'text': "Nothing on this week", 'bold': False,
+                                                              'event_id': 0}]
+        # Events running on from this week are already listed above
+        later = [event for event in later if event['start'] >= week_end]
+        if later:
+            rows.append({'text': "Coming up", 'bold': True, 'event_id': 0})
+            rows += [event_row(event) for event in later]
+
+        event_list = RecycleView(viewclass=EventRow)
+        layout = RecycleBoxLayout(orientation='vertical', default_size=(None, 30), default_size_hint=(1, None),
+                                  size_hint_y=None)
+        layout.bind(minimum_height=layout.setter('height'))
+        event_list.add_widget(layout)
+        event_list.data = rows
+
+        from kivy.uix.popup import Popup
+        Popup(title="Events", content=event_list, size_hint=(0.9, 0.7)).open()
+
+    # Posts can be published from worker threads, so hop onto the UI thread first
+    @mainthread
+    def on_new_announcements(self, announcements):
+        # Only those for this student, as in their feed
+        announcements = [announcement for announcement in announcements
+                         if feeds.is_for(announcement, self.audiences)]
+        if announcements:
+            self.announcement_feed.add_new(announcements)
+
+    def logout(self, instance):
+        service.unsubscribe(self.on_new_announcements)
+        end_session()
+
+class RepresentativeDashboardScreen(FloatLayout):
+    def __init__(self, **kwargs):
+        super(RepresentativeDashboardScreen, self).__init__(**kwargs)
+        self.rep_info = {}
+
+        # Gradient background
+        self.add_widget(background_image())
+
+        # Welcome message for representatives
+        self.welcome_label = Label(
+            font_size=24,
+            color=(0, 0, 0, 1),
+            bold=True,
+            size_hint=(0.8, 0.1),
+            pos_hint={'center_x': 0.5, 'top': 0.9}
+        )
+        self.add_widget(self.welcome_label)
+
+        # Layout for buttons
+        button_layout = BoxLayout(orientation='vertical', spacing=20, size_hint=(0.8, 0.4),
+                                  pos_hint={'center_x': 0.5, 'top': 0.6})
+
+        # Post Announcement Button
+        post_announcement_button = RoundedButton(text="Post Announcement", size_hint=(1, None), height=50,
+                                                 on_press=self.post_announcement)
+        button_layout.add_widget(post_announcement_button)
+
+        # Create Event Button
+        create_event_button = RoundedButton(text="Create Event", size_hint=(1, None), height=50,
+                                            on_press=self.create_event)
+        button_layout.add_widget(create_event_button)
+
+        # Check-in Button, for scanning students in at an event
+        check_in_button = RoundedButton(text="Check In Students", size_hint=(1, None), height=50,
+                                        on_press=self.show_check_in)
+        button_layout.add_widget(check_in_button)
+
+        # Logout Button
+        logout_button = RoundedButton(text="Logout", size_hint=(1, None), height=50,
+                                      on_press=self.confirm_logout)
+        button_layout.add_widget(logout_button)
+
+        self.add_widget(button_layout)
+
+    def reset(self, rep_info):
+        self.rep_info = rep_info
+        self.welcome_label.text = f"Welcome {self.rep_info.get('name', 'Representative')}"  # Use self.rep_info here
+
+    def show_check_in(self, instance):
+        navigate(CheckInScreen, self.rep_info)
+
+    def confirm_logout(self, instance):
+        # Create a confirmation popup
+        content = BoxLayout(orientation='vertical', padding=10)
+        content.add_widget(Label(text="Are you sure you want to logout?", size_hint_y=None, height=40))
+        
+        button_layout = BoxLayout(orientation='horizontal', spacing=10)
+
+        yes_button = Button(text="Yes", on_press=self.logout)
+        no_button = Button(text="No", on_press=lambda x: self.popup.dismiss())
+
+        button_layout.add_widget(yes_button)
+        button_layout.add_widget(no_button)
+        content.add_widget(button_layout)
+
+        from kivy.uix.popup import Popup
+        self.popup = Popup(title="Logout Confirmation", content=content, size_hint=(0.8, 0.4))
+        self.popup.open()
+
+    def logout(self, instance):
+        self.popup.dismiss()
+        end_session()
+
+    def post_announcement(self, instance):
+        # Create a popup for entering an announcement
+        content = BoxLayout(orientation='vertical', spacing=10, padding=10)
+
+        self.announcement_input = TextInput(hint_text="Enter Announcement", size_hint=(1, None), height=100)
+        content.add_widget(self.announcement_input)
+
+        # Who it is for; the sections box only matters when posting to sections
+        from kivy.uix.spinner import Spinner
+        self.audience_spinner = Spinner(text=feeds.AUDIENCE_CHOICES[0], values=feeds.AUDIENCE_CHOICES,
+                                        size_hint=(1, None), height=40)
+        content.add_widget(self.audience_spinner)
+        self.sections_input = TextInput(hint_text="Sections, separated by commas", multiline=False,
+                                        size_hint=(1, None), height=40, disabled=True)
+        self.audience_spinner.bind(text=lambda spinner, text: setattr(self.sections_input, 'disabled',
+                                                                      text != 'Sections'))
+        content.add_widget(self.sections_input)
+
+        # Add Submit and Cancel buttons
+        button_layout = BoxLayout(orientation='horizontal', spacing=10)
+
+        submit_button = Button(text="Submit", on_press=self.submit_announcement)
+        cancel_button = Button(text="Cancel", on_press=lambda x: self.popup.dismiss())
+        
+        button_layout.add_widget(submit_button)
+        button_layout.add_widget(cancel_button)
+
+        content.add_widget(button_layout)
+
+        from kivy.uix.popup import Popup
+        self.popup = Popup(title="Post Announcement", content=content, size_hint=(0.8, 0.6))
+        self.popup.open()
+
+    @instrumentation.timed('ui.submit_announcement')
+    def submit_announcement(self, instance):
+        when_done(service.call('post_announcement', App.get_running_app().session_token,
+                               self.announcement_input.text,
+                               self.audience_spinner.text, self.sections_input.text),
+                  self.finish_announcement)
+
+    def finish_announcement(self, result):
+        announcement, error = result
+        if error:
+            # Error handling if announcement is empty
+            show_message("Error", error)
+            return
+
+        # Close the popup
+        self.popup.dismiss()
+
+        # Show success message
+        show_message("Success", "Announcement posted successfully!")
+
+        # Notify the user about the new announcement
+        try:
+            from plyer import notification
+            notification.notify(
+                title="New Announcement",
+                message=announcement['announcement'],
+                timeout=10  # Display notification for 10 seconds
+            )
+        except Exception as e:
+            print(f"Failed to send notification: {e}")
+
+    def create_event(self, instance):
+        # Create a popup for booking an event
+        content = BoxLayout(orientation='vertical', spacing=10, padding=10)
+
+        self.event_title_input = form_input("Event Title")
+        self.event_venue_input = form_input("Venue")
+        self.event_date_input = form_input("Date (YYYY-MM-DD)", text=time.strftime('%Y-%m-%d'))
+        self.event_start_input = form_input("Starts (HH:MM)")
+        self.event_end_input = form_input("Ends (HH:MM)")
+        self.event_capacity_input = form_input("Capacity (blank for no limit)", input_filter='int')
+        for event_input in (self.event_title_input, self.event_venue_input, self.event_date_input,
+                            self.event_start_input, self.event_end_input, self.event_capacity_input):
+            content.add_widget(event_input)
+
+        # Add Submit and Cancel buttons
+        button_layout = BoxLayout(orientation='horizontal', spacing=10, size_hint=(1, 0.2))
+
+        self.event_submit_button = Button(text="Submit", on_press=self.submit_event)
+        cancel_button = Button(text="Cancel", on_press=lambda x: self.popup.dismiss())
+
+        button_layout.add_widget(self.event_submit_button)
+        button_layout.add_widget(cancel_button)
+
+        content.add_widget(button_layout)
+
+        from kivy.uix.popup import Popup
+        self.popup = Popup(title="Create Event", content=content, size_hint=(0.8, 0.8))
+        self.popup.open()
+
+    @instrumentation.timed('ui.submit_event')
+    def submit_event(self, instance):
+        self.event_submit_button.disabled = True
+        when_done(service.call('create_event', App.get_running_app().session_token,
+                               self.event_title_input.text.strip(),
+                               self.event_venue_input.text.strip(),
+                               self.event_date_input.text,
+                               self.event_start_input.text,
+                               self.event_end_input.text,
+                               self.event_capacity_input.text),
+                  self.finish_event,
+                  lambda: setattr(self.event_submit_button, 'disabled', False))
+
+    def finish_event(self, result):
+        self.event_submit_button.disabled = False
+        event, error = result
+        if error:
+            show_message("Error", error)
+            return
+
+        self.popup.dismiss()
+        show_message("Success", f"Event booked:\n{events.format_event(event)}")
+
+class CheckInScreen(FloatLayout):
+    # Where a representative checks students in at an event's gate: pick the
+    # event once, then enter (or scan) one student number after another
+    def __init__(self, **kwargs):
+        super(CheckInScreen, self).__init__(**kwargs)
+        self.rep_info = {}
+
+        self.add_widget(background_image())
+
+        title_label = Label(text="Check In Students",
+                            font_size=28, bold=True,
+                            size_hint=(0.8, 0.1),
+                            pos_hint={'center_x': 0.5, 'top': 0.9},
+                            color=(0, 0, 0, 1))
+        self.add_widget(title_label)
+
+        form_layout = BoxLayout(orientation='vertical', spacing=15, size_hint=(0.8, 0.5), pos_hint={'center_x': 0.5, 'top': 0.75})
+
+        self.event_id_input = form_input("Event ID", input_filter='int')
+        self.event_id_input.bind(on_text_validate=self.show_attendance)
+        form_layout.add_widget(self.event_id_input)
+
+        self.student_number_input = form_input("Student Number", text_validate_unfocus=False)
+        self.student_number_input.bind(on_text_validate=self.check_in)
+        form_layout.add_widget(self.student_number_input)
+
+        self.check_in_button = RoundedButton(text="Check In", size_hint=(1, None), height=50,
+                                             on_press=self.check_in)
+        form_layout.add_widget(self.check_in_button)
+
+        back_button = RoundedButton(text="Back", size_hint=(1, None), height=50,
+                                    on_press=self.back_to_dashboard)
+        form_layout.add_widget(back_button)
+
+        self.add_widget(form_layout)
+
+        # The outcome of the last scan, and the event's counts after it
+        self.status_label = Label(text='', color=(0, 0, 0, 1), size_hint=(0.9, None), height=30,
+                                  pos_hint={'center_x': 0.5, 'top': 0.2})
+        self.add_widget(self.status_label)
+        self.attendance_label = Label(text='', color=(0, 0, 0, 1), size_hint=(0.9, None), height=30,
+                                      pos_hint={'center_x': 0.5, 'top': 0.14})
+        self.add_widget(self.attendance_label)
+
+    def reset(self, rep_info):
+        self.rep_info = rep_info
+        self.event_id_input.text = ''
+        self.student_number_input.text = ''
+        self.status_label.text = ''
+        self.attendance_label.text = ''
+        self.check_in_button.disabled = False
+
+    def event_id(self):
+        text = self.event_id_input.text.strip()
+        if not text:
+            self.show_status("Enter the event ID.", error=True)
+            return None
+        return int(text)
+
+    def show_status(self, text, error=False):
+        self.status_label.text = text
+        self.status_label.color = (1, 0, 0, 1) if error else (0, 0.5, 0, 1)
+
+    def show_attendance(self, instance):
+        event_id = self.event_id()
+        if event_id is not None:
+            when_done(service.call('attendance', event_id), self.finish_attendance)
+
+    def finish_attendance(self, counts):
+        if counts is None:
+            self.show_status("No such event.", error=True)
+            self.attendance_label.text = ''
+            return
+        self.attendance_label.text = format_attendance(counts)
+
+    @instrumentation.timed('ui.check_in')
+    def check_in(self, instance):
+        event_id = self.event_id()
+        student_number = self.student_number_input.text.strip()
+        if event_id is None:
+            return
+        if not student_number:
+            self.show_status("Enter the student number.", error=True)
+            return
+        self.check_in_button.disabled = True
+        when_done(service.call('check_in', App.get_running_app().session_token, event_id, student_number),
+                  lambda result: self.finish_check_in(student_number, result),
+                  lambda: setattr(self.check_in_button, 'disabled', False))
+
+    def finish_check_in(self, student_number, result):
+        self.check_in_button.disabled = False
+        counts, error = result
+        if error:
+            self.show_status(f"{student_number}: {error}", error=True)
+            return
+        self.show_status(f"{student_number} checked in.")
+        self.attendance_label.text = format_attendance(counts)
+
+        # Ready for the next student
+        self.student_number_input.text = ''
+        self.student_number_input.focus = True
+
+    def back_to_dashboard(self, instance):
+        navigate(RepresentativeDashboardScreen, self.rep_info)
+
+class RegistrationScreen(FloatLayout):
+    def __init__(self, **kwargs):
+        super(RegistrationScreen, self).__init__(**kwargs)
+        # Placeholder for registration screen
+        self.add_widget(Label(text="Registration Screen"))
+
+        # Add gradient background
+        
+        self.add_widget(background_image())
+
+        # Add logo image
+        self.add_widget(logo_image())
+
+        # Title label
+        title_label = Label(text="Register as Department Representative",
+                            font_size=28, bold=True,
+                            size_hint=(0.8, 0.1),
+                            pos_hint={'center_x': 0.5, 'top': 0.8},
+                            color=(0, 0, 0, 1))  # Dark text color
+        self.add_widget(title_label)
+
+        # Layout for form elements
+        form_layout = BoxLayout(orientation='vertical', spacing=15, size_hint=(0.8, 0.5), pos_hint={'center_x': 0.5, 'top': 0.65})
+
+        # Department Name input
+        self.department_name_input = form_input("Enter Department Name")
+        form_layout.add_widget(self.department_name_input)
+
+        # Username input
+        self.username_input = form_input("Enter Department Username")
+        form_layout.add_widget(self.username_input)
+
+        # Password input
+        self.password_input = form_input("Enter Password", password=True)
+        form_layout.add_widget(self.password_input)
+
+        # Confirm button
+        self.confirm_button = RoundedButton(text="Confirm Registration", size_hint=(1, None), height=50,
+                                            on_press=self.register_rep)
+        form_layout.add_widget(self.confirm_button)
+
+        # Back button
+        back_button = RoundedButton(text="Back", size_hint=(1, None), height=50,
+                                    on_press=self.back_to_login)
+        form_layout.add_widget(back_button)
+
+        # Error message label
+        self.error_message = Label(text='', color=(1, 0, 0, 1), size_hint=(1, None), height=30, pos_hint={'center_x': 0.5, 'top': 0.2})
+        self.add_widget(self.error_message)
+
+        self.add_widget(form_layout)
+
+    def reset(self):
+        self.department_name_input.text = ''
+        self.username_input.text = ''
+        self.password_input.text = ''
+        self.error_message.text = ''
+        self.confirm_button.disabled = False
+
+    @instrumentation.timed('ui.register_rep')
+    def register_rep(self, instance):
+        # Hashing the password is slow, so registration runs off the UI thread
+        self.confirm_button.disabled = True
+        when_done(service.call('register_rep',
+                               self.department_name_input.text,
+                               self.username_input.text,
+                               self.password_input.text),
+                  self.finish_registration,
+                  lambda: setattr(self.confirm_button, 'disabled', False))
+
+    def finish_registration(self, error):
+        self.confirm_button.disabled = False
+        if error:
+            self.error_message.text = error
+            return
+
+        # Success message
+        show_message('Registration Successful', 'You have successfully registered as a Department Representative.')
+        self.back_to_login(None)
+
+    def back_to_login(self, instance):
+        navigate(LoginScreen)
+
+class StudentRegistrationScreen(FloatLayout):
+    def __init__(self, **kwargs):
+        super(StudentRegistrationScreen, self).__init__(**kwargs)
+        # Placeholder for student registration screen
+        self.add_widget(Label(text="Student Registration Screen"))
+
+        # Add gradient background
+        self.add_widget(background_image())
+
+        # Add logo image
+        self.add_widget(logo_image())
+
+        # Title label
+        title_label = Label(text="Register as Student",
+                            font_size=28, bold=True,
+                            size_hint=(0.8, 0.1),
+                            pos_hint={'center_x': 0.5, 'top': 0.8},
+                            color=(0, 0, 0, 1))  # Dark text color
+        self.add_widget(title_label)
+
+        # Layout for form elements
+        form_layout = BoxLayout(orientation='vertical', spacing=15, size_hint=(0.8, 0.5), pos_hint={'center_x': 0.5, 'top': 0.65})
+
+        # Name input
+        self.name_input = form_input("Enter Full Name")
+        form_layout.add_widget(self.name_input)
+
+        # Student number input
+        self.student_number_input = form_input("Enter Student Number")
+        form_layout.add_widget(self.student_number_input)
+
+         # Add email input field
+        self.email_input = form_input("Enter Email")
+        form_layout.add_widget(self.email_input)
+
+        # Section input
+        self.section_input = form_input("Enter Section")
+        form_layout.add_widget(self.section_input)
+
+        # Department input; departments can post announcements to their students
+        self.department_input = form_input("Enter Department (optional)")
+        form_layout.add_widget(self.department_input)
+
+        # Password input
+        self.password_input = form_input("Enter Password", password=True)
+        form_layout.add_widget(self.password_input)
+
+        # Confirm button
+        self.confirm_button = RoundedButton(text="Confirm Registration", size_hint=(1, None), height=50,
+                                            on_press=self.register_student)
+        form_layout.add_widget(self.confirm_button)
+
+        # Back button
+        back_button = RoundedButton(text="Back", size_hint=(1, None), height=50,
+                                    on_press=self.back_to_login)
+        form_layout.add_widget(back_button)
+
+        # Error message label
+        self.error_message = Label(text='', color=(1, 0, 0, 1), size_hint=(1, None), height=30, pos_hint={'center_x': 0.5, 'top': 0.2})
+        self.add_widget(self.error_message)
+
+        self.add_widget(form_layout)
+
+    def reset(self):
+        self.name_input.text = ''
+        self.student_number_input.text = ''
+        self.email_input.text = ''
+        self.section_input.text = ''
+        self.department_input.text = ''
+        self.password_input.text = ''
+        self.error_message.text = ''
+        self.confirm_button.disabled = False
+
+    @instrumentation.timed('ui.register_student')
+    def register_student(self, instance):
+        name = self.name_input.text
+        email = self.email_input.text  # Get the email from the email input field
+
+        # Hashing the password is slow, so registration runs off the UI thread
+        self.confirm_button.disabled = True
+        when_done(service.call('register_student', name,
+                               self.student_number_input.text,
+                               self.section_input.text,
+                               email,
+                               self.password_input.text,
+                               self.department_input.text.strip()),
+                  lambda error: self.finish_registration(error, name, email),
+                  lambda: setattr(self.confirm_button, 'disabled', False))
+
+    def finish_registration(self, error, name, email):
+        self.confirm_button.disabled = False
+        if error:
+            self.error_message.text = error
+            return
+
+        # Send email notification
+        self.send_email_notification(name, email)
+
+        # Success message
+        show_message('Registration Successful', 'You have successfully registered as a student.')
+        self.back_to_login(None)
+
+    def send_email_notification(self, name, email):
+        # Queue the message; the mail dispatcher delivers it in the background
+        try:
+            import mailer
+            subject, body = mailer.welcome_message(name)
+            mailer.get_dispatcher().enqueue(email, subject, body)
+        except Exception as e:
+            print(f"Failed to queue email: {e}")
+
+    def back_to_login(self, instance):
+        navigate(LoginScreen)
+
+class MyApp(App):
+    session_token = None
+
+    def build(self):
+        start = time.perf_counter()
+        root = Navigator()
+        root.show(LoginScreen)
+        Window.bind(on_flip=self.on_first_frame)
+        startup.record('build', time.perf_counter() - start)
+        return root
+
+    def on_first_frame(self, *args):
+        Window.unbind(on_flip=self.on_first_frame)
+        startup.record('first_frame', startup.since_start())
+
+        # Now that the login screen is up, load the data and hashing parameters.
+        # With a server, it has the data and does the hashing.
+        if not SERVER_ADDRESS:
+            threading.Thread(target=self.load_data, daemon=True).start()
+            auth.warm_up()
+        else:
+            # The data stays on the server, so time connecting to it and its first answer instead
+            start = time.perf_counter()
+            service.call('session_stats').add_done_callback(
+                lambda future: startup.record('data_load', time.perf_counter() - start))
+
+        # Announcements posted from other app instances reach open dashboards through this
+        Clock.schedule_interval(lambda dt: service.refresh(), REFRESH_INTERVAL)
+
+        if instrumentation.ENABLED:
+            Clock.schedule_interval(instrumentation.frame, 0)
+
+        # Pick up where the last run left off, if it was still signed in
+        token = sessions.remembered()
+        if token:
+            when_done(service.call('resume', token), self.resume_session)
+
+    def resume_session(self, session):
+        if session is None:
+            sessions.forget()
+        elif self.session_token is None:
+            start_session(session)
+
+    def load_data(self):
+        start = time.perf_counter()
+        store.get()
+        startup.record('data_load', time.perf_counter() - start)
+
+        # Build the search index in the background so the first search doesn't wait for it
+        import search
+        search.index_for(store)
+
+        # Deliver any mail queued before the last shutdown or by the bulk importer
+        import mailer
+        mailer.resume_pending()
+
+    def on_stop(self):
+        # Only shut the mailer down if something actually used it
+        mailer = sys.modules.get('mailer')
+        if mailer is not None:
+            mailer.shutdown()
+        service.close()
+        services.shutdown()
+        auth.shutdown()
+        instrumentation.stop()
+
+if __name__ == '__main__':
+    # Periodic timing dumps (IEMS_INSTRUMENT=1) and whole-session profiling (IEMS_PROFILE=1)
+    instrumentation.start()
     MyApp().run()
\ No newline at end of file
@@ -0,0 +1,94 @@
+import threading
+
+# Which announcements a student has read. Announcement ids are sequential
+# from 1, so this is a watermark (everything up to it is read) plus a bitmap
+# of the ids read above it, bit 0 standing for watermark + 1. Whenever the
+# bitmap starts with read ids the watermark moves up past them, so for most
+# students the bitmap stays empty or a few bits long.
+#
+# Stored on the student record as text: the watermark, then the lengths of
+# alternating unread and read runs, e.g. "120:3,2,5,1" means read up to 120,
+# then 3 unread, 2 read, 5 unread and 1 read.
+
+
+try:
+    _popcount = int.bit_count
+except AttributeError:  # Python < 3.10
+    def _popcount(bits):
+        return bin(bits).count('1')
+
+
+# Number of set bits at the bottom of `bits`
+def _trailing_ones(bits):
+    return (~bits & (bits + 1)).bit_length() - 1
+
+
+def _trailing_zeros(bits):
+    return (bits & -bits).bit_length() - 1
+
+
+class ReadState:
+    def __init__(self, watermark=0, bits=0):
+        self.watermark = watermark
+        self.bits = bits
+        self._normalize()
+
+    @classmethod
+    def decode(cls, text):
+        if not text:
+            return cls()
+        watermark, _, runs = text.partition(':')
+        bits = 0
+        position = 0
+        lengths = [int(length) for length in runs.split(',')] if runs else []
+        for unread, read in zip(lengths[::2], lengths[1::2]):
+            position += unread
+            bits |= ((1 << read) - 1) << position
+            position += read
+        return cls(int(watermark), bits)
+
+    def encode(self):
+        runs = []
+        bits = self.bits
+        while bits:
+            unread = _trailing_zeros(bits)
+            bits >>= unread
+            read = _trailing_ones(bits)
+            bits >>= read
+            runs += (unread, read)
+        text = str(self.watermark)
+        return text + ':' + ','.join(map(str, runs)) if runs else text
+
+    def _normalize(self):
+        read = _trailing_ones(self.bits)
+        if read:
+            self.bits >>= read
+            self.watermark += read
+
+    def is_read(self, announcement_id):
+        offset = announcement_id - self.watermark - 1
+        return offset < 0 or bool(self.bits >> offset & 1)
+
+    def mark_read(self, announcement_ids):
+        for announcement_id in announcement_ids:
+            offset = announcement_id - self.watermark - 1
+            if offset >= 0:
+                self.bits |= 1 << offset
+        self._normalize()
+
+    # Everything up to `latest_id` is read; the bitmap only covers ids above it
+    def mark_all_read(self, latest_id):
+        if latest_id > self.watermark:
+            self.bits >>= latest_id - self.watermark
+            self.watermark = latest_id
+            self._normalize()
+
+    def unread_count(self, latest_id):
+        if latest_id <= self.watermark:
+            return 0
+        above = latest_id - self.watermark
+        return above - _popcount(self.bits & ((1 << above) - 1))
+
+
+# Held while a student's read state is read, changed and written back
+lock = threading.Lock()
@@ -0,0 +1,227 @@
+from collections.abc import Mapping
+
+# The JSON store's records, packed into columns. Each collection is a Table
+# holding one list per field instead of one dict per record, so 100k students
+# cost a pointer per field rather than a dict with its own copy of every key.
+# Values repeated across many records (sections, department names) are
+# interned, so each distinct one is kept once however many records share it.
+#
+# A record is read through a view: a small object with __slots__ pointing at
+# its table and row, which behaves like a read-only dict plus update().
+#
+# A table can also be backed by a section of a binary snapshot (see
+# binsnap.py), whose rows are only parsed into the columns when first read.
+
+# Stands in for a field a record doesn't have, as opposed to one set to None
+MISSING = object()
+
+# Fills the columns of rows still in the snapshot a table is backed by
+UNLOADED = object()
+
+_strings = {}
+
+
+def intern(value):
+    if isinstance(value, str):
+        return _strings.setdefault(value, value)
+    return value
+
+
+class Record(Mapping):
+    __slots__ = ('table', 'row')
+
+    # Field names in column order; fields outside these go in the row's extras
+    FIELDS = ()
+    # Fields whose values are interned
+    INTERNED = ()
+
+    def __init__(self, table, row):
+        self.table = table
+        self.row = row
+
+    def __getitem__(self, field):
+        self.table.ensure(self.row)
+        column = self.table.columns.get(field)
+        if column is not None:
+            value = column[self.row]
+            if value is MISSING:
+                raise KeyError(field)
+            return value
+        extras = self.table.extras[self.row]
+        if extras is None:
+            raise KeyError(field)
+        return extras[field]
+
+    def __iter__(self):
+        self.table.ensure(self.row)
+        for field, column in self.table.columns.items():
+            if column[self.row] is not MISSING:
+                yield field
+        extras = self.table.extras[self.row]
+        if extras:
+            yield from extras
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def __setitem__(self, field, value):
+        self.table.set(self.row, field, value)
+
+    def update(self, fields):
+        for field, value in fields.items():
+            self.table.set(self.row, field, value)
+
+    def to_dict(self):
+        return dict(self.items())
+
+    def __repr__(self):
+        return f'{type(self).__name__}({self.to_dict()!r})'
+
+
+class Student(Record):
+    __slots__ = ()
+    FIELDS = ('student_number', 'name', 'section', 'password', 'email', 'read_state', 'department')
+    INTERNED = ('section', 'department')
+
+
+class Representative(Record):
+    __slots__ = ()
+    FIELDS = ('username', 'department_name', 'password')
+    INTERNED = ('department_name',)
+
+
+class Announcement(Record):
+    __slots__ = ()
+    FIELDS = ('id', 'department', 'announcement', 'posted', 'audience')
+    INTERNED = ('department',)
+
+
+class CheckIn(Record):
+    __slots__ = ()
+    FIELDS = ('event_id', 'student_number', 'kind', 'time')
+    INTERNED = ('kind',)
+
+
+RECORD_TYPES = {'students': Student, 'representatives': Representative, 'announcements': Announcement,
+                'checkins': CheckIn}
+
+
+# One collection's records as columns. Indexing gives views; slicing gives a
+# list of views. Callers serialize access the same way they did for the list
+# of dicts this replaces.
+class Table:
+    # `backing`, if given, is a binsnap.Section holding the first rows
+    def __init__(self, record_type, records=(), backing=None):
+        self.record_type = record_type
+        self.backing = backing
+        count = len(backing) if backing is not None else 0
+        self.columns = {field: [UNLOADED] * count for field in record_type.FIELDS}
+        self.first = self.columns[record_type.FIELDS[0]]
+        self.extras = [None] * count  # per row, a dict of fields outside FIELDS, or None
+        self.size = count
+        self.removed = 0  # rows deleted from the front, so row + removed is the row in `backing`
+        self.extend(records)
+
+    # Parse the row out of the snapshot if that hasn't happened yet
+    def ensure(self, row):
+        if self.backing is not None and self.first[row] is UNLOADED:
+            self._fill(row, self.backing.record(row + self.removed))
+
+    def _fill(self, row, record):
+        interned = self.record_type.INTERNED
+        for field, column in self.columns.items():
+            value = record.get(field, MISSING)
+            column[row] = intern(value) if field in interned else value
+        others = record.keys() - self.columns.keys()
+        self.extras[row] = {field: record[field] for field in others} if others else None
+
+    # The row as a plain dict, without keeping it if it is only in the snapshot
+    def row_dict(self, row):
+        if self.backing is not None and self.first[row] is UNLOADED:
+            return self.backing.record(row + self.removed)
+        return self.record_type(self, row).to_dict()
+
+    # The row of the record in `backing` whose key field equals `key`, or None
+    def find(self, key):
+        if self.backing is None:
+            return None
+        row = self.backing.find(key)
+        if row is None or row < self.removed:
+            return None
+        return row - self.removed
+
+    # Returns the new record's row
+    def append(self, record):
+        self.extend([record])
+        return self.size - 1
+
+    def extend(self, records):
+        records = list(records)
+        interned = self.record_type.INTERNED
+        for field, column in self.columns.items():
+            values = [record.get(field, MISSING) for record in records]
+            column.extend(map(intern, values) if field in interned else values)
+        fields = self.columns.keys()
+        for record in records:
+            others = record.keys() - fields
+            self.extras.append({field: record[field] for field in others} if others else None)
+        # Only counted once every column has them, for readers on other threads
+        self.size += len(records)
+
+    def set(self, row, field, value):
+        self.ensure(row)
+        column = self.columns.get(field)
+        if column is not None:
+            column[row] = intern(value) if field in self.record_type.INTERNED else value
+            return
+        if self.extras[row] is None:
+            self.extras[row] = {}
+        self.extras[row][field] = value
+
+    def __len__(self):
+        return self.size
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self.record_type(self, row) for row in range(*index.indices(self.size))]
+        if index < 0:
+            index += self.size
+        if not 0 <= index < self.size:
+            raise IndexError('record index out of range')
+        return self.record_type(self, index)
+
+    def __iter__(self):
+        return (self.record_type(self, row) for row in range(self.size))
+
+    # Only whole leading runs are removed (when announcements are archived)
+    def __delitem__(self, index):
+        if not isinstance(index, slice):
+            index = slice(index, index + 1)
+        size = self.size
+        for column in self.columns.values():
+            del column[index]
+        del self.extras[index]
+        self.size = len(self.extras)
+        self.removed += size - self.size
+
+    # A copy of the columns as they are now, for a snapshot to serialize
+    # while this table goes on changing
+    def copy(self):
+        table = Table.__new__(Table)
+        table.record_type = self.record_type
+        table.backing = self.backing
+        table.columns = {field: list(column) for field, column in self.columns.items()}
+        table.first = table.columns[self.record_type.FIELDS[0]]
+        table.extras = [dict(extras) if extras else None for extras in self.extras]
+        table.size = self.size
+        table.removed = self.removed
+        return table
+
+
+# json.dump's default= hook, for data holding tables or views
+def to_json(value):
+    if isinstance(value, Table):
+        return [value.row_dict(row) for row in range(len(value))]
+    if isinstance(value, Record):
+        return value.to_dict()
+    raise TypeError(f'Object of type {type(value).__name__} is not JSON serializable')
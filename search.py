@@ -0,0 +1,161 @@
+import bisect
+import heapq
+import math
+import re
+import threading
+import weakref
+
+import feeds
+
+# Department names count for more than words in the announcement text
+TEXT_WEIGHT = 1.0
+DEPARTMENT_WEIGHT = 2.0
+
+# Shorter query words only match whole words, so "a" doesn't expand to half the vocabulary
+MIN_PREFIX = 2
+MAX_EXPANSIONS = 200
+
+WORD = re.compile(r'\w+')
+
+
+def tokenize(text):
+    return [word.lower() for word in WORD.findall(text or '')]
+
+
+# Inverted index from words to the announcements containing them. New
+# announcements are added as they are posted, and those dropped by archive
+# retention are taken out; nothing is ever rebuilt.
+class AnnouncementIndex:
+    def __init__(self):
+        self.postings = {}  # word -> {announcement id: weight}
+        self.words = []     # every indexed word, sorted, for prefix lookups
+        self.indexed = set()
+        self.audiences = {}  # announcement id -> its audiences (see feeds.py), unless it is for everyone
+        self.lock = threading.Lock()
+        self.ready = threading.Event()  # set once existing announcements are indexed
+
+    def __len__(self):
+        return len(self.indexed)
+
+    def add(self, announcement):
+        weights = {}
+        for word in tokenize(announcement.get('announcement')):
+            weights[word] = weights.get(word, 0) + TEXT_WEIGHT
+        for word in tokenize(announcement.get('department')):
+            weights[word] = weights.get(word, 0) + DEPARTMENT_WEIGHT
+
+        announcement_id = announcement['id']
+        with self.lock:
+            if announcement_id in self.indexed:
+                return
+            self.indexed.add(announcement_id)
+            if not feeds.is_for(announcement, [feeds.EVERYONE]):
+                self.audiences[announcement_id] = feeds.audiences_of(announcement)
+            for word, weight in weights.items():
+                postings = self.postings.get(word)
+                if postings is None:
+                    postings = self.postings[word] = {}
+                    bisect.insort(self.words, word)
+                postings[announcement_id] = weight
+
+    def add_many(self, announcements):
+        for announcement in announcements:
+            self.add(announcement)
+
+    # Forget the announcements with ids from `first` to `last`
+    def discard(self, first, last):
+        with self.lock:
+            self.indexed = {announcement_id for announcement_id in self.indexed
+                            if not first <= announcement_id <= last}
+            for announcement_id in [i for i in self.audiences if first <= i <= last]:
+                del self.audiences[announcement_id]
+            for word in list(self.postings):
+                postings = self.postings[word]
+                for announcement_id in [i for i in postings if first <= i <= last]:
+                    del postings[announcement_id]
+                if not postings:
+                    del self.postings[word]
+            self.words = sorted(self.postings)
+
+    # Subscribers to a store's expired announcements get a list of id ranges
+    def discard_ranges(self, ranges):
+        for first, last in ranges:
+            self.discard(first, last)
+
+    def build(self, announcements):
+        try:
+            self.add_many(announcements)
+        finally:
+            self.ready.set()
+
+    # Indexed words starting with `prefix`
+    def expand(self, prefix):
+        if len(prefix) < MIN_PREFIX:
+            return [prefix] if prefix in self.postings else []
+        start = bisect.bisect_left(self.words, prefix)
+        end = bisect.bisect_left(self.words, prefix + '\uffff')
+        return self.words[start:min(end, start + MAX_EXPANSIONS)]
+
+    # Announcements matching every word of the query (each as a prefix),
+    # best first: more matches, rarer words and department hits score higher,
+    # and newer announcements win ties. With `audiences`, only announcements
+    # for someone in them (see feeds.py). Returns (total matches, page of ids).
+    def search(self, query, offset=0, limit=20, audiences=None):
+        words = tokenize(query)
+        if not words:
+            return 0, []
+
+        with self.lock:
+            total_documents = max(len(self.indexed), 1)
+            matches = []
+            for word in words:
+                terms = [(self.postings[term], math.log(1 + total_documents / len(self.postings[term])))
+                         for term in self.expand(word)]
+                if not terms:
+                    return 0, []
+                matches.append(terms)
+
+            # Start from the rarest word, then only look at announcements that are still candidates
+            matches.sort(key=lambda terms: sum(len(postings) for postings, _ in terms))
+            scores = {}
+            for postings, idf in matches[0]:
+                for announcement_id, weight in postings.items():
+                    scores[announcement_id] = max(scores.get(announcement_id, 0), weight * idf)
+
+            for terms in matches[1:]:
+                narrowed = {}
+                for announcement_id, score in scores.items():
+                    best = max((postings[announcement_id] * idf for postings, idf in terms
+                                if announcement_id in postings), default=None)
+                    if best is not None:
+                        narrowed[announcement_id] = score + best
+                scores = narrowed
+                if not scores:
+                    return 0, []
+
+            if audiences is not None:
+                scores = {announcement_id: score for announcement_id, score in scores.items()
+                          if feeds.is_for({'audience': self.audiences.get(announcement_id)}, audiences)}
+
+        best = heapq.nlargest(offset + limit, scores.items(), key=lambda item: (item[1], item[0]))
+        return len(scores), [announcement_id for announcement_id, _ in best[offset:]]
+
+
+_indexes = weakref.WeakKeyDictionary()
+_indexes_lock = threading.Lock()
+
+
+# The search index for a store, created on first use. Existing announcements
+# are indexed on a background thread; new ones are added as they are published.
+def index_for(store):
+    with _indexes_lock:
+        index = _indexes.get(store)
+        if index is not None:
+            return index
+        index = _indexes[store] = AnnouncementIndex()
+
+    store.subscribe(index.add_many)
+    store.subscribe_expired(index.discard_ranges)
+    threading.Thread(target=index.build, args=(store.iter_announcements(),),
+                     name='search-index', daemon=True).start()
+    return index
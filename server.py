@@ -0,0 +1,168 @@
+# Serve one store to many app instances, so kiosks don't each embed the data layer.
+#
+#   python server.py [--host 127.0.0.1] [--port 8765]
+#
+# then start each kiosk with IEMS_SERVER=host:port. The protocol is one JSON
+# object per line over TCP. A request {"id": 1, "op": "login", "args": [...]}
+# is answered with {"id": 1, "result": ...} or {"id": 1, "error": "..."};
+# a connection can have many requests in flight and answers come back as
+# they finish. After {"op": "subscribe"}, a connection is also sent
+# {"event": "announcements", "announcements": [...]} whenever some are posted.
+
+import argparse
+import asyncio
+import json
+
+import services
+from storage import open_store
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8765
+
+# Longest request or response line, in bytes
+MAX_LINE = 1024 * 1024
+
+# Subscribers that fall this far behind (in unsent bytes) are disconnected
+MAX_BACKLOG = 4 * 1024 * 1024
+
+# How often to pick up writes made to the store by other processes (the bulk importer)
+REFRESH_INTERVAL = 2
+
+
+# "host:port", "host" or ":port", with the defaults filling in the rest
+def parse_address(address):
+    host, _, port = address.rpartition(':') if ':' in address else (address, '', '')
+    return host or DEFAULT_HOST, int(port or DEFAULT_PORT)
+
+
+def encode(message):
+    return (json.dumps(message) + '\n').encode()
+
+
+class Server:
+    def __init__(self, store):
+        self.store = store
+        self.subscribers = set()
+        self.loop = None
+
+    async def serve(self, host=DEFAULT_HOST, port=DEFAULT_PORT):
+        self.loop = asyncio.get_running_loop()
+        self.store.subscribe(self.broadcast)
+        server = await asyncio.start_server(self.handle, host, port, limit=MAX_LINE)
+        refreshing = asyncio.ensure_future(self.refresh_periodically())
+        print(f"Serving on {host}:{port}", flush=True)
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            refreshing.cancel()
+            self.store.unsubscribe(self.broadcast)
+
+    async def refresh_periodically(self):
+        while True:
+            await asyncio.sleep(REFRESH_INTERVAL)
+            await asyncio.wrap_future(services.run_async(self.store.refresh))
+
+    # Called by the store on whichever thread made the change
+    def broadcast(self, announcements):
+        line = encode({'event': 'announcements', 'announcements': announcements})
+        self.loop.call_soon_threadsafe(self._send_to_subscribers, line)
+
+    def _send_to_subscribers(self, line):
+        for writer in list(self.subscribers):
+            if writer.transport.get_write_buffer_size() > MAX_BACKLOG:
+                self.subscribers.discard(writer)
+                writer.close()
+            else:
+                writer.write(line)
+
+    async def handle(self, reader, writer):
+        in_flight = set()
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                task = asyncio.ensure_future(self.respond(writer, line))
+                in_flight.add(task)
+                task.add_done_callback(in_flight.discard)
+        except (ConnectionError, ValueError):
+            # Dropped, or sent a line longer than MAX_LINE
+            pass
+        finally:
+            self.subscribers.discard(writer)
+            for task in in_flight:
+                task.cancel()
+            writer.close()
+
+    async def respond(self, writer, line):
+        try:
+            request = json.loads(line)
+            request_id = request.get('id')
+            operation = request['op']
+            args = list(request.get('args', []))
+        except (ValueError, KeyError, TypeError, AttributeError) as e:
+            await self.send(writer, {'id': None, 'error': f"Bad request: {e}"})
+            return
+
+        try:
+            if operation == 'subscribe':
+                self.subscribers.add(writer)
+                response = {'id': request_id, 'result': True}
+            elif operation == 'unsubscribe':
+                self.subscribers.discard(writer)
+                response = {'id': request_id, 'result': True}
+            elif operation in services.OPERATIONS:
+                error = services.check_arguments(operation, args)
+                if error:
+                    response = {'id': request_id, 'error': error}
+                else:
+                    future = services.run_async(services.OPERATIONS[operation], self.store, *args)
+                    result = await asyncio.wrap_future(future)
+                    response = {'id': request_id, 'result': result}
+            else:
+                response = {'id': request_id, 'error': f"Unknown operation: {operation}"}
+        except Exception as e:
+            # The details are for the server's log, not the client
+            print(f"{operation} failed: {e!r}")
+            response = {'id': request_id, 'error': "Something went wrong on the server. Please try again."}
+        await self.send(writer, response)
+
+    async def send(self, writer, message):
+        if writer.is_closing():
+            return
+        writer.write(encode(message))
+        try:
+            await writer.drain()
+        except ConnectionError:
+            pass
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve the student and announcement store to app instances.')
+    parser.add_argument('--host', default=DEFAULT_HOST, help=f'address to listen on (default: {DEFAULT_HOST})')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT, help=f'port to listen on (default: {DEFAULT_PORT})')
+    args = parser.parse_args()
+
+    import auth
+    import instrumentation
+    import mailer
+    import search
+
+    instrumentation.start()
+    store = open_store()
+    search.index_for(store)
+    mailer.resume_pending()
+    try:
+        asyncio.run(Server(store).serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        mailer.shutdown()
+        services.shutdown()
+        auth.shutdown()
+        store.close()
+        instrumentation.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,459 @@
+import inspect
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import auth
+import instrumentation
+import readstate
+import sessions
+
+# What the screens do, without any widgets, so it can run headless (the
+# benchmarks, the bulk importer) as well as behind the UI. Each operation
+# returns an error message for the user, or None when it worked. Password
+# hashing goes through auth's pool, so IEMS_HASH_WORKERS caps how many
+# hashes run at once however many operations are running.
+
+# How many announcements a dashboard shows per page
+FEED_PAGE_SIZE = 50
+
+SERVICE_WORKERS = int(os.getenv('IEMS_SERVICE_WORKERS', '4'))
+
+# Email each new announcement to the students (set IEMS_ANNOUNCEMENT_EMAIL=0 to turn off)
+ANNOUNCEMENT_EMAIL = os.getenv('IEMS_ANNOUNCEMENT_EMAIL', '1') == '1'
+
+_executor = None
+
+
+# Returns (user_info, None) on success, otherwise (None, error message)
+def login(store, user_type, identifier, password):
+    if not identifier or not password:
+        return None, "Please fill in all fields."
+
+    user_type = user_type.lower()
+    if user_type == "student":
+        user_info = store.get_student(identifier)
+        error = 'Invalid Student Number or Password'
+    elif user_type == "representative":
+        user_info = store.get_rep(identifier)
+        error = 'Invalid Representative Username or Password'
+    else:
+        return None, "Please enter 'student' or 'representative'"
+
+    if not user_info or not auth.verify_password_async(password, user_info.get('password', '')).result():
+        return None, error
+    return user_info, None
+
+
+# Replace a legacy or weaker hash now that we know the password
+def upgrade_password(store, user_type, user_info, password):
+    new_hash = auth.rehash_if_needed_async(password, user_info.get('password', '')).result()
+    if new_hash is None:
+        return False
+    if user_type.lower() == "student":
+        store.update_student(user_info['student_number'], {'password': new_hash})
+    else:
+        store.update_rep(user_info['username'], {'password': new_hash})
+    return True
+
+
+# Log in and start a session, upgrading the stored hash in the background if
+# it needs it. Returns (session, None), where the session has the token, the
+# user_type and the user's record (without the password hash), or (None, error message).
+def sign_in(store, user_type, identifier, password):
+    user_info, error = login(store, user_type, identifier, password)
+    if error:
+        return None, error
+    run_async(upgrade_password, store, user_type, user_info, password)
+    token, session = sessions.get_cache().create(user_type.lower(), user_info)
+    return dict(session, token=token), None
+
+
+# The session for a token from sign_in, or None if it has ended
+def resume(store, token):
+    session = sessions.get_cache().get(token)
+    return dict(session, token=token) if session else None
+
+
+def sign_out(store, token):
+    return sessions.get_cache().revoke(token)
+
+
+# Session cache hit, miss and eviction counters
+def session_stats(store):
+    return sessions.get_cache().stats()
+
+
+# The department is optional; students who give one also get their department's announcements
+def register_student(store, name, student_number, section, email, password, department=None):
+    if not (name and student_number and section and password and email):
+        return 'Please fill in all fields.'
+    if store.get_student(student_number):
+        return 'Student Number is already registered.'
+
+    student = {
+        'name': name,
+        'student_number': student_number,
+        'section': section,
+        'password': auth.hash_password_async(password).result(),
+        'email': email
+    }
+    if department:
+        student['department'] = department
+    if not store.add_student(student):
+        return 'Student Number is already registered.'
+    return None
+
+
+def register_rep(store, department_name, username, password):
+    if not (department_name and username and password):
+        return 'Please fill in all fields.'
+    if store.get_rep(username):
+        return 'Username is already registered.'
+
+    rep = {
+        'department_name': department_name,
+        'username': username,
+        'password': auth.hash_password_async(password).result()
+    }
+    if not store.add_rep(rep):
+        return 'Username is already registered.'
+    return None
+
+
+# Post, as the representative signed in with `token`, to everyone, their
+# department or a list of sections (`audience` is one of
+# feeds.AUDIENCE_CHOICES; `sections` are comma-separated). Returns
+# (announcement, None), or (None, error message) if the text is empty or the
+# audience doesn't make sense.
+def post_announcement(store, token, text, audience=None, sections=''):
+    import feeds
+    rep_info = _session_rep(token)
+    if rep_info is None:
+        return None, 'Please log in as a representative.'
+    if not text:
+        return None, "Announcement cannot be empty!"
+    audience, error = feeds.parse_audience(audience, rep_info.get('department_name'), sections)
+    if error:
+        return None, error
+    announcement = {
+        'department': rep_info.get('department_name', 'Unknown Department'),
+        'announcement': text,
+        'posted': time.time(),
+        'audience': audience
+    }
+    store.add_announcement(announcement)
+    if ANNOUNCEMENT_EMAIL:
+        email_announcement(store, announcement)
+    return announcement, None
+
+
+# Queue the announcement for the stored email address of every student it
+# is for. The recipient list is read and expanded on the mailer's fan-out thread.
+def email_announcement(store, announcement):
+    import feeds
+    import mailer
+    recipients = (student['email'] for student in store.iter_students()
+                  if student.get('email') and feeds.is_for(announcement, feeds.student_audiences(student)))
+    mailer.send_announcement(announcement, recipients)
+
+
+# One page of the feed of whoever is signed in with `token`, newest first,
+# older than the id `before`: for a student, only the announcements for them
+# (their precomputed feeds, see feeds.py); for a representative, every
+# announcement. Nothing without a session.
+def load_feed(store, token, before=None, limit=FEED_PAGE_SIZE):
+    audiences = _student_audiences(token)
+    if audiences is not None:
+        return store.get_feed(audiences, before=before, limit=limit)
+    if _session_rep(token) is not None:
+        return store.get_announcements(before=before, limit=limit)
+    return []
+
+
+# One page of the announcements matching `query` that whoever is signed in
+# with `token` can see (as for load_feed), best match first. Waits for the
+# index to finish building the first time. Returns (total matches, announcements).
+def search_announcements(store, token, query, offset=0, limit=FEED_PAGE_SIZE):
+    import search
+    audiences = _student_audiences(token)
+    if audiences is None and _session_rep(token) is None:
+        return 0, []
+    index = search.index_for(store)
+    index.ready.wait()
+    total, ids = index.search(query, offset, limit, audiences)
+    return total, store.get_announcements_by_id(ids)
+
+
+# Book an event at a venue, as the representative signed in with `token`.
+# The date is 'YYYY-MM-DD' and the times 'HH:MM'; a blank capacity means no
+# limit. Returns (event, None), or (None, error message) if a field is
+# missing or wrong or the venue is already booked then.
+def create_event(store, token, title, venue, date, start_time, end_time, capacity=None):
+    import events
+    rep_info = _session_rep(token)
+    if rep_info is None:
+        return None, 'Please log in as a representative.'
+    if not (title and venue and date and start_time and end_time):
+        return None, 'Please fill in all fields.'
+    try:
+        start = events.parse_time(date, start_time)
+        end = events.parse_time(date, end_time)
+    except ValueError:
+        return None, 'Enter the date as YYYY-MM-DD and the times as HH:MM.'
+    if end <= start:
+        return None, 'The event must end after it starts.'
+    if capacity in (None, ''):
+        capacity = None
+    else:
+        try:
+            capacity = int(capacity)
+        except ValueError:
+            capacity = 0
+        if capacity <= 0:
+            return None, 'Capacity must be a whole number above zero.'
+
+    event = {
+        'title': title,
+        'venue': venue,
+        'department': rep_info.get('department_name', 'Unknown Department'),
+        'start': start,
+        'end': end,
+        'capacity': capacity
+    }
+    if store.add_event(event):
+        return event, None
+    # The store has caught up with every other kiosk's bookings by now
+    conflicts = store.event_conflicts(venue, start, end)
+    return None, f"{venue} is already booked: {events.format_event(conflicts[0])}"
+
+
+# Events on at any time from start to end (seconds since the epoch), by start time
+def events_between(store, start, end):
+    return store.events_between(start, end)
+
+
+# Events that haven't ended yet (or by `after`), soonest first
+def upcoming_events(store, after=None, limit=None):
+    import events
+    return store.upcoming_events(time.time() if after is None else after, limit or events.UPCOMING_LIMIT)
+
+
+# The record of the student signed in with `token`, without the password, if any
+def _session_user(token):
+    session = sessions.get_cache().get(token) if token else None
+    if session is None or session['user_type'] != 'student':
+        return None
+    return session['user']
+
+
+# The record of the representative signed in with `token`, without the password, if any
+def _session_rep(token):
+    session = sessions.get_cache().get(token) if token else None
+    if session is None or session['user_type'] != 'representative':
+        return None
+    return session['user']
+
+
+# The student number of the student signed in with `token`, if any
+def _session_student(token):
+    user = _session_user(token)
+    return None if user is None else user['student_number']
+
+
+# The audiences (see feeds.py) of the student signed in with `token`, if any
+def _student_audiences(token):
+    import feeds
+    user = _session_user(token)
+    return None if user is None else feeds.student_audiences(user)
+
+
+# Reserve the signed-in student a place at an event. Returns (counts, None),
+# where counts has the event's capacity and places taken, or (None, error message).
+def rsvp(store, token, event_id):
+    import checkin
+    student_number = _session_student(token)
+    if student_number is None:
+        return None, 'Please log in as a student.'
+    return checkin.attendance_for(store).rsvp(event_id, student_number)
+
+
+# Check a student in at an event's gate; only representatives can. Returns
+# (counts, None), or (None, error message) for an unknown student, a second
+# scan or a full event.
+def check_in(store, token, event_id, student_number):
+    import checkin
+    if _session_rep(token) is None:
+        return None, 'Please log in as a representative.'
+    return checkin.attendance_for(store).check_in(event_id, student_number)
+
+
+# An event's capacity, places taken, RSVPs and check-ins, or None if there's no such event
+def attendance(store, event_id):
+    import checkin
+    return checkin.attendance_for(store).summary(event_id)
+
+
+# Apply `change` to the signed-in student's read state and save it if it
+# changed. Only the student's own feed counts towards unread, and once all of
+# it up to an id is read the watermark moves up there, past anything for
+# other people in between. Returns {'read_state': encoded, 'latest': newest
+# announcement id, 'unread': count}, or None without a student session.
+def _update_read_state(store, token, change=None):
+    import feeds
+    user = _session_user(token)
+    if user is None:
+        return None
+    student_number = user['student_number']
+    audiences = feeds.student_audiences(user)
+    latest = store.latest_announcement_id()
+    with readstate.lock:
+        student = store.get_student(student_number) or {}
+        encoded = student.get('read_state')
+        state = readstate.ReadState.decode(encoded)
+        if change is not None:
+            change(state, latest)
+        unread = [announcement_id for announcement_id in store.feed_ids_after(audiences, state.watermark)
+                  if announcement_id <= latest and not state.is_read(announcement_id)]
+        state.mark_all_read(unread[0] - 1 if unread else latest)
+        if state.encode() != (encoded or '0'):
+            store.update_student(student_number, {'read_state': state.encode()})
+    return {'read_state': state.encode(), 'latest': latest, 'unread': len(unread)}
+
+
+def read_status(store, token):
+    return _update_read_state(store, token)
+
+
+def mark_read(store, token, announcement_ids):
+    return _update_read_state(store, token, lambda state, latest: state.mark_read(announcement_ids))
+
+
+def mark_all_read(store, token):
+    return _update_read_state(store, token, lambda state, latest: state.mark_all_read(latest))
+
+
+# Run one of the above off the UI thread; returns a concurrent.futures.Future
+def run_async(operation, *args):
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=SERVICE_WORKERS, thread_name_prefix='service')
+    return _executor.submit(operation, *args)
+
+
+# What the screens can ask for, by name. Each takes the store first.
+OPERATIONS = {
+    'login': sign_in,
+    'resume': resume,
+    'logout': sign_out,
+    'session_stats': session_stats,
+    'read_status': read_status,
+    'mark_read': mark_read,
+    'mark_all_read': mark_all_read,
+    'register_student': register_student,
+    'register_rep': register_rep,
+    'post_announcement': post_announcement,
+    'load_feed': load_feed,
+    'search_announcements': search_announcements,
+    'create_event': create_event,
+    'events_between': events_between,
+    'upcoming_events': upcoming_events,
+    'rsvp': rsvp,
+    'check_in': check_in,
+    'attendance': attendance,
+}
+
+# The JSON types of each operation's arguments after the store, so requests
+# from other processes (see server.py) can be checked before they run. A
+# tuple allows any of its types; a one-item list is a list of that type.
+_TEXT = str
+_OPTIONAL_TEXT = (str, type(None))
+_ID = int
+_OPTIONAL_ID = (int, type(None))
+_TIME = (int, float)
+_OPTIONAL_TIME = (int, float, type(None))
+ARGUMENTS = {
+    'login': (_TEXT, _TEXT, _TEXT),
+    'resume': (_TEXT,),
+    'logout': (_TEXT,),
+    'session_stats': (),
+    'read_status': (_TEXT,),
+    'mark_read': (_TEXT, [_ID]),
+    'mark_all_read': (_TEXT,),
+    'register_student': (_TEXT, _TEXT, _TEXT, _TEXT, _TEXT, _OPTIONAL_TEXT),
+    'register_rep': (_TEXT, _TEXT, _TEXT),
+    'post_announcement': (_TEXT, _TEXT, _OPTIONAL_TEXT, _TEXT),
+    'load_feed': (_TEXT, _OPTIONAL_ID, _ID),
+    'search_announcements': (_TEXT, _TEXT, _ID, _ID),
+    'create_event': (_TEXT, _TEXT, _TEXT, _TEXT, _TEXT, _TEXT, (str, int, type(None))),
+    'events_between': (_TIME, _TIME),
+    'upcoming_events': (_OPTIONAL_TIME, _OPTIONAL_ID),
+    'rsvp': (_TEXT, _ID),
+    'check_in': (_TEXT, _ID, _TEXT),
+    'attendance': (_ID,),
+}
+
+
+def _is_a(value, expected):
+    if isinstance(expected, list):
+        return isinstance(value, list) and all(_is_a(item, expected[0]) for item in value)
+    expected = expected if isinstance(expected, tuple) else (expected,)
+    # JSON true and false aren't numbers
+    if isinstance(value, bool):
+        return bool in expected
+    return isinstance(value, expected)
+
+
+# None if `args` suit the operation, otherwise an error message for the user
+def check_arguments(operation, args):
+    try:
+        inspect.signature(OPERATIONS[operation]).bind(None, *args)
+    except TypeError:
+        return f"Wrong number of arguments for {operation}."
+    if not all(_is_a(value, expected) for value, expected in zip(args, ARGUMENTS[operation])):
+        return f"Invalid arguments for {operation}."
+    return None
+
+
+# Timed as service.<name> when instrumentation is on
+OPERATIONS = {name: instrumentation.timed(f'service.{name}')(operation) for name, operation in OPERATIONS.items()}
+
+
+# Runs OPERATIONS against a store in this process. client.ServiceClient has
+# the same methods and runs them on a server instead (see server.py).
+class LocalService:
+    def __init__(self, store):
+        self.store = store
+
+    # Returns a concurrent.futures.Future
+    def call(self, operation, *args):
+        return run_async(OPERATIONS[operation], self.store, *args)
+
+    def subscribe(self, callback):
+        self.store.subscribe(callback)
+
+    def unsubscribe(self, callback):
+        self.store.unsubscribe(callback)
+
+    def refresh(self):
+        self.store.refresh()
+
+    def close(self):
+        _close_attendance()
+        self.store.close()
+
+
+# Save queued check-ins, if anything used them, before the store goes
+def _close_attendance():
+    checkin = sys.modules.get('checkin')
+    if checkin is not None:
+        checkin.close_all()
+
+
+def shutdown():
+    global _executor
+    _close_attendance()
+    if _executor is not None:
+        _executor.shutdown(wait=False)
+        _executor = None
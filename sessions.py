@@ -0,0 +1,181 @@
+import hashlib
+import json
+import os
+import secrets
+import threading
+import time
+from collections import OrderedDict
+
+# Sessions end after this many seconds without being used
+SESSION_TTL = float(os.getenv('IEMS_SESSION_TTL', str(8 * 60 * 60)))
+
+# Most sessions kept at once; the least recently used go first
+SESSION_CACHE_SIZE = int(os.getenv('IEMS_SESSION_CACHE_SIZE', '1000'))
+
+# Keep sessions across restarts (set IEMS_PERSIST_SESSIONS=1): the session
+# cache is saved to SESSIONS_FILE, and each kiosk remembers its own token in
+# KIOSK_SESSION_FILE, so a relaunched kiosk resumes without logging in again
+PERSIST = os.getenv('IEMS_PERSIST_SESSIONS', '0') == '1'
+SESSIONS_FILE = os.getenv('IEMS_SESSIONS_FILE', 'sessions.json')
+KIOSK_SESSION_FILE = os.getenv('IEMS_KIOSK_SESSION_FILE', 'kiosk_session.json')
+
+TOKEN_BYTES = 32
+
+# Left out of the copy of the user's record a session keeps: the password
+# hash, and state that changes while the session is open
+OMITTED_FIELDS = ('password', 'read_state')
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+# Sessions are filed under a hash of their token, so neither memory nor the
+# sessions file holds a token that could be used as is
+def _key(token):
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+def _write_private(path, content):
+    # Written to a temporary file first, readable by this user only
+    tmp_path = path + '.tmp'
+    fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, 'w') as f:
+        json.dump(content, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+# Signed-in users by token, with a TTL and LRU eviction. A session is a dict
+# with the user_type ('student' or 'representative'), the user's record
+# (less OMITTED_FIELDS), and when it was created and last used.
+class SessionCache:
+    def __init__(self, size=SESSION_CACHE_SIZE, ttl=SESSION_TTL, path=None, clock=time.time):
+        self.size = size
+        self.ttl = ttl
+        self.path = path
+        self.clock = clock
+        self.sessions = OrderedDict()  # least recently used first
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        if path:
+            self._load()
+
+    # Start a session for a user who has just logged in; returns (token, session)
+    def create(self, user_type, user):
+        token = secrets.token_urlsafe(TOKEN_BYTES)
+        now = self.clock()
+        session = {
+            'user_type': user_type,
+            'user': {field: value for field, value in user.items() if field not in OMITTED_FIELDS},
+            'created': now,
+            'last_used': now,
+        }
+        with self.lock:
+            self.sessions[_key(token)] = session
+            while len(self.sessions) > self.size:
+                self.sessions.popitem(last=False)
+                self.evictions += 1
+            self._save()
+        return token, session
+
+    # The session for `token`, or None if there isn't one or it has expired
+    def get(self, token):
+        key = _key(token)
+        now = self.clock()
+        with self.lock:
+            session = self.sessions.get(key)
+            if session is not None and now - session['last_used'] > self.ttl:
+                del self.sessions[key]
+                self.expirations += 1
+                session = None
+            if session is None:
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            session['last_used'] = now
+            self.sessions.move_to_end(key)
+            return session
+
+    # End a session; returns whether there was one
+    def revoke(self, token):
+        with self.lock:
+            if self.sessions.pop(_key(token), None) is None:
+                return False
+            self._save()
+            return True
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'sessions': len(self.sessions),
+                'capacity': self.size,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'hit_rate': self.hits / lookups if lookups else None,
+            }
+
+    def _load(self):
+        try:
+            with open(self.path, 'r') as f:
+                saved = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return
+        now = self.clock()
+        for key, session in sorted(saved.items(), key=lambda item: item[1]['last_used']):
+            if now - session['last_used'] <= self.ttl:
+                self.sessions[key] = session
+        while len(self.sessions) > self.size:
+            self.sessions.popitem(last=False)
+
+    # Called with the lock held, whenever a session starts or ends. Last-used
+    # times are only brought up to date on disk then.
+    def _save(self):
+        if not self.path:
+            return
+        try:
+            _write_private(self.path, self.sessions)
+        except OSError as e:
+            print(f"Failed to save sessions: {e}")
+
+
+# The session cache for this process, created on first use
+def get_cache():
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = SessionCache(path=SESSIONS_FILE if PERSIST else None)
+        return _cache
+
+
+# This kiosk's own token, kept so a relaunch can resume the session (only when PERSIST is on)
+def remember(token):
+    if PERSIST:
+        try:
+            _write_private(KIOSK_SESSION_FILE, {'token': token})
+        except OSError as e:
+            print(f"Failed to save session: {e}")
+
+
+def remembered():
+    if not PERSIST:
+        return None
+    try:
+        with open(KIOSK_SESSION_FILE, 'r') as f:
+            return json.load(f).get('token')
+    except (FileNotFoundError, json.JSONDecodeError, AttributeError):
+        return None
+
+
+def forget():
+    try:
+        os.remove(KIOSK_SESSION_FILE)
+    except FileNotFoundError:
+        pass
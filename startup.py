@@ -0,0 +1,52 @@
+import json
+import os
+import threading
+import time
+
+# main.py imports this module first, so this is as close to process start as we can measure
+STARTED = time.perf_counter()
+
+# Set IEMS_STARTUP_REPORT=1 to print the breakdown and save it to REPORT_FILE
+REPORT_ENABLED = os.getenv('IEMS_STARTUP_REPORT') == '1'
+REPORT_FILE = os.getenv('IEMS_STARTUP_REPORT_FILE', 'startup_profile.json')
+
+# The report is produced once all of these have been recorded. With a server
+# (IEMS_SERVER), data_load is connecting to it and its first answer.
+PHASES = ('imports', 'build', 'first_frame', 'data_load')
+
+_timings = {}
+_lock = threading.Lock()
+_reported = False
+
+
+def since_start():
+    return time.perf_counter() - STARTED
+
+
+# Record how long a phase took, in seconds
+def record(name, seconds):
+    global _reported
+    with _lock:
+        _timings[name] = seconds
+        ready = not _reported and all(phase in _timings for phase in PHASES)
+        if ready:
+            _reported = True
+    if ready and REPORT_ENABLED:
+        report()
+
+
+def timings():
+    with _lock:
+        return dict(_timings)
+
+
+def report():
+    results = timings()
+    print("Startup profile:")
+    for name, seconds in results.items():
+        print(f"  {name:<20} {seconds * 1000:8.1f} ms")
+    try:
+        with open(REPORT_FILE, 'w') as f:
+            json.dump({name: round(seconds * 1000, 3) for name, seconds in results.items()}, f, indent=4)
+    except OSError as e:
+        print(f"Failed to save startup profile: {e}")
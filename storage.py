@@ -0,0 +1,1156 @@
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+import uuid
+
+import binsnap
+import instrumentation
+import records
+from archive import ARCHIVE_DIR, Archive
+from events import EventIndex
+from feeds import EVERYONE, FeedIndex, audiences_of
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+DATA_FILE = 'student_data.json'
+JOURNAL_FILE = 'student_data.journal'
+DB_FILE = os.getenv('IEMS_DB_FILE', 'student_data.db')
+
+# Number of journal records after which the snapshot is rewritten
+COMPACT_EVERY = int(os.getenv('IEMS_COMPACT_EVERY', '1000'))
+
+# The JSON store's snapshot is pretty-printed JSON in DATA_FILE, or with
+# IEMS_SNAPSHOT_FORMAT=binary the format of binsnap.py in BINARY_DATA_FILE.
+# After a switch, the store opens on the snapshot in the old format and
+# writes it in the new one.
+SNAPSHOT_FORMAT = os.getenv('IEMS_SNAPSHOT_FORMAT', 'json')
+BINARY_DATA_FILE = 'student_data.snap'
+
+# Collections left in a binary snapshot until each record is first read
+LAZY_COLLECTIONS = ('students',)
+
+
+def empty_data():
+    return {"students": [], "representatives": [], "announcements": [], "events": [], "checkins": []}
+
+
+def _read_snapshot(path):
+    try:
+        with open(path, 'r') as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return empty_data()
+
+
+# Field that identifies a record in each collection, for journaled updates
+KEY_FIELDS = {'students': 'student_number', 'representatives': 'username'}
+
+
+# A journal entry adds one record ('record'), adds a batch written in a single
+# line ('records'), or sets fields on an existing record ('key' and 'fields')
+def entry_records(entry):
+    if 'records' in entry:
+        return entry['records']
+    if 'record' in entry:
+        return [entry['record']]
+    return []
+
+
+def _replay(journal_path, after_seq, apply):
+    # Apply every journal entry newer than the snapshot, returning the last seq seen
+    last_seq = after_seq
+    try:
+        f = open(journal_path, 'r')
+    except FileNotFoundError:
+        return last_seq
+
+    with f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                # A torn final line means we crashed mid-append; the write never completed
+                break
+            if entry['seq'] <= last_seq:
+                continue
+            apply(entry)
+            last_seq = entry['seq']
+    return last_seq
+
+
+# Cut off a partially written last line so new entries start on a fresh line
+def _truncate_torn_tail(journal_path):
+    try:
+        with open(journal_path, 'rb+') as f:
+            content = f.read()
+            end = content.rfind(b'\n') + 1
+            if end != len(content):
+                f.truncate(end)
+    except FileNotFoundError:
+        pass
+
+
+def save_data(data, path=DATA_FILE):
+    # Write to a temporary file first so a crash never leaves a half-written snapshot
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(data, f, indent=4, default=records.to_json)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def save_binary(data, path=BINARY_DATA_FILE):
+    binsnap.save(data, path, KEY_FIELDS)
+
+
+# The binary snapshot's plain values, and its collections as binsnap.Sections
+# (LAZY_COLLECTIONS) or lists of dicts (the rest). Raises binsnap.FormatError
+# if the file isn't a snapshot this version can read.
+def _read_binary_snapshot(path):
+    try:
+        snapshot = binsnap.Snapshot(path)
+    except FileNotFoundError:
+        return empty_data()
+    data = dict(snapshot.meta)
+    for name, section in snapshot.sections.items():
+        data[name] = section if name in LAZY_COLLECTIONS else list(section)
+    return data
+
+
+# The snapshot to load, as (path, binary): the one at `path`, unless the same
+# snapshot in the other format (the same name with the other's extension) is
+# newer, because the store last ran with the other IEMS_SNAPSHOT_FORMAT
+def _newest_snapshot(path, binary):
+    other = os.path.splitext(path)[0] + os.path.splitext(DATA_FILE if binary else BINARY_DATA_FILE)[1]
+    try:
+        other_modified = os.stat(other).st_mtime
+    except FileNotFoundError:
+        return path, binary
+    try:
+        if os.stat(path).st_mtime >= other_modified:
+            return path, binary
+    except FileNotFoundError:
+        pass
+    return other, not binary
+
+
+# An exclusive lock on a file, held across processes (and across stores in
+# one process), so app instances sharing the data files take turns
+class FileLock:
+    def __init__(self, path):
+        self.file = open(path, 'a+')
+
+    def acquire(self, blocking=True):
+        if fcntl is not None:
+            try:
+                fcntl.flock(self.file.fileno(), fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return False
+            return True
+
+        while True:
+            try:
+                self.file.seek(0)
+                msvcrt.locking(self.file.fileno(), msvcrt.LK_NBLCK, 1)
+                return True
+            except OSError:
+                if not blocking:
+                    return False
+                time.sleep(0.01)
+
+    def release(self):
+        if fcntl is not None:
+            fcntl.flock(self.file.fileno(), fcntl.LOCK_UN)
+        else:
+            self.file.seek(0)
+            msvcrt.locking(self.file.fileno(), msvcrt.LK_UNLCK, 1)
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+    def close(self):
+        self.file.close()
+
+
+# Every app instance sharing the journal writes through one of these. Writes
+# are serialized across instances by `file_lock`: a writer first catches up
+# with everything the others have appended, so its entry is numbered after
+# theirs and checked against the current state rather than a stale copy.
+class Journal:
+    # `apply` applies an entry to the in-memory data. Pass the file lock if it
+    # was held while `data` was loaded, so nothing can be appended in between;
+    # it must still be held while the journal is opened. `prepare_snapshot`,
+    # if given, is called with each snapshot compaction is about to save,
+    # outside the lock, and returns the snapshot to save. `save` writes a
+    # snapshot to a path.
+    def __init__(self, data, apply, path=DATA_FILE, journal_path=JOURNAL_FILE, file_lock=None,
+                 prepare_snapshot=None, save=save_data):
+        self.data = data
+        self.apply = apply
+        self.path = path
+        self.journal_path = journal_path
+        self.prepare_snapshot = prepare_snapshot
+        self.save = save
+        self.seq = data.pop('journal_seq', 0)
+        self.pending = 0
+        self.lock = threading.Lock()
+        self.compacting = None
+
+        # Entries are tagged with who wrote them, so that when other app
+        # instances share the journal we can tell their writes from ours
+        self.writer = uuid.uuid4().hex
+        self.unseen = []
+        self.compact_lock = FileLock(journal_path + '.compact.lock')
+        if file_lock is None:
+            self.file_lock = FileLock(journal_path + '.lock')
+            with self.file_lock:
+                self._open()
+        else:
+            self.file_lock = file_lock
+            self._open()
+
+    def _open(self):
+        # Nobody else is writing while we hold the lock, so a partial last line is from a crash
+        _truncate_torn_tail(self.journal_path)
+        self.file = open(self.journal_path, 'a')
+        self.reader = open(self.journal_path, 'rb')
+        self.reader.seek(0, os.SEEK_END)
+
+    # Apply a new record to the in-memory data and durably log it. Returns the
+    # entry written, or None if `merge` decided against writing it.
+    def append(self, collection, record, merge=None):
+        return self._write({'collection': collection, 'record': record}, merge)
+
+    # Add many records with a single write and fsync
+    def append_many(self, collection, records, merge=None):
+        return self._write({'collection': collection, 'records': records}, merge)
+
+    # Set fields on the record whose key field (see KEY_FIELDS) equals `key`
+    def update(self, collection, key, fields):
+        return self._write({'collection': collection, 'key': key, 'fields': fields})
+
+    # `merge`, if given, is called with the entry once we have caught up with
+    # every other instance, while they are locked out. It returns the entry to
+    # write (possibly trimmed), or None to write nothing.
+    @instrumentation.timed('storage.journal.write')
+    def _write(self, entry, merge=None):
+        with self.lock, self.file_lock:
+            # Catch up with other instances first so our seq follows theirs
+            self._follow_rotation()
+            self._drain()
+            if merge is not None:
+                entry = merge(entry)
+                if entry is None:
+                    return None
+
+            self.seq += 1
+            line = json.dumps(dict(entry, seq=self.seq, writer=self.writer))
+            self.file.write(line + '\n')
+            self.file.flush()
+            os.fsync(self.file.fileno())
+            self.apply(entry)
+            self.pending += 1
+
+            if self.pending >= COMPACT_EVERY:
+                self.start_compaction()
+            return entry
+
+    # Compact on a background thread, unless that is already happening
+    def start_compaction(self):
+        if self.compacting is None:
+            self.compacting = threading.Thread(target=self.compact, daemon=True)
+            self.compacting.start()
+
+    # Apply whatever other instances have appended since we last looked
+    def _drain(self):
+        while True:
+            position = self.reader.tell()
+            line = self.reader.readline()
+            if not line.endswith(b'\n'):
+                # Nothing more, or another instance is halfway through writing this line
+                self.reader.seek(position)
+                return
+            entry = json.loads(line)
+            if entry.get('writer') == self.writer:
+                continue
+            self.seq = max(self.seq, entry['seq'])
+            self.apply(entry)
+            self.unseen.append(entry)
+
+    # Another instance may have compacted and started a fresh journal
+    def _follow_rotation(self):
+        try:
+            rotated = os.stat(self.journal_path).st_ino != os.fstat(self.reader.fileno()).st_ino
+        except FileNotFoundError:
+            rotated = False
+        if rotated:
+            self._drain()
+            self.file.close()
+            self.reader.close()
+            self.file = open(self.journal_path, 'a')
+            self.reader = open(self.journal_path, 'rb')
+
+    # Whether the journal has grown or been replaced since we last read it
+    def changed(self):
+        try:
+            stat = os.stat(self.journal_path)
+        except FileNotFoundError:
+            return False
+        return stat.st_ino != os.fstat(self.reader.fileno()).st_ino or stat.st_size != self.reader.tell()
+
+    # Entries other instances have written since the last call, already applied.
+    # Costs a single stat when nothing has changed.
+    def read_new(self):
+        with self.lock:
+            if not self.unseen and not self.changed():
+                return []
+            self._drain()
+            self._follow_rotation()
+            self._drain()
+            unseen, self.unseen = self.unseen, []
+        return unseen
+
+    # Fold the journal back into the snapshot. Only copying the lists and
+    # rotating the journal happen under the lock; serialization runs in the background.
+    # One instance compacts at a time; the others skip it while one is.
+    @instrumentation.timed('storage.journal.compact')
+    def compact(self):
+        if not self.compact_lock.acquire(blocking=False):
+            self.pending = 0
+            self.compacting = None
+            return
+        try:
+            self._compact()
+        finally:
+            self.compact_lock.release()
+            self.compacting = None
+
+    def _compact(self):
+        compacting_path = self.journal_path + '.compacting'
+        with self.lock, self.file_lock:
+            # Bring in other instances' writes first so the snapshot includes them
+            self._follow_rotation()
+            self._drain()
+            snapshot = {key: collection.copy() for key, collection in self.data.items()}
+            snapshot['journal_seq'] = self.seq
+            self.file.close()
+            self.reader.close()
+            if os.path.exists(compacting_path):
+                # Left over from an earlier crash; merge it into the rotated journal
+                with open(compacting_path, 'a') as old, open(self.journal_path, 'r') as new:
+                    old.write(new.read())
+                os.remove(self.journal_path)
+            else:
+                os.replace(self.journal_path, compacting_path)
+            self.file = open(self.journal_path, 'a')
+            self.reader = open(self.journal_path, 'rb')
+            self.pending = 0
+
+        try:
+            if self.prepare_snapshot is not None:
+                snapshot = self.prepare_snapshot(snapshot)
+            self.save(snapshot, self.path)
+            os.remove(compacting_path)
+        except OSError as e:
+            print(f"Failed to compact journal: {e}")
+
+    def close(self):
+        compacting = self.compacting
+        if compacting is not None:
+            compacting.join()
+        with self.lock:
+            self.file.close()
+            self.reader.close()
+            self.file_lock.close()
+            self.compact_lock.close()
+
+
+# Lets open screens hear about new announcements as they are posted,
+# whether by this app instance or another one sharing the same store
+class Store:
+    def __init__(self):
+        self.subscribers = []
+        self.expired_subscribers = []
+
+    def subscribe(self, callback):
+        self.subscribers.append(callback)
+
+    def unsubscribe(self, callback):
+        if callback in self.subscribers:
+            self.subscribers.remove(callback)
+
+    # Subscribers get a list of new announcements, oldest first
+    def publish(self, announcements):
+        if announcements:
+            for callback in list(self.subscribers):
+                callback(announcements)
+
+    # For announcements dropped by archive retention (see archive.py)
+    def subscribe_expired(self, callback):
+        self.expired_subscribers.append(callback)
+
+    # Subscribers get a list of [first_id, last_id] ranges that are gone
+    def publish_expired(self, ranges):
+        if ranges:
+            for callback in list(self.expired_subscribers):
+                callback(ranges)
+
+
+# The original JSON file, kept current through the journal and held in memory
+# as columns (see records.py). Announcements from before this month are sealed
+# into the archive (see archive.py) when the journal is compacted, and only
+# read back on demand. With a binary snapshot, students stay in the mapped
+# file until they are looked up.
+class JsonStore(Store):
+    def __init__(self, path=None, journal_path=JOURNAL_FILE, archive_dir=None, snapshot_format=None):
+        super(JsonStore, self).__init__()
+        binary = (snapshot_format or SNAPSHOT_FORMAT) == 'binary'
+        path = path or (BINARY_DATA_FILE if binary else DATA_FILE)
+        self.lock = threading.Lock()
+        self.archive = Archive(archive_dir or os.path.join(os.path.dirname(path), ARCHIVE_DIR))
+
+        # Hold off other instances' writes and compactions until we are following the journal
+        file_lock = FileLock(journal_path + '.lock')
+        with file_lock:
+            source, source_binary = _newest_snapshot(path, binary)
+            self.data = _read_binary_snapshot(source) if source_binary else _read_snapshot(source)
+            for key, value in empty_data().items():
+                self.data.setdefault(key, value)
+            # Announcements with ids up to this one are in the archive rather than the list
+            self.announcement_base = self.data.pop('archived_announcements', 0)
+            seq = self.data.pop('journal_seq', 0)
+            self._index()
+
+            # Replay the journal written since the snapshot. A compaction
+            # interrupted by a crash leaves its old journal behind as
+            # <journal>.compacting, which is replayed first.
+            seq = _replay(journal_path + '.compacting', seq, self._apply)
+            self.data['journal_seq'] = _replay(journal_path, seq, self._apply)
+            self.journal = Journal(self.data, self._apply, path, journal_path, file_lock=file_lock,
+                                   prepare_snapshot=self._seal, save=save_binary if binary else save_data)
+
+        # Compacting writes the snapshot in this format if it was read in the
+        # other one, and seals last month if a new one has started since
+        if source != path or self.archive.sealable(self.data['announcements']):
+            self.journal.start_compaction()
+
+    # Number the snapshot's records, pack them into columns and build the lookup tables
+    def _index(self):
+        # Announcement ids are their position, counting the archived ones, starting at 1
+        for position, announcement in enumerate(self.data['announcements'], self.announcement_base + 1):
+            announcement.setdefault('id', position)
+        for position, event in enumerate(self.data['events'], 1):
+            event.setdefault('id', position)
+        self.events = EventIndex(self.data['events'])
+
+        # Feeds for the archived announcements are kept with the snapshot, so
+        # the archive needn't be read to build them; snapshots from before
+        # audiences only have announcements for everyone
+        archived_feeds = self.data.pop('archived_feeds', None)
+        if archived_feeds is None:
+            archived_feeds = {EVERYONE: range(1, self.announcement_base + 1)}
+        self.feeds = FeedIndex(archived_feeds)
+        self.feeds.add_many(self.data['announcements'])
+        # Saved feeds may be older than the last time retention dropped a segment
+        for first, last in self.archive.expired:
+            self.feeds.discard(first, last)
+
+        # Pack each collection into columns, one at a time so the dicts can go as we do
+        for collection, record_type in records.RECORD_TYPES.items():
+            loaded = self.data[collection]
+            if isinstance(loaded, binsnap.Section):
+                self.data[collection] = records.Table(record_type, backing=loaded)
+            else:
+                self.data[collection] = records.Table(record_type, loaded)
+
+        # Rows by student number and representative username, so logging in
+        # doesn't have to scan every record. Rows still in a binary snapshot
+        # are found in its sorted keys instead.
+        self.students_by_number = {}
+        self.reps_by_username = {}
+        for row, number in enumerate(self.data['students'].columns['student_number']):
+            if number is not records.UNLOADED:
+                self.students_by_number[None if number is records.MISSING else number] = row
+        for row, username in enumerate(self.data['representatives'].columns['username']):
+            if username is not records.UNLOADED:
+                self.reps_by_username[None if username is records.MISSING else username] = row
+
+    # Move announcements from earlier months out of the snapshot (and out of
+    # memory) into the archive. Runs on the compaction thread.
+    def _seal(self, snapshot):
+        announcements = snapshot['announcements']
+        known = list(self.archive.expired)
+        sealed = self.archive.seal(announcements)
+        if sealed:
+            with self.lock, self.journal.lock:
+                del self.data['announcements'][:sealed]
+                self.announcement_base += sealed
+
+        # Retention may have dropped segments, here or in another instance.
+        # Their ids leave the feeds, so they are no longer shown or counted as
+        # unread (and read watermarks move past them).
+        expired = [ids for ids in self.archive.expired if ids not in known]
+        for first, last in expired:
+            self.feeds.discard(first, last)
+        self.publish_expired(expired)
+        snapshot['announcements'] = announcements[sealed:]
+        snapshot['archived_announcements'] = self.announcement_base
+        snapshot['archived_feeds'] = self.feeds.through(self.announcement_base)
+        return snapshot
+
+    # Apply a journal entry in memory, keeping the lookup tables and announcement ids in step
+    def _apply(self, entry):
+        collection = entry['collection']
+        if 'key' in entry:
+            record = self.lookup(collection, entry['key'])
+            if record is not None:
+                record.update(entry['fields'])
+            return
+
+        table = self.data.setdefault(collection, [])
+        for record in entry_records(entry):
+            if collection == 'announcements':
+                record['id'] = self.announcement_base + len(table) + 1
+            elif collection == 'events':
+                record['id'] = len(table) + 1
+            row = table.append(record)
+            if collection == 'students':
+                self.students_by_number[record.get('student_number')] = row
+            elif collection == 'representatives':
+                self.reps_by_username[record.get('username')] = row
+            elif collection == 'announcements':
+                self.feeds.add(record)
+            elif collection == 'events':
+                self.events.add(record)
+
+    def _row(self, collection, key):
+        row = (self.students_by_number if collection == 'students' else self.reps_by_username).get(key)
+        if row is None and key is not None:
+            row = self.data[collection].find(key)
+        return row
+
+    # A view of the record (see records.py), or None
+    def lookup(self, collection, key):
+        row = self._row(collection, key)
+        return None if row is None else self.data[collection][row]
+
+    @instrumentation.timed('storage.json.get_student')
+    def get_student(self, student_number):
+        return self.lookup('students', student_number)
+
+    # A small number standing for the student (their row), for bitmaps; None if there's no such student
+    def student_index(self, student_number):
+        return self._row('students', student_number)
+
+    @instrumentation.timed('storage.json.get_rep')
+    def get_rep(self, username):
+        return self.lookup('representatives', username)
+
+    @instrumentation.timed('storage.json.update_student')
+    def update_student(self, student_number, fields):
+        self.journal.update('students', student_number, fields)
+
+    # Every student, read a batch at a time so callers on other threads never hold the lock for long
+    def iter_students(self, batch_size=1000):
+        students = self.data['students']
+        position = 0
+        while position < len(students):
+            # Rows still in a binary snapshot are read without being kept
+            with self.lock:
+                batch = [students.row_dict(row) for row in range(position, min(position + batch_size, len(students)))]
+            position += len(batch)
+            yield from batch
+
+    @instrumentation.timed('storage.json.update_rep')
+    def update_rep(self, username, fields):
+        self.journal.update('representatives', username, fields)
+
+    # Write an entry adding `record` unless its key is taken. The check runs
+    # after catching up with other instances, so two of them can't both take a key.
+    def _add_unique(self, collection, record):
+        def merge(entry):
+            return None if self.lookup(collection, record[KEY_FIELDS[collection]]) else entry
+
+        with self.lock:
+            return self.journal.append(collection, record, merge=merge) is not None
+
+    # Returns False without writing anything if the student number is taken
+    @instrumentation.timed('storage.json.add_student')
+    def add_student(self, student):
+        return self._add_unique('students', student)
+
+    # Add many students in one journal write, skipping taken student numbers.
+    # Returns the students that were added.
+    @instrumentation.timed('storage.json.add_students')
+    def add_students(self, students):
+        def merge(entry):
+            added = []
+            numbers = set()
+            for student in students:
+                number = student['student_number']
+                if self._row('students', number) is None and number not in numbers:
+                    numbers.add(number)
+                    added.append(student)
+            return dict(entry, records=added) if added else None
+
+        with self.lock:
+            entry = self.journal.append_many('students', students, merge=merge)
+        return entry['records'] if entry else []
+
+    @instrumentation.timed('storage.json.add_rep')
+    def add_rep(self, rep):
+        return self._add_unique('representatives', rep)
+
+    @instrumentation.timed('storage.json.add_announcement')
+    def add_announcement(self, announcement):
+        # Anything other instances posted first comes before ours in the feed
+        self.refresh()
+        with self.lock:
+            self.journal.append('announcements', announcement)
+        self.publish([announcement])
+
+    # Pick up writes from other instances sharing the file
+    @instrumentation.timed('storage.json.refresh')
+    def refresh(self):
+        with self.lock:
+            new = self.journal.read_new()
+        self.publish([record for entry in new if entry['collection'] == 'announcements'
+                      for record in entry_records(entry)])
+
+    # Newest first, optionally only those older than the id `before`. Announcements
+    # are handed out as plain dicts: archiving shifts the rows under any view kept past it.
+    @instrumentation.timed('storage.json.get_announcements')
+    def get_announcements(self, before=None, limit=None):
+        with self.lock:
+            announcements = self.data['announcements']
+            base = self.announcement_base
+            end = base + len(announcements) if before is None else min(before - 1, base + len(announcements))
+            start = 0 if limit is None else max(end - limit, 0)
+            found = [announcement.to_dict() for announcement in announcements[max(start - base, 0):max(end - base, 0)]]
+        if start < base:
+            # Scrolled back past this month
+            found = self.archive.get_range(start + 1, min(end, base)) + found
+        return found[::-1]
+
+    def latest_announcement_id(self):
+        return self.announcement_base + len(self.data['announcements'])
+
+    # Announcements with the given ids, in the same order
+    @instrumentation.timed('storage.json.get_announcements_by_id')
+    def get_announcements_by_id(self, ids):
+        found = []
+        with self.lock:
+            announcements = self.data['announcements']
+            base = self.announcement_base
+            for i in ids:
+                if i > base:
+                    if i <= base + len(announcements):
+                        found.append(announcements[i - base - 1].to_dict())
+                else:
+                    found.append(i)
+        # Fill in the archived ones
+        for position, announcement in enumerate(found):
+            if isinstance(announcement, int):
+                found[position] = self.archive.get(announcement)
+        return [announcement for announcement in found if announcement is not None]
+
+    # The feed of a student in `audiences` (see feeds.py): newest first,
+    # optionally only those older than the id `before`
+    @instrumentation.timed('storage.json.get_feed')
+    def get_feed(self, audiences, before=None, limit=None):
+        return self.get_announcements_by_id(self.feeds.page(audiences, before, limit))
+
+    # Ids in the feed of a student in `audiences` that are above `after`, oldest first
+    def feed_ids_after(self, audiences, after):
+        return self.feeds.after(audiences, after)
+
+    # Every announcement, oldest first, read a batch at a time
+    def iter_announcements(self, batch_size=1000):
+        last_id = 0
+        for announcement in self.archive:
+            last_id = announcement['id']
+            yield announcement
+        while True:
+            with self.lock:
+                position = max(last_id - self.announcement_base, 0)
+                batch = [announcement.to_dict() for announcement in
+                         self.data['announcements'][position:position + batch_size]]
+            if not batch:
+                return
+            last_id = batch[-1]['id']
+            yield from batch
+
+    # Returns False without writing anything if the venue is booked at any time
+    # in between. The check runs after catching up with other instances.
+    @instrumentation.timed('storage.json.add_event')
+    def add_event(self, event):
+        def merge(entry):
+            return None if self.events.conflicts(event['venue'], event['start'], event['end']) else entry
+
+        with self.lock:
+            return self.journal.append('events', event, merge=merge) is not None
+
+    # Events booked at `venue` that overlap the time from start to end
+    def event_conflicts(self, venue, start, end):
+        return self.events.conflicts(venue, start, end)
+
+    # Events on at any time from start to end, by start time
+    @instrumentation.timed('storage.json.events_between')
+    def events_between(self, start, end):
+        return self.events.between(start, end)
+
+    # Events that haven't ended by `now`, soonest first
+    @instrumentation.timed('storage.json.upcoming_events')
+    def upcoming_events(self, now, limit):
+        return self.events.upcoming(now, limit)
+
+    def get_event(self, event_id):
+        with self.lock:
+            events = self.data['events']
+            return events[event_id - 1] if 0 < event_id <= len(events) else None
+
+    # Save a batch of RSVPs and check-ins (see checkin.py) with a single write and fsync
+    @instrumentation.timed('storage.json.add_checkins')
+    def add_checkins(self, checkins):
+        with self.lock:
+            self.journal.append_many('checkins', checkins)
+
+    def iter_checkins(self, batch_size=1000):
+        checkins = self.data['checkins']
+        position = 0
+        while position < len(checkins):
+            with self.lock:
+                batch = [checkin.to_dict() for checkin in checkins[position:position + batch_size]]
+            position += len(batch)
+            yield from batch
+
+    def close(self):
+        self.journal.close()
+
+
+# An announcement row as a dict, its audience decoded (and left out if it has none)
+def _announcement(row):
+    announcement = dict(row)
+    audience = announcement.pop('audience', None)
+    if audience:
+        announcement['audience'] = json.loads(audience)
+    return announcement
+
+
+# Records live on disk and are fetched on demand, so nothing is loaded at startup
+class SqliteStore(Store):
+    def __init__(self, path=DB_FILE):
+        super(SqliteStore, self).__init__()
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.execute('PRAGMA busy_timeout=5000')
+        had_feeds = self.conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'feed_entries'").fetchone() is not None
+        with self.conn:
+            self.conn.executescript('''
+                CREATE TABLE IF NOT EXISTS students (
+                    student_number TEXT PRIMARY KEY,
+                    name TEXT,
+                    section TEXT,
+                    password TEXT,
+                    email TEXT,
+                    read_state TEXT,
+                    department TEXT
+                );
+                CREATE INDEX IF NOT EXISTS students_section ON students (section);
+
+                CREATE TABLE IF NOT EXISTS representatives (
+                    username TEXT PRIMARY KEY,
+                    department_name TEXT,
+                    password TEXT
+                );
+                CREATE INDEX IF NOT EXISTS representatives_department ON representatives (department_name);
+
+                CREATE TABLE IF NOT EXISTS announcements (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    department TEXT,
+                    announcement TEXT,
+                    posted REAL,
+                    audience TEXT
+                );
+                CREATE INDEX IF NOT EXISTS announcements_department ON announcements (department);
+
+                -- Each announcement's id under every audience it is for (see feeds.py)
+                CREATE TABLE IF NOT EXISTS feed_entries (
+                    audience TEXT,
+                    announcement_id INTEGER,
+                    PRIMARY KEY (audience, announcement_id)
+                ) WITHOUT ROWID;
+
+                CREATE TABLE IF NOT EXISTS events (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    title TEXT,
+                    venue TEXT,
+                    department TEXT,
+                    start REAL,
+                    "end" REAL,
+                    capacity INTEGER
+                );
+
+                CREATE TABLE IF NOT EXISTS checkins (
+                    event_id INTEGER,
+                    student_number TEXT,
+                    kind TEXT,
+                    time REAL
+                );
+            ''')
+        # Databases created before read tracking, post times, event capacities
+        # and audiences don't have the columns yet
+        for table, column, column_type in (('students', 'read_state', 'TEXT'), ('announcements', 'posted', 'REAL'),
+                                           ('events', 'capacity', 'INTEGER'), ('students', 'department', 'TEXT'),
+                                           ('announcements', 'audience', 'TEXT')):
+            columns = [row['name'] for row in self.conn.execute(f'PRAGMA table_info({table})')]
+            if column not in columns:
+                with self.conn:
+                    self.conn.execute(f'ALTER TABLE {table} ADD COLUMN {column} {column_type}')
+        # Announcements posted before audiences existed are for everyone
+        if not had_feeds:
+            with self.conn:
+                self.conn.execute('INSERT OR IGNORE INTO feed_entries (audience, announcement_id) '
+                                  'SELECT ?, id FROM announcements', (EVERYONE,))
+
+        self.last_announcement_id = self.conn.execute('SELECT COALESCE(MAX(id), 0) FROM announcements').fetchone()[0]
+        # Changes whenever another connection commits, so refresh can skip the query otherwise
+        self.data_version = self.conn.execute('PRAGMA data_version').fetchone()[0]
+
+        # Events are indexed in memory (see events.py), read in on first use
+        # and kept up to date with other connections' bookings by id
+        self.events = None
+        self.last_event_id = 0
+
+    def _fetch_one(self, query, params):
+        with self.lock:
+            row = self.conn.execute(query, params).fetchone()
+        return dict(row) if row else None
+
+    def _insert(self, query, params):
+        try:
+            with self.lock, self.conn:
+                self.conn.execute(query, params)
+            return True
+        except sqlite3.IntegrityError:
+            return False
+
+    @instrumentation.timed('storage.sqlite.get_student')
+    def get_student(self, student_number):
+        return self._fetch_one('SELECT * FROM students WHERE student_number = ?', (student_number,))
+
+    # The student's rowid, for bitmaps; None if there's no such student
+    def student_index(self, student_number):
+        with self.lock:
+            row = self.conn.execute('SELECT rowid FROM students WHERE student_number = ?',
+                                    (student_number,)).fetchone()
+        return None if row is None else row[0]
+
+    @instrumentation.timed('storage.sqlite.get_rep')
+    def get_rep(self, username):
+        return self._fetch_one('SELECT * FROM representatives WHERE username = ?', (username,))
+
+    def _update(self, table, key_field, key, fields):
+        # Column names come from our own callers, never from user input
+        assignments = ', '.join(f'{column} = ?' for column in fields)
+        with self.lock, self.conn:
+            self.conn.execute(f'UPDATE {table} SET {assignments} WHERE {key_field} = ?',
+                              list(fields.values()) + [key])
+
+    @instrumentation.timed('storage.sqlite.update_student')
+    def update_student(self, student_number, fields):
+        self._update('students', 'student_number', student_number, fields)
+
+    # Every student, read a batch at a time so callers on other threads never hold the lock for long
+    def iter_students(self, batch_size=1000):
+        last = ''
+        while True:
+            with self.lock:
+                rows = self.conn.execute(
+                    'SELECT * FROM students WHERE student_number > ? ORDER BY student_number LIMIT ?',
+                    (last, batch_size)).fetchall()
+            if not rows:
+                return
+            last = rows[-1]['student_number']
+            for row in rows:
+                yield dict(row)
+
+    @instrumentation.timed('storage.sqlite.update_rep')
+    def update_rep(self, username, fields):
+        self._update('representatives', 'username', username, fields)
+
+    @instrumentation.timed('storage.sqlite.add_student')
+    def add_student(self, student):
+        return self._insert(
+            'INSERT INTO students (student_number, name, section, password, email, department) '
+            'VALUES (?, ?, ?, ?, ?, ?)',
+            (student['student_number'], student['name'], student['section'], student['password'], student['email'],
+             student.get('department')))
+
+    # Add many students in one transaction, skipping taken student numbers.
+    # Returns the students that were added.
+    @instrumentation.timed('storage.sqlite.add_students')
+    def add_students(self, students):
+        added = []
+        with self.lock, self.conn:
+            for student in students:
+                cursor = self.conn.execute(
+                    'INSERT OR IGNORE INTO students (student_number, name, section, password, email, department) '
+                    'VALUES (?, ?, ?, ?, ?, ?)',
+                    (student['student_number'], student['name'], student['section'],
+                     student['password'], student['email'], student.get('department')))
+                if cursor.rowcount:
+                    added.append(student)
+        return added
+
+    @instrumentation.timed('storage.sqlite.add_rep')
+    def add_rep(self, rep):
+        return self._insert(
+            'INSERT INTO representatives (username, department_name, password) VALUES (?, ?, ?)',
+            (rep['username'], rep['department_name'], rep['password']))
+
+    # Fanned out to its audiences' feeds in the same transaction
+    @instrumentation.timed('storage.sqlite.add_announcement')
+    def add_announcement(self, announcement):
+        audience = announcement.get('audience')
+        with self.lock, self.conn:
+            cursor = self.conn.execute(
+                'INSERT INTO announcements (department, announcement, posted, audience) VALUES (?, ?, ?, ?)',
+                (announcement['department'], announcement['announcement'], announcement.get('posted'),
+                 json.dumps(audience) if audience else None))
+            self.conn.executemany('INSERT INTO feed_entries (audience, announcement_id) VALUES (?, ?)',
+                                  [(key, cursor.lastrowid) for key in audiences_of(announcement)])
+        self.publish_new()
+
+    # Publish announcements other connections have added, if anything was committed since we last looked
+    @instrumentation.timed('storage.sqlite.refresh')
+    def refresh(self):
+        with self.lock:
+            version = self.conn.execute('PRAGMA data_version').fetchone()[0]
+            if version == self.data_version:
+                return
+            self.data_version = version
+        self.publish_new()
+
+    # Publish announcements added since we last looked, by us or any other connection
+    def publish_new(self):
+        with self.lock:
+            rows = self.conn.execute('SELECT * FROM announcements WHERE id > ? ORDER BY id',
+                                     (self.last_announcement_id,)).fetchall()
+            if rows:
+                self.last_announcement_id = rows[-1]['id']
+        self.publish([_announcement(row) for row in rows])
+
+    # Newest first, optionally only those older than the id `before`
+    @instrumentation.timed('storage.sqlite.get_announcements')
+    def get_announcements(self, before=None, limit=None):
+        query = 'SELECT * FROM announcements'
+        params = []
+        if before is not None:
+            query += ' WHERE id < ?'
+            params.append(before)
+        query += ' ORDER BY id DESC'
+        if limit is not None:
+            query += ' LIMIT ?'
+            params.append(limit)
+        with self.lock:
+            rows = self.conn.execute(query, params).fetchall()
+        return [_announcement(row) for row in rows]
+
+    def latest_announcement_id(self):
+        with self.lock:
+            return self.conn.execute('SELECT COALESCE(MAX(id), 0) FROM announcements').fetchone()[0]
+
+    # Announcements with the given ids, in the same order
+    @instrumentation.timed('storage.sqlite.get_announcements_by_id')
+    def get_announcements_by_id(self, ids):
+        ids = list(ids)
+        if not ids:
+            return []
+        placeholders = ', '.join('?' * len(ids))
+        with self.lock:
+            rows = self.conn.execute(f'SELECT * FROM announcements WHERE id IN ({placeholders})', ids).fetchall()
+        by_id = {row['id']: _announcement(row) for row in rows}
+        return [by_id[i] for i in ids if i in by_id]
+
+    # Every announcement, oldest first, read a batch at a time
+    def iter_announcements(self, batch_size=1000):
+        last = 0
+        while True:
+            with self.lock:
+                rows = self.conn.execute('SELECT * FROM announcements WHERE id > ? ORDER BY id LIMIT ?',
+                                         (last, batch_size)).fetchall()
+            if not rows:
+                return
+            last = rows[-1]['id']
+            for row in rows:
+                yield _announcement(row)
+
+    # The feed of a student in `audiences` (see feeds.py): newest first,
+    # optionally only those older than the id `before`. Each audience's page
+    # is read off its feed_entries key range and the pages merged.
+    @instrumentation.timed('storage.sqlite.get_feed')
+    def get_feed(self, audiences, before=None, limit=None):
+        if not audiences:
+            return []
+        page = ('SELECT * FROM (SELECT announcement_id FROM feed_entries WHERE audience = ? AND announcement_id < ? '
+                'ORDER BY announcement_id DESC LIMIT ?)')
+        query = ' UNION '.join([page] * len(audiences)) + ' ORDER BY announcement_id DESC LIMIT ?'
+        before = sys.maxsize if before is None else before
+        limit = -1 if limit is None else limit  # no limit
+        params = [param for audience in audiences for param in (audience, before, limit)] + [limit]
+        with self.lock:
+            ids = [row[0] for row in self.conn.execute(query, params)]
+        return self.get_announcements_by_id(ids)
+
+    # Ids in the feed of a student in `audiences` that are above `after`, oldest first
+    def feed_ids_after(self, audiences, after):
+        if not audiences:
+            return []
+        placeholders = ', '.join('?' * len(audiences))
+        with self.lock:
+            rows = self.conn.execute(f'SELECT DISTINCT announcement_id FROM feed_entries WHERE audience IN '
+                                     f'({placeholders}) AND announcement_id > ? ORDER BY announcement_id',
+                                     list(audiences) + [after]).fetchall()
+        return [row[0] for row in rows]
+
+    # Called with the lock held: bring the event index up to date
+    def _catch_up_events(self):
+        if self.events is None:
+            self.events = EventIndex()
+        rows = self.conn.execute('SELECT * FROM events WHERE id > ? ORDER BY id', (self.last_event_id,)).fetchall()
+        if rows:
+            self.events.add_many(dict(row) for row in rows)
+            self.last_event_id = rows[-1]['id']
+
+    def _event_index(self):
+        with self.lock:
+            self._catch_up_events()
+            return self.events
+
+    # Returns False without writing anything if the venue is booked at any time
+    # in between. Other connections are locked out from the check to the insert.
+    @instrumentation.timed('storage.sqlite.add_event')
+    def add_event(self, event):
+        with self.lock:
+            self.conn.execute('BEGIN IMMEDIATE')
+            try:
+                self._catch_up_events()
+                if self.events.conflicts(event['venue'], event['start'], event['end']):
+                    self.conn.rollback()
+                    return False
+                cursor = self.conn.execute(
+                    'INSERT INTO events (title, venue, department, start, "end", capacity) VALUES (?, ?, ?, ?, ?, ?)',
+                    (event['title'], event['venue'], event['department'], event['start'], event['end'],
+                     event.get('capacity')))
+                self.conn.commit()
+            except BaseException:
+                self.conn.rollback()
+                raise
+            event['id'] = self.last_event_id = cursor.lastrowid
+            self.events.add(event)
+        return True
+
+    def event_conflicts(self, venue, start, end):
+        return self._event_index().conflicts(venue, start, end)
+
+    @instrumentation.timed('storage.sqlite.events_between')
+    def events_between(self, start, end):
+        return self._event_index().between(start, end)
+
+    @instrumentation.timed('storage.sqlite.upcoming_events')
+    def upcoming_events(self, now, limit):
+        return self._event_index().upcoming(now, limit)
+
+    def get_event(self, event_id):
+        return self._fetch_one('SELECT * FROM events WHERE id = ?', (event_id,))
+
+    # Save a batch of RSVPs and check-ins (see checkin.py) in one transaction
+    @instrumentation.timed('storage.sqlite.add_checkins')
+    def add_checkins(self, checkins):
+        with self.lock, self.conn:
+            self.conn.executemany('INSERT INTO checkins (event_id, student_number, kind, time) VALUES (?, ?, ?, ?)',
+                                  [(c['event_id'], c['student_number'], c['kind'], c['time']) for c in checkins])
+
+    def iter_checkins(self, batch_size=1000):
+        last = 0
+        while True:
+            with self.lock:
+                rows = self.conn.execute('SELECT rowid, * FROM checkins WHERE rowid > ? ORDER BY rowid LIMIT ?',
+                                         (last, batch_size)).fetchall()
+            if not rows:
+                return
+            last = rows[-1]['rowid']
+            for row in rows:
+                checkin = dict(row)
+                del checkin['rowid']
+                yield checkin
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+
+STORES = {
+    'json': JsonStore,
+    'sqlite': SqliteStore,
+}
+
+
+# Pick the backend with IEMS_STORAGE ('json' by default, or 'sqlite')
+def open_store(kind=None):
+    kind = kind or os.getenv('IEMS_STORAGE', 'json')
+    try:
+        store_cls = STORES[kind]
+    except KeyError:
+        raise ValueError(f"Unknown storage backend: {kind}")
+    return store_cls()
+
+
+# Stands in for the store until it is first needed, so the app can draw its
+# first frame before reading any data. Call get() from a background thread to
+# load it ahead of time.
+class LazyStore:
+    def __init__(self, kind=None):
+        self.kind = kind
+        self.store = None
+        self.lock = threading.Lock()
+
+    def get(self):
+        with self.lock:
+            if self.store is None:
+                self.store = open_store(self.kind)
+            return self.store
+
+    def loaded(self):
+        return self.store is not None
+
+    # Nothing can have changed for us before the store is loaded
+    def refresh(self):
+        if self.store is not None:
+            self.store.refresh()
+
+    def close(self):
+        with self.lock:
+            if self.store is not None:
+                self.store.close()
+                self.store = None
+
+    def __getattr__(self, name):
+        return getattr(self.get(), name)
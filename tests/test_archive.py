@@ -0,0 +1,115 @@
+import os
+import time
+
+import pytest
+
+import search
+import services
+import sessions
+import storage
+from archive import Archive
+from feeds import EVERYONE, section_audience
+from readstate import ReadState
+
+DAY = 24 * 60 * 60
+
+
+def at(year, month, day):
+    return time.mktime((year, month, day, 12, 0, 0, 0, 0, -1))
+
+
+def announcements(first_id, posted, count, audience=EVERYONE):
+    return [{'id': first_id + i, 'announcement': f'Announcement {first_id + i}', 'department': 'Registrar',
+             'posted': posted, 'audience': [audience]} for i in range(count)]
+
+
+def test_seal_writes_a_segment_per_month_and_reopens(tmp_path):
+    directory = str(tmp_path / 'archive')
+    posted = (announcements(1, at(2024, 1, 15), 3) + announcements(4, at(2024, 2, 15), 2)
+              + announcements(6, at(2024, 4, 2), 1))
+    archive = Archive(directory, retention_days=0)
+    # This month's announcement stays out
+    assert archive.seal(posted, now=at(2024, 4, 10)) == 5
+    assert [(s['period'], s['first_id'], s['last_id']) for s in archive.segments] == [
+        ('2024-01', 1, 3), ('2024-02', 4, 5)]
+    assert archive.get(5)['announcement'] == 'Announcement 5'
+
+    reopened = Archive(directory, retention_days=0)
+    assert reopened.segments == archive.segments
+    assert [a['id'] for a in reopened.get_range(2, 4)] == [2, 3, 4]
+    assert [a['id'] for a in reopened] == [1, 2, 3, 4, 5]
+    assert reopened.get(6) is None
+
+
+def test_retention_drops_old_segments(tmp_path):
+    directory = str(tmp_path / 'archive')
+    archive = Archive(directory, retention_days=45)
+    archive.seal(announcements(1, at(2024, 1, 15), 3) + announcements(4, at(2024, 3, 15), 2), now=at(2024, 4, 10))
+
+    assert [s['period'] for s in archive.segments] == ['2024-03']
+    assert archive.expired == [[1, 3]]
+    assert sorted(os.listdir(directory)) == ['2024-03.4-5.jsonl', 'manifest.json']
+    assert archive.get(2) is None
+    assert Archive(directory).expired == [[1, 3]]
+
+
+@pytest.fixture
+def store_path(tmp_path):
+    return {'path': str(tmp_path / 'data.json'), 'journal_path': str(tmp_path / 'data.journal'),
+            'archive_dir': str(tmp_path / 'archive'), 'snapshot_format': 'json'}
+
+
+def test_store_seals_past_months_and_reopens(store_path):
+    now = time.time()
+    store = storage.JsonStore(**store_path)
+    store.journal.append_many('announcements', announcements(1, now - 100 * DAY, 3)
+                              + announcements(4, now, 2))
+    store.journal.compact()
+    assert store.announcement_base == 3
+    assert [a['id'] for a in store.get_announcements()] == [5, 4, 3, 2, 1]
+    store.close()
+
+    store = storage.JsonStore(**store_path)
+    try:
+        assert store.announcement_base == 3
+        assert [a['id'] for a in store.get_feed([EVERYONE])] == [5, 4, 3, 2, 1]
+        assert store.get_announcements_by_id([2])[0]['announcement'] == 'Announcement 2'
+    finally:
+        store.close()
+
+
+def test_retention_trims_feeds_search_and_unread(store_path):
+    now = time.time()
+    store = storage.JsonStore(**store_path)
+    store.archive.retention_days = 70
+    # 1-4 expire, 5-6 are archived but kept, 7 is this month's
+    store.journal.append_many('announcements', announcements(1, now - 130 * DAY, 2)
+                              + announcements(3, now - 130 * DAY, 2, section_audience('A'))
+                              + announcements(5, now - 40 * DAY, 2) + announcements(7, now, 1))
+    store.add_student({'student_number': '1', 'name': 'Student 1', 'section': 'A', 'password': 'x',
+                       'email': '1@example.com'})
+    token, _ = sessions.get_cache().create('student', store.get_student('1'))
+    index = search.index_for(store)
+    index.ready.wait()
+    assert index.search('announcement', limit=10)[0] == 7
+
+    store.journal.compact()
+    audiences = [EVERYONE, section_audience('A')]
+    assert [a['id'] for a in store.get_feed(audiences)] == [7, 6, 5]
+    assert store.feed_ids_after(audiences, 0) == [5, 6, 7]
+    total, ids = index.search('announcement', limit=10)
+    assert (total, sorted(ids)) == (3, [5, 6, 7])
+    assert index.expand('4') == []
+
+    # The student's watermark moves past what is gone
+    status = services.read_status(store, token)
+    assert status['unread'] == 3
+    assert ReadState.decode(status['read_state']).watermark == 4
+    store.close()
+
+    store = storage.JsonStore(**store_path)
+    try:
+        assert store.feed_ids_after(audiences, 0) == [5, 6, 7]
+        assert [a['id'] for a in store.get_feed(audiences, limit=2)] == [7, 6]
+    finally:
+        store.close()
@@ -0,0 +1,84 @@
+import hashlib
+
+import pytest
+
+import auth
+
+
+# Cheap cost parameters, so the tests don't calibrate or take a quarter second a hash
+@pytest.fixture(autouse=True)
+def cheap_params(monkeypatch):
+    monkeypatch.setattr(auth, '_params', {'pbkdf2_iterations': 1000, 'scrypt_n': 16})
+    monkeypatch.setattr(auth, 'verify_cache', auth.VerifyCache())
+
+
+@pytest.mark.parametrize('kdf, prefix', [('pbkdf2', 'pbkdf2_sha256$1000$'), ('scrypt', 'scrypt$16$8$1$')])
+def test_hash_then_verify(monkeypatch, kdf, prefix):
+    monkeypatch.setattr(auth, 'KDF', kdf)
+    stored = auth.hash_password('correct horse')
+    assert stored.startswith(prefix)
+    assert 'correct horse' not in stored
+    assert auth.verify_password('correct horse', stored)
+    assert not auth.needs_rehash(stored)
+
+
+def test_hashes_are_salted():
+    assert auth.hash_password('same') != auth.hash_password('same')
+
+
+def test_wrong_password_is_rejected():
+    stored = auth.hash_password('right')
+    assert not auth.verify_password('wrong', stored)
+    assert not auth.verify_password('right', '')
+    assert not auth.verify_password('right', 'bcrypt$whatever')
+
+
+def test_legacy_hash_verifies_once_then_is_replaced():
+    legacy = hashlib.sha256(b'old password').hexdigest()
+    assert auth.is_legacy_hash(legacy)
+    assert auth.verify_password('old password', legacy)
+    assert not auth.verify_password('other', legacy)
+    assert auth.needs_rehash(legacy)
+
+    upgraded = auth.rehash_if_needed('old password', legacy)
+    assert upgraded is not None and not auth.is_legacy_hash(upgraded)
+    assert auth.verify_password('old password', upgraded)
+    assert auth.rehash_if_needed('old password', upgraded) is None
+
+
+def test_weaker_hashes_are_flagged_for_rehash(monkeypatch):
+    stored = auth.hash_password('password')
+    monkeypatch.setattr(auth, '_params', {'pbkdf2_iterations': 2000, 'scrypt_n': 16})
+    assert auth.needs_rehash(stored)
+    monkeypatch.setattr(auth, 'KDF', 'scrypt')
+    assert auth.needs_rehash(stored)
+
+
+def test_verification_is_cached(monkeypatch):
+    stored = auth.hash_password('password')
+    assert auth.verify_password('password', stored)
+
+    def no_hashing(password, stored):
+        raise AssertionError('hashed again')
+
+    monkeypatch.setattr(auth, '_check', no_hashing)
+    assert auth.verify_password('password', stored)
+    # Only successes are remembered
+    with pytest.raises(AssertionError):
+        auth.verify_password('wrong', stored)
+
+
+def test_verify_cache_expires_and_stays_bounded():
+    cache = auth.VerifyCache(ttl=-1, size=2)
+    cache.add('password', 'stored')
+    assert not cache.hit('password', 'stored')
+
+    cache = auth.VerifyCache(ttl=60, size=2)
+    for password in ('a', 'b', 'c'):
+        cache.add(password, 'stored')
+    assert len(cache.entries) == 2
+    assert not cache.hit('a', 'stored')
+    assert cache.hit('c', 'stored')
+    assert not cache.hit('c', 'other stored')
+    # Keyed by a digest, never the password itself
+    assert all(len(key) == 32 for key in cache.entries)
@@ -0,0 +1,128 @@
+import json
+import time
+
+import pytest
+
+import binsnap
+import storage
+from feeds import EVERYONE, section_audience
+
+
+@pytest.fixture
+def open_store(tmp_path):
+    stores = []
+
+    # A store in tmp_path with the default file names, so switching format
+    # finds the snapshot written in the other one
+    def open_store(snapshot_format):
+        filename = storage.BINARY_DATA_FILE if snapshot_format == 'binary' else storage.DATA_FILE
+        store = storage.JsonStore(str(tmp_path / filename), str(tmp_path / storage.JOURNAL_FILE),
+                                  archive_dir=str(tmp_path / 'archive'), snapshot_format=snapshot_format)
+        stores.append(store)
+        return store
+
+    yield open_store
+    for store in stores:
+        store.close()
+
+
+def student(number, **fields):
+    return dict({'student_number': number, 'name': f'Student {number}', 'section': 'A',
+                 'password': 'x', 'email': f'{number}@example.com'}, **fields)
+
+
+def announcement(text, audience=None):
+    return {'announcement': text, 'department': 'Registrar', 'posted': time.time(),
+            'audience': audience or [EVERYONE]}
+
+
+def seed(store):
+    for i in range(50):
+        store.add_student(student(f'{i:04d}', section='A' if i % 2 else 'B'))
+    store.add_rep({'department_name': 'Registrar', 'username': 'registrar', 'password': 'x'})
+    store.add_announcement(announcement('For everyone'))
+    store.add_announcement(announcement('For section A', [section_audience('A')]))
+    store.update_student('0003', {'name': 'Renamed'})
+
+
+def contents(store):
+    return {
+        'students': [store.get_student(f'{i:04d}') for i in range(50)],
+        'rep': store.get_rep('registrar'),
+        'feed_a': [a['announcement'] for a in store.get_feed([EVERYONE, section_audience('A')])],
+        'feed_b': [a['announcement'] for a in store.get_feed([EVERYONE, section_audience('B')])],
+    }
+
+
+def test_save_then_load_gives_the_same_data(tmp_path):
+    data = storage.empty_data()
+    data['students'] = [student(f'{i:04d}') for i in range(100)]
+    data['announcements'] = [dict(announcement(f'Announcement {i}'), id=i + 1) for i in range(10)]
+    data['journal_seq'] = 42
+    path = str(tmp_path / 'data.snap')
+    binsnap.save(data, path, storage.KEY_FIELDS)
+    assert binsnap.load(path) == json.loads(json.dumps(data))
+
+
+def test_lookup_by_key(tmp_path):
+    data = storage.empty_data()
+    data['students'] = [student(f'{i:04d}') for i in reversed(range(100))]
+    path = str(tmp_path / 'data.snap')
+    binsnap.save(data, path, storage.KEY_FIELDS)
+    section = binsnap.Snapshot(path).sections['students']
+    assert section.record(section.find('0042'))['student_number'] == '0042'
+    assert section.find('9999') is None
+
+
+def test_binary_store_matches_json_store(open_store, tmp_path):
+    seed(open_store('json'))
+    for store in (open_store('json'), open_store('binary')):
+        store.journal.compact()
+    expected = contents(open_store('json'))
+    assert contents(open_store('binary')) == expected
+    assert expected['students'][3]['name'] == 'Renamed'
+    assert expected['feed_b'] == ['For everyone']
+
+
+def test_switching_to_binary_keeps_the_data(open_store, tmp_path):
+    store = open_store('json')
+    seed(store)
+    store.journal.compact()
+    expected = contents(store)
+    store.close()
+
+    binary = open_store('binary')
+    assert contents(binary) == expected
+    binary.close()
+
+    # The data is now in the binary snapshot
+    assert len(binsnap.load(str(tmp_path / storage.BINARY_DATA_FILE))['students']) == 50
+    assert contents(open_store('binary')) == expected
+
+
+def test_switching_back_keeps_writes_made_in_binary(open_store, tmp_path):
+    store = open_store('json')
+    seed(store)
+    store.journal.compact()
+    store.close()
+
+    binary = open_store('binary')
+    binary.add_student(student('9999'))
+    binary.journal.compact()
+    binary.add_announcement(announcement('Posted in binary'))
+    expected = contents(binary)
+    binary.close()
+
+    reopened = open_store('json')
+    assert contents(reopened) == expected
+    assert reopened.get_student('9999') is not None
+    reopened.close()
+    with open(tmp_path / storage.DATA_FILE) as f:
+        assert any(s['student_number'] == '9999' for s in json.load(f)['students'])
+
+
+@pytest.mark.parametrize('content', [b'', b'not a snapshot', b'x' * 100])
+def test_damaged_snapshot_stops_the_store_opening(open_store, tmp_path, content):
+    (tmp_path / storage.BINARY_DATA_FILE).write_bytes(content)
+    with pytest.raises(binsnap.FormatError):
+        open_store('binary')
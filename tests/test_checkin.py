@@ -0,0 +1,150 @@
+import json
+import threading
+import time
+
+import pytest
+
+import checkin
+import storage
+
+
+@pytest.fixture
+def open_store(tmp_path):
+    stores = []
+
+    def open_store():
+        store = storage.JsonStore(str(tmp_path / 'data.json'), str(tmp_path / 'data.journal'),
+                                  archive_dir=str(tmp_path / 'archive'), snapshot_format='json')
+        stores.append(store)
+        return store
+
+    yield open_store
+    for store in stores:
+        store.close()
+
+
+@pytest.fixture
+def store(open_store):
+    store = open_store()
+    for i in range(1, 11):
+        store.add_student({'student_number': f'{i:04d}', 'name': f'Student {i}', 'section': 'A',
+                           'password': 'x', 'email': f'{i}@example.com'})
+    assert store.add_event({'title': 'Orientation', 'venue': 'Gym', 'department': 'Registrar',
+                            'start': 100, 'end': 200, 'capacity': 3})
+    return store
+
+
+@pytest.fixture
+def attendance(store):
+    attendance = checkin.Attendance(store)
+    yield attendance
+    attendance.close()
+
+
+# The check-in entries in the journal, each a list of (student number, kind)
+def journaled(tmp_path):
+    with open(tmp_path / 'data.journal') as f:
+        entries = [json.loads(line) for line in f]
+    return [[(record['student_number'], record['kind']) for record in entry['records']]
+            for entry in entries if entry['collection'] == 'checkins']
+
+
+def run_together(count, target):
+    barrier = threading.Barrier(count)
+    results = [None] * count
+
+    def run(i):
+        barrier.wait()
+        results[i] = target(i)
+
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def test_one_student_scanned_at_once_is_let_in_once(attendance, tmp_path):
+    results = run_together(8, lambda i: attendance.check_in(1, '0001'))
+    accepted = [counts for counts, error in results if error is None]
+    assert len(accepted) == 1
+    assert accepted[0] == {'capacity': 3, 'taken': 1, 'rsvps': 0, 'checked_in': 1}
+    assert sorted(error for _, error in results if error) == ['Already checked in.'] * 7
+    assert journaled(tmp_path) == [[('0001', checkin.CHECK_IN)]]
+
+
+def test_check_ins_queued_during_a_write_are_saved_together(store, attendance, tmp_path):
+    writing = threading.Event()
+    release = threading.Event()
+    add_checkins = store.add_checkins
+
+    def slow_add_checkins(checkins):
+        writing.set()
+        release.wait(5)
+        add_checkins(checkins)
+
+    store.add_checkins = slow_add_checkins
+    first = threading.Thread(target=attendance.check_in, args=(1, '0001'))
+    first.start()
+    assert writing.wait(5)
+
+    # These queue up behind the write in progress
+    others = [threading.Thread(target=attendance.rsvp, args=(1, number)) for number in ('0002', '0003')]
+    for thread in others:
+        thread.start()
+    deadline = time.monotonic() + 5
+    while len(attendance.pending) < 2:
+        assert time.monotonic() < deadline, 'timed out'
+        time.sleep(0.01)
+    release.set()
+    for thread in [first] + others:
+        thread.join()
+
+    batches = journaled(tmp_path)
+    assert len(batches) == 2
+    assert batches[0] == [('0001', checkin.CHECK_IN)]
+    assert sorted(batches[1]) == [('0002', checkin.RSVP), ('0003', checkin.RSVP)]
+
+
+def test_capacity_is_enforced(attendance):
+    assert attendance.rsvp(1, '0001')[1] is None
+    assert attendance.check_in(1, '0002')[1] is None
+    assert attendance.rsvp(1, '0003')[1] is None
+    assert attendance.check_in(1, '0004') == (None, 'The event is full.')
+    assert attendance.rsvp(1, '0005') == (None, 'The event is full.')
+    # Students who RSVPed still get in, without taking another place
+    counts, error = attendance.check_in(1, '0001')
+    assert error is None
+    assert counts == {'capacity': 3, 'taken': 3, 'rsvps': 2, 'checked_in': 2}
+    assert attendance.rsvp(1, '0001') == (None, 'Already RSVPed.')
+    assert attendance.check_in(1, '9999') == (None, 'Unknown student number.')
+    assert attendance.check_in(2, '0001') == (None, 'No such event.')
+
+
+def test_counts_are_rebuilt_after_reopening(store, open_store):
+    attendance = checkin.Attendance(store)
+    attendance.rsvp(1, '0001')
+    attendance.rsvp(1, '0002')
+    attendance.check_in(1, '0002')
+    attendance.check_in(1, '0003')
+    before = attendance.summary(1)
+    attendance.close()
+    store.close()
+
+    store = open_store()
+    attendance = checkin.Attendance(store)
+    try:
+        assert attendance.summary(1) == before == {'capacity': 3, 'taken': 3, 'rsvps': 2, 'checked_in': 2}
+        counts = attendance.events[1]
+        for number, rsvped, arrived in [('0001', True, False), ('0002', True, True), ('0003', False, True),
+                                        ('0004', False, False)]:
+            index = store.student_index(number)
+            assert bool(checkin._is_set(counts.rsvped, index)) == rsvped
+            assert bool(checkin._is_set(counts.arrived, index)) == arrived
+
+        assert attendance.check_in(1, '0003') == (None, 'Already checked in.')
+        assert attendance.check_in(1, '0004') == (None, 'The event is full.')
+        assert attendance.check_in(1, '0001')[1] is None
+    finally:
+        attendance.close()
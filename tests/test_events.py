@@ -0,0 +1,98 @@
+import random
+
+import pytest
+
+import storage
+from events import EventIndex, IntervalTree
+
+VENUES = ['Gym', 'Room 101', 'Library']
+
+
+def event(event_id, start, end, venue='Gym'):
+    return {'id': event_id, 'title': f'Event {event_id}', 'venue': venue, 'department': '',
+            'start': start, 'end': end}
+
+
+def random_events(rng, count):
+    events = []
+    for event_id in range(1, count + 1):
+        start = rng.randrange(1000)
+        events.append(event(event_id, start, start + rng.randint(1, 60), rng.choice(VENUES)))
+    return events
+
+
+# What every query should return, found by checking each event
+def overlapping(events, start, end):
+    return sorted((e for e in events if e['start'] < end and e['end'] > start), key=lambda e: (e['start'], e['id']))
+
+
+def ids(events):
+    return [e['id'] for e in events]
+
+
+def test_touching_events_do_not_conflict():
+    index = EventIndex([event(1, 100, 200)])
+    assert index.conflicts('Gym', 200, 300) == []
+    assert index.conflicts('Gym', 0, 100) == []
+    assert ids(index.conflicts('Gym', 199, 201)) == [1]
+
+
+def test_conflicts_are_per_venue():
+    index = EventIndex([event(1, 100, 200, 'Gym'), event(2, 100, 200, 'Room 101')])
+    assert ids(index.conflicts('Gym', 150, 160)) == [1]
+    assert index.conflicts('Library', 150, 160) == []
+
+
+def test_venue_names_ignore_case_and_spacing():
+    index = EventIndex([event(1, 100, 200, 'Room  101')])
+    assert ids(index.conflicts(' room 101', 150, 160)) == [1]
+
+
+def test_an_event_spanning_the_query_conflicts():
+    index = EventIndex([event(1, 0, 1000), event(2, 10, 20)])
+    assert ids(index.conflicts('Gym', 500, 501)) == [1]
+
+
+def test_upcoming_includes_events_still_running():
+    index = EventIndex([event(1, 0, 100), event(2, 50, 60), event(3, 200, 300), event(4, 400, 500)])
+    assert ids(index.upcoming(80)) == [1, 3, 4]
+    assert ids(index.upcoming(80, limit=2)) == [1, 3]
+
+
+@pytest.mark.parametrize('seed', range(20))
+def test_matches_checking_every_event(seed):
+    rng = random.Random(seed)
+    events = random_events(rng, 300)
+    index = EventIndex(events)
+    assert len(index) == len(events)
+
+    for _ in range(100):
+        start = rng.randrange(-50, 1100)
+        end = start + rng.randint(1, 200)
+        assert ids(index.between(start, end)) == ids(overlapping(events, start, end))
+        venue = rng.choice(VENUES)
+        expected = overlapping([e for e in events if e['venue'] == venue], start, end)
+        assert ids(index.conflicts(venue, start, end)) == ids(expected)
+
+
+def test_tree_built_in_start_order_stays_correct():
+    # Sorted inserts are the worst case for an unbalanced tree
+    tree = IntervalTree()
+    events = [event(event_id, event_id * 10, event_id * 10 + 25) for event_id in range(1, 2001)]
+    for e in events:
+        tree.insert(e)
+    assert len(tree) == len(events)
+    assert ids(tree.overlapping(5000, 5030)) == ids(overlapping(events, 5000, 5030))
+
+
+def test_store_refuses_a_clashing_booking(tmp_path):
+    store = storage.JsonStore(str(tmp_path / 'data.json'), str(tmp_path / 'data.journal'),
+                              archive_dir=str(tmp_path / 'archive'), snapshot_format='json')
+    try:
+        assert store.add_event(event(None, 100, 200))
+        assert not store.add_event(event(None, 150, 250, 'gym'))
+        assert store.add_event(event(None, 150, 250, 'Library'))
+        assert store.add_event(event(None, 200, 300))
+        assert ids(store.events_between(0, 1000)) == [1, 2, 3]
+    finally:
+        store.close()
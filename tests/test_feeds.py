@@ -0,0 +1,132 @@
+import random
+import time
+
+import pytest
+
+import feeds
+import search
+import services
+import sessions
+import storage
+from feeds import EVERYONE, FeedIndex, department_audience, section_audience
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = storage.JsonStore(str(tmp_path / 'data.json'), str(tmp_path / 'data.journal'),
+                              archive_dir=str(tmp_path / 'archive'), snapshot_format='json')
+    yield store
+    store.close()
+
+
+def student(number, section, department=None):
+    record = {'student_number': number, 'name': f'Student {number}', 'section': section,
+              'password': 'x', 'email': f'{number}@example.com'}
+    if department:
+        record['department'] = department
+    return record
+
+
+def sign_in(user_type, user):
+    token, _ = sessions.get_cache().create(user_type, user)
+    return token
+
+
+def post(store, text, audience):
+    store.add_announcement({'announcement': text, 'department': 'Registrar', 'posted': time.time(),
+                            'audience': audience})
+
+
+def texts(announcements):
+    return [announcement['announcement'] for announcement in announcements]
+
+
+def test_parse_audience():
+    assert feeds.parse_audience('Everyone', 'IT') == ([EVERYONE], None)
+    assert feeds.parse_audience('My department', ' IT ') == ([department_audience('it')], None)
+    assert feeds.parse_audience('Sections', 'IT', 'b, A,,a') == (
+        [section_audience('A'), section_audience('B')], None)
+    assert feeds.parse_audience('My department', '')[1] is not None
+    assert feeds.parse_audience('Sections', 'IT', ' , ')[1] is not None
+    assert feeds.parse_audience('Nobody', 'IT')[1] is not None
+
+
+def test_student_audiences():
+    assert feeds.student_audiences({'section': 'A'}) == [EVERYONE, section_audience('A')]
+    assert feeds.student_audiences({'section': 'A', 'department': 'IT'}) == [
+        EVERYONE, section_audience('A'), department_audience('IT')]
+
+
+def test_announcements_without_an_audience_are_for_everyone():
+    assert feeds.is_for({'announcement': 'Old'}, [EVERYONE])
+    assert not feeds.is_for({'audience': [section_audience('A')]}, [EVERYONE, section_audience('B')])
+
+
+@pytest.mark.parametrize('seed', range(10))
+def test_feed_index_matches_filtering_every_announcement(seed):
+    rng = random.Random(seed)
+    choices = [[EVERYONE], [section_audience('A')], [section_audience('B')], [department_audience('IT')],
+               [section_audience('A'), section_audience('B')], None]
+    announcements = [{'id': i, 'audience': rng.choice(choices)} for i in range(1, 301)]
+    index = FeedIndex()
+    index.add_many(announcements[:150])
+    index = FeedIndex(index.through(150))
+    index.add_many(announcements[150:])
+
+    for audiences in ([EVERYONE], [EVERYONE, section_audience('A')],
+                      [EVERYONE, section_audience('B'), department_audience('IT')]):
+        expected = [a['id'] for a in reversed(announcements) if feeds.is_for(a, audiences)]
+        assert index.page(audiences) == expected
+        assert index.page(audiences, limit=10) == expected[:10]
+        before = rng.randint(1, 300)
+        assert index.page(audiences, before=before, limit=10) == [i for i in expected if i < before][:10]
+        after = rng.randint(0, 300)
+        assert index.after(audiences, after) == sorted(i for i in expected if i > after)
+
+
+def test_students_only_see_their_own_announcements(store):
+    post(store, 'Everyone', [EVERYONE])
+    post(store, 'Section A', [section_audience('A')])
+    post(store, 'Section B', [section_audience('B')])
+    post(store, 'IT', [department_audience('IT')])
+
+    a = sign_in('student', student('1', 'A', 'IT'))
+    b = sign_in('student', student('2', 'b'))
+    assert texts(services.load_feed(store, a)) == ['IT', 'Section A', 'Everyone']
+    assert texts(services.load_feed(store, b)) == ['Section B', 'Everyone']
+    assert texts(services.load_feed(store, a, before=3, limit=1)) == ['Section A']
+
+
+def test_representatives_see_every_announcement(store):
+    post(store, 'Everyone', [EVERYONE])
+    post(store, 'Section A', [section_audience('A')])
+    rep = sign_in('representative', {'username': 'registrar', 'department_name': 'Registrar'})
+    assert texts(services.load_feed(store, rep)) == ['Section A', 'Everyone']
+
+
+def test_no_feed_without_a_session(store):
+    post(store, 'Everyone', [EVERYONE])
+    assert services.load_feed(store, 'not a token') == []
+    assert services.search_announcements(store, 'not a token', 'everyone') == (0, [])
+
+
+def test_search_only_finds_the_students_announcements(store):
+    post(store, 'Exam timetable', [EVERYONE])
+    post(store, 'Exam room for section A', [section_audience('A')])
+    post(store, 'Exam room for section B', [section_audience('B')])
+    search.index_for(store)
+
+    b = sign_in('student', student('2', 'B'))
+    total, found = services.search_announcements(store, b, 'exam')
+    assert total == 2
+    assert sorted(texts(found)) == ['Exam room for section B', 'Exam timetable']
+    # Pages are of the student's matches, not cut short by other people's
+    assert len(services.search_announcements(store, b, 'exam', 0, 1)[1]) == 1
+    assert len(services.search_announcements(store, b, 'exam', 1, 1)[1]) == 1
+
+    rep = sign_in('representative', {'username': 'registrar', 'department_name': 'Registrar'})
+    assert services.search_announcements(store, rep, 'exam')[0] == 3
+
+    # Posted after the index was built
+    post(store, 'Exam for section A only', [section_audience('A')])
+    assert services.search_announcements(store, b, 'exam')[0] == 2
@@ -0,0 +1,83 @@
+import json
+import sys
+
+import pytest
+
+import auth
+import import_students
+import mailer
+import storage
+
+ROSTER = """name,student_number,section,email,password,department
+Ana Cruz,1001,A,ana@example.com,pw1,IT
+Ben Reyes,1002,B,ben@example.com,pw2,
+No Email,1003,A,,pw3,
+Bad Email,1004,A,not-an-address,pw4,
+Ana Again,1001,A,ana2@example.com,pw5,
+Already Here,2000,A,here@example.com,pw6,
+Cara Lim,1005,C,cara@example.com,pw7,
+"""
+
+
+@pytest.fixture
+def roster(tmp_path, monkeypatch):
+    # The CLI opens the default store and outbox in the working directory
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv('IEMS_STORAGE', 'json')
+    monkeypatch.setattr(auth, '_params', {'pbkdf2_iterations': 1000, 'scrypt_n': 16})
+    path = tmp_path / 'roster.csv'
+    path.write_text(ROSTER)
+
+    store = storage.open_store()
+    store.add_student({'student_number': '2000', 'name': 'Already Here', 'section': 'A',
+                       'password': 'x', 'email': 'here@example.com'})
+    store.close()
+    return path
+
+
+def journal_entries():
+    with open(storage.JOURNAL_FILE) as f:
+        return [json.loads(line) for line in f]
+
+
+def test_import_skips_bad_rows_and_duplicates(roster, monkeypatch, capsys):
+    monkeypatch.setattr(sys, 'argv', ['import_students.py', str(roster), '--workers', '1'])
+    import_students.main()
+
+    output = capsys.readouterr().out
+    assert 'line 4: skipped, missing email' in output
+    assert "line 5: skipped, invalid email 'not-an-address'" in output
+    assert 'line 6: skipped, student number 1001 is already registered' in output
+    assert 'line 7: skipped, student number 2000 is already registered' in output
+    assert 'Imported 3 student(s)' in output
+
+    # The seeded student, then every imported one in a single entry
+    entries = journal_entries()
+    assert len(entries) == 2
+    assert [student['student_number'] for student in entries[1]['records']] == ['1001', '1002', '1005']
+
+    store = storage.open_store()
+    try:
+        ana = store.get_student('1001')
+        assert ana['name'] == 'Ana Cruz' and ana['department'] == 'IT'
+        assert auth.verify_password('pw1', ana['password'])
+        assert 'department' not in store.get_student('1002')
+        assert store.get_student('1003') is None
+        assert store.get_student('1004') is None
+        assert store.get_student('2000')['password'] == 'x'
+    finally:
+        store.close()
+
+    # A welcome email for each new student
+    outbox = mailer.Outbox()
+    try:
+        recipients = [row[0] for row in outbox.conn.execute('SELECT recipient FROM messages ORDER BY id')]
+    finally:
+        outbox.close()
+    assert recipients == ['ana@example.com', 'ben@example.com', 'cara@example.com']
+
+
+def test_no_email_queues_nothing(roster, monkeypatch, tmp_path):
+    monkeypatch.setattr(sys, 'argv', ['import_students.py', str(roster), '--workers', '1', '--no-email'])
+    import_students.main()
+    assert not (tmp_path / mailer.OUTBOX_FILE).exists()
@@ -0,0 +1,100 @@
+import json
+
+import pytest
+
+import storage
+
+
+@pytest.fixture
+def open_store(tmp_path):
+    stores = []
+
+    # Each call is another app instance sharing the same snapshot and journal
+    def open_store():
+        store = storage.JsonStore(str(tmp_path / 'data.json'), str(tmp_path / 'data.journal'),
+                                  archive_dir=str(tmp_path / 'archive'), snapshot_format='json')
+        stores.append(store)
+        return store
+
+    yield open_store
+    for store in stores:
+        store.close()
+
+
+def student(number, **fields):
+    return dict({'student_number': number, 'name': f'Student {number}', 'section': 'A',
+                 'password': 'x', 'email': f'{number}@example.com'}, **fields)
+
+
+def test_reopen_replays_adds_and_updates(open_store, tmp_path):
+    store = open_store()
+    store.add_student(student('1'))
+    store.add_student(student('2'))
+    store.update_student('1', {'name': 'Renamed'})
+    store.close()
+
+    reopened = open_store()
+    assert reopened.get_student('1')['name'] == 'Renamed'
+    assert reopened.get_student('2')['name'] == 'Student 2'
+
+
+def test_writers_see_each_others_writes(open_store):
+    first = open_store()
+    second = open_store()
+    first.add_student(student('1'))
+    second.add_announcement({'department': 'D', 'announcement': 'Hello', 'posted': 1.0})
+
+    # Writing catches up first, and refresh catches up on its own
+    second.update_student('1', {'section': 'B'})
+    first.refresh()
+    assert first.get_student('1')['section'] == 'B'
+    assert [announcement['announcement'] for announcement in first.get_announcements()] == ['Hello']
+
+
+def test_unique_keys_hold_across_writers(open_store):
+    first = open_store()
+    second = open_store()
+    assert first.add_student(student('1'))
+    assert not second.add_student(student('1', name='Impostor'))
+    assert second.get_student('1')['name'] == 'Student 1'
+
+
+def test_announcement_ids_follow_the_journal_order(open_store):
+    first = open_store()
+    second = open_store()
+    first.add_announcement({'department': 'D', 'announcement': 'one', 'posted': 1.0})
+    second.add_announcement({'department': 'D', 'announcement': 'two', 'posted': 2.0})
+    first.add_announcement({'department': 'D', 'announcement': 'three', 'posted': 3.0})
+    second.refresh()
+    for store in (first, second):
+        assert [(a['id'], a['announcement']) for a in store.get_announcements()] == \
+            [(3, 'three'), (2, 'two'), (1, 'one')]
+
+
+def test_compaction_by_one_writer_is_followed_by_the_other(open_store, tmp_path):
+    first = open_store()
+    second = open_store()
+    first.add_student(student('1'))
+    first.journal.start_compaction()
+    first.journal.compacting.join()
+    second.add_student(student('2'))
+    first.refresh()
+    assert first.get_student('2') is not None
+
+    with open(tmp_path / 'data.json') as f:
+        assert [s['student_number'] for s in json.load(f)['students']] == ['1']
+    assert open_store().get_student('2') is not None
+
+
+def test_a_torn_last_line_is_ignored(open_store, tmp_path):
+    store = open_store()
+    store.add_student(student('1'))
+    store.close()
+    with open(tmp_path / 'data.journal', 'a') as f:
+        f.write('{"collection": "students", "record": {"student_nu')
+
+    reopened = open_store()
+    assert reopened.get_student('1') is not None
+    reopened.add_student(student('2'))
+    reopened.close()
+    assert open_store().get_student('2') is not None
@@ -0,0 +1,264 @@
+import socketserver
+import threading
+import time
+
+import pytest
+
+import mailer
+
+
+# Just enough of an SMTP server to deliver to: it keeps what it receives,
+# refuses the addresses in `refused` and hangs up on RCPT for those in `drop`
+class SMTPHandler(socketserver.StreamRequestHandler):
+    def reply(self, line):
+        self.wfile.write(line.encode() + b'\r\n')
+
+    def handle(self):
+        server = self.server
+        self.reply('220 localhost ready')
+        recipients = []
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode().strip()
+            verb = command[:4].upper()
+            if verb in ('EHLO', 'HELO', 'NOOP'):
+                self.reply('250 localhost')
+            elif verb in ('MAIL', 'RSET'):
+                recipients = []
+                self.reply('250 OK')
+            elif verb == 'RCPT':
+                address = command.split(':', 1)[1].strip().strip('<>')
+                if address in server.drop:
+                    return
+                if address in server.refused:
+                    self.reply('550 No such user')
+                else:
+                    recipients.append(address)
+                    self.reply('250 OK')
+            elif verb == 'DATA':
+                self.reply('354 End data with <CR><LF>.<CR><LF>')
+                while self.rfile.readline() not in (b'.\r\n', b''):
+                    pass
+                with server.lock:
+                    server.received.extend(recipients)
+                self.reply('250 OK')
+            elif verb == 'QUIT':
+                self.reply('221 Bye')
+                return
+            else:
+                self.reply('500 Unknown command')
+
+
+@pytest.fixture
+def smtp_server():
+    server = socketserver.ThreadingTCPServer(('127.0.0.1', 0), SMTPHandler)
+    server.daemon_threads = True
+    server.received = []
+    server.refused = set()
+    server.drop = set()
+    server.lock = threading.Lock()
+    threading.Thread(target=server.serve_forever, args=(0.05,), daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def dispatcher(tmp_path, smtp_server):
+    host, port = smtp_server.server_address
+    dispatcher = mailer.MailDispatcher(outbox=mailer.Outbox(str(tmp_path / 'outbox.db')),
+                                       pool=mailer.SMTPPool(host, port, starttls=False),
+                                       sender='iems@example.com', workers=1, limiter=mailer.RateLimiter(rate=0))
+    yield dispatcher
+    dispatcher.stop()
+
+
+def messages(outbox):
+    with outbox.lock:
+        rows = outbox.conn.execute('SELECT recipient, status, attempts, next_attempt FROM messages').fetchall()
+    return {recipient: (status, attempts, next_attempt) for recipient, status, attempts, next_attempt in rows}
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, 'timed out'
+        time.sleep(0.01)
+
+
+# Send whatever is due on this thread, as a worker would
+def send_due(dispatcher):
+    dispatcher._send_batch(dispatcher.outbox.claim(dispatcher.batch_size))
+
+
+def test_queued_mail_is_delivered(dispatcher, smtp_server):
+    dispatcher.start()
+    dispatcher.enqueue_many([(f'{i}@example.com', 'Subject', 'Body') for i in range(3)])
+    wait_for(lambda: len(smtp_server.received) == 3)
+    wait_for(lambda: dispatcher.outbox.pending_count() == 0)
+    assert sorted(smtp_server.received) == ['0@example.com', '1@example.com', '2@example.com']
+    assert messages(dispatcher.outbox) == {}
+
+
+def test_refused_recipient_is_marked_failed(dispatcher, smtp_server):
+    smtp_server.refused.add('nobody@example.com')
+    dispatcher.enqueue('nobody@example.com', 'Subject', 'Body')
+    dispatcher.enqueue('student@example.com', 'Subject', 'Body')
+    send_due(dispatcher)
+    assert smtp_server.received == ['student@example.com']
+    assert messages(dispatcher.outbox) == {'nobody@example.com': ('failed', 1, 0)}
+
+
+def test_dropped_connection_is_requeued_with_backoff(dispatcher, smtp_server):
+    smtp_server.drop.add('first@example.com')
+    dispatcher.enqueue('first@example.com', 'Subject', 'Body')
+    dispatcher.enqueue('second@example.com', 'Subject', 'Body')
+    before = time.time()
+    send_due(dispatcher)
+
+    queued = messages(dispatcher.outbox)
+    status, attempts, next_attempt = queued['first@example.com']
+    assert (status, attempts) == ('pending', 1)
+    assert next_attempt >= before + mailer.backoff_delay(1)
+    # The rest of the batch goes back as it was, due straight away
+    status, attempts, next_attempt = queued['second@example.com']
+    assert (status, attempts) == ('pending', 0)
+    assert next_attempt <= time.time()
+
+    # A new connection picks up what is due; the failed one waits out its backoff
+    smtp_server.drop.clear()
+    send_due(dispatcher)
+    assert smtp_server.received == ['second@example.com']
+    assert list(messages(dispatcher.outbox)) == ['first@example.com']
+
+
+def test_backoff_doubles_up_to_the_maximum():
+    assert mailer.backoff_delay(1) == mailer.BACKOFF_BASE
+    assert mailer.backoff_delay(3) == mailer.BACKOFF_BASE * 4
+    assert mailer.backoff_delay(100) == mailer.BACKOFF_MAX
+
+
+def test_gives_up_after_max_attempts(dispatcher, smtp_server):
+    smtp_server.drop.add('student@example.com')
+    dispatcher.enqueue('student@example.com', 'Subject', 'Body')
+    with dispatcher.outbox.lock, dispatcher.outbox.conn:
+        dispatcher.outbox.conn.execute('UPDATE messages SET attempts = ?', (mailer.MAX_ATTEMPTS - 1,))
+    send_due(dispatcher)
+    status, attempts, _ = messages(dispatcher.outbox)['student@example.com']
+    assert (status, attempts) == ('failed', mailer.MAX_ATTEMPTS)
+    assert dispatcher.outbox.pending_count() == 0
+
+
+# Lets the first `fail_after` messages through, then raises
+class BrokenLimiter:
+    def __init__(self, fail_after):
+        self.remaining = fail_after
+
+    def acquire(self):
+        if not self.remaining:
+            raise RuntimeError('limiter broke')
+        self.remaining -= 1
+
+
+def test_unexpected_error_requeues_the_batch_and_releases_the_connection(dispatcher, smtp_server):
+    dispatcher.limiter = BrokenLimiter(1)
+    for recipient in ('first@example.com', 'second@example.com', 'third@example.com'):
+        dispatcher.enqueue(recipient, 'Subject', 'Body')
+    before = time.time()
+    send_due(dispatcher)
+
+    assert smtp_server.received == ['first@example.com']
+    queued = messages(dispatcher.outbox)
+    status, attempts, next_attempt = queued['second@example.com']
+    assert (status, attempts) == ('pending', 1)
+    assert next_attempt >= before + mailer.backoff_delay(1)
+    status, attempts, next_attempt = queued['third@example.com']
+    assert (status, attempts) == ('pending', 0)
+    assert next_attempt <= time.time()
+
+    # The connection was dropped and its slot handed back
+    assert dispatcher.pool.idle == []
+    assert dispatcher.pool.slots.acquire(blocking=False)
+    dispatcher.pool.slots.release()
+
+
+# Time that only moves when the limiter sleeps
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+@pytest.mark.parametrize('burst', [1, None])
+def test_rate_limiter_keeps_to_the_rate(burst):
+    clock = FakeClock()
+    limiter = mailer.RateLimiter(rate=4, burst=burst, clock=clock, sleep=clock.sleep)
+    sends = []
+    for _ in range(40):
+        limiter.acquire()
+        sends.append(clock.now)
+
+    # Within any second, at most the burst plus a second's worth of messages
+    allowed = limiter.capacity + limiter.rate
+    for first, last in zip(sends, sends[int(allowed):]):
+        assert last - first >= 1 - 1e-9
+    assert clock.now == pytest.approx((40 - limiter.capacity) / limiter.rate)
+
+
+def test_rate_limiter_without_a_rate_never_waits():
+    clock = FakeClock()
+    limiter = mailer.RateLimiter(rate=0, clock=clock, sleep=clock.sleep)
+    for _ in range(100):
+        limiter.acquire()
+    assert clock.now == 0
+
+
+class RecordingDispatcher:
+    def __init__(self):
+        self.batches = []
+
+    def enqueue_many(self, messages):
+        self.batches.append(list(messages))
+
+
+def test_fanout_queues_every_recipient_in_batches():
+    dispatcher = RecordingDispatcher()
+    fanout = mailer.FanOut(dispatcher)
+    ready = threading.Event()
+    count = 2 * mailer.FANOUT_BATCH + 3
+
+    def recipients():
+        ready.wait(5)
+        for i in range(count):
+            yield f'{i}@example.com'
+
+    # submit returns straight away, even though the recipients aren't ready yet
+    fanout.submit('Subject', 'Body', recipients())
+    assert dispatcher.batches == []
+    ready.set()
+    fanout.stop()
+
+    assert [len(batch) for batch in dispatcher.batches] == [mailer.FANOUT_BATCH, mailer.FANOUT_BATCH, 3]
+    queued = [message for batch in dispatcher.batches for message in batch]
+    assert queued == [(f'{i}@example.com', 'Subject', 'Body') for i in range(count)]
+
+
+def test_fanout_survives_a_failing_recipient_list():
+    dispatcher = RecordingDispatcher()
+    fanout = mailer.FanOut(dispatcher, batch_size=2)
+
+    def broken():
+        yield 'a@example.com'
+        raise OSError('roster unavailable')
+
+    fanout.submit('First', 'Body', broken())
+    fanout.submit('Second', 'Body', ['b@example.com'])
+    fanout.stop()
+    assert dispatcher.batches == [[('b@example.com', 'Second', 'Body')]]
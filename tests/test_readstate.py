@@ -0,0 +1,118 @@
+import random
+import time
+
+import pytest
+
+import services
+import sessions
+import storage
+from feeds import EVERYONE, section_audience
+from readstate import ReadState
+
+
+# The same operations on a plain set of read ids, to check ReadState against
+class Model:
+    def __init__(self):
+        self.read = set()
+
+    def mark_read(self, announcement_ids):
+        self.read.update(announcement_ids)
+
+    def mark_all_read(self, latest_id):
+        self.read.update(range(1, latest_id + 1))
+
+    def unread_count(self, latest_id):
+        return sum(1 for announcement_id in range(1, latest_id + 1) if announcement_id not in self.read)
+
+
+def check(state, model, latest_id):
+    for announcement_id in range(1, latest_id + 1):
+        assert state.is_read(announcement_id) == (announcement_id in model.read)
+    assert state.unread_count(latest_id) == model.unread_count(latest_id)
+
+
+@pytest.mark.parametrize('text', ['', '0', '5', '120:3,2,5,1', '0:1,1'])
+def test_decode_then_encode_is_the_same_text(text):
+    assert ReadState.decode(text).encode() == (text or '0')
+
+
+def test_encode_runs():
+    state = ReadState()
+    state.mark_read([1, 2, 3, 7, 8, 12])
+    assert state.watermark == 3
+    assert state.encode() == '3:3,2,3,1'
+
+
+def test_marking_the_gap_moves_the_watermark():
+    state = ReadState()
+    state.mark_read([2, 3])
+    assert state.encode() == '0:1,2'
+    state.mark_read([1])
+    assert state.encode() == '3'
+
+
+def test_mark_all_read_keeps_reads_above_it():
+    state = ReadState()
+    state.mark_read([5, 9])
+    state.mark_all_read(6)
+    assert state.watermark == 6
+    assert not state.is_read(8)
+    assert state.is_read(9)
+    assert state.unread_count(10) == 3
+
+
+def test_unread_count_below_the_watermark_is_zero():
+    state = ReadState(10)
+    assert state.unread_count(4) == 0
+    assert state.unread_count(10) == 0
+
+
+@pytest.mark.parametrize('seed', range(20))
+def test_matches_a_set_of_read_ids(seed):
+    rng = random.Random(seed)
+    state, model = ReadState(), Model()
+    latest_id = 0
+    for _ in range(200):
+        latest_id += rng.randrange(3)
+        operation = rng.random()
+        if operation < 0.8 and latest_id:
+            ids = [rng.randint(1, latest_id) for _ in range(rng.randint(1, 4))]
+            state.mark_read(ids)
+            model.mark_read(ids)
+        elif operation < 0.85:
+            state.mark_all_read(latest_id)
+            model.mark_all_read(latest_id)
+
+        # What is saved on the student record reads back the same
+        state = ReadState.decode(state.encode())
+        check(state, model, latest_id)
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = storage.JsonStore(str(tmp_path / 'data.json'), str(tmp_path / 'data.journal'),
+                              archive_dir=str(tmp_path / 'archive'), snapshot_format='json')
+    yield store
+    store.close()
+
+
+def test_only_the_students_feed_counts_as_unread(store):
+    # Every tenth announcement is for everyone, the rest for another section
+    store.journal.append_many('announcements', [
+        {'announcement': f'Announcement {i}', 'department': 'Registrar', 'posted': time.time(),
+         'audience': [EVERYONE] if i % 10 == 1 else [section_audience('A')]}
+        for i in range(1, 1001)])
+    store.add_student({'student_number': '1', 'name': 'Student 1', 'section': 'B', 'password': 'x',
+                       'email': '1@example.com'})
+    token, _ = sessions.get_cache().create('student', store.get_student('1'))
+
+    assert services.read_status(store, token)['unread'] == 100
+    status = services.mark_read(store, token, [1, 11, 31])
+    assert status['unread'] == 97
+    # Everything of theirs up to 20 is read, so the watermark is past the other section's 12 to 20
+    assert ReadState.decode(status['read_state']).watermark == 20
+    assert status['read_state'] == store.get_student('1')['read_state']
+
+    status = services.mark_all_read(store, token)
+    assert status == {'read_state': '1000', 'latest': 1000, 'unread': 0}
+    assert services.read_status(store, token)['unread'] == 0
@@ -0,0 +1,116 @@
+import json
+
+import pytest
+
+import binsnap
+from records import MISSING, UNLOADED, Announcement, Student, Table, to_json
+
+
+def student(number, **fields):
+    return dict({'student_number': number, 'name': f'Student {number}', 'section': 'A',
+                 'password': 'x', 'email': f'{number}@example.com'}, **fields)
+
+
+# A section of a binary snapshot holding `records`
+def section(tmp_path, name, records, key_field=None):
+    path = str(tmp_path / 'snapshot.bin')
+    binsnap.save({name: records}, path, {name: key_field} if key_field else None)
+    return binsnap.Snapshot(path).sections[name]
+
+
+@pytest.fixture
+def backed(tmp_path):
+    students = [student(f'{i:04d}', nickname=f'n{i}') for i in range(10)]
+    return Table(Student, backing=section(tmp_path, 'students', students, 'student_number'))
+
+
+def test_rows_are_read_from_the_snapshot_when_first_used(backed):
+    assert len(backed) == 10
+    assert backed.columns['name'][3] is UNLOADED
+    assert backed[3]['name'] == 'Student 0003'
+    assert backed.columns['name'][3] == 'Student 0003'
+    assert backed.columns['name'][4] is UNLOADED
+    # Saving a row that was never read doesn't keep it
+    assert backed.row_dict(4)['student_number'] == '0004'
+    assert backed.columns['name'][4] is UNLOADED
+
+
+def test_set_on_a_row_still_in_the_snapshot_keeps_its_other_fields(backed):
+    backed.set(5, 'read_state', '7')
+    assert backed[5].to_dict() == student('0005', nickname='n5', read_state='7')
+    backed[6]['name'] = 'Renamed'
+    assert backed[6]['email'] == '0006@example.com'
+    assert backed.row_dict(6)['name'] == 'Renamed'
+
+
+def test_fields_outside_fields_go_in_extras():
+    table = Table(Student, [student('1', nickname='Ana', clubs=['chess'])])
+    assert table.extras[0] == {'nickname': 'Ana', 'clubs': ['chess']}
+    assert table[0]['clubs'] == ['chess']
+    assert table.columns['department'][0] is MISSING
+    assert 'department' not in table[0]
+    with pytest.raises(KeyError):
+        table[0]['department']
+
+    table[0].update({'nickname': 'Annie', 'department': 'IT'})
+    assert table.extras[0] == {'nickname': 'Annie', 'clubs': ['chess']}
+    assert table.columns['department'][0] == 'IT'
+    assert table[0].to_dict() == student('1', nickname='Annie', clubs=['chess'], department='IT')
+
+
+def test_deleting_leading_rows_then_indexing():
+    table = Table(Announcement, [{'id': i, 'announcement': f'A{i}'} for i in range(1, 6)])
+    del table[:2]
+    assert len(table) == 3
+    assert [record['id'] for record in table] == [3, 4, 5]
+    assert table[0]['announcement'] == 'A3'
+    assert table[-1]['id'] == 5
+    assert [record['id'] for record in table[1:]] == [4, 5]
+    with pytest.raises(IndexError):
+        table[3]
+
+
+def test_deleting_leading_rows_still_in_the_snapshot(tmp_path):
+    announcements = [{'id': i, 'announcement': f'A{i}'} for i in range(1, 6)]
+    table = Table(Announcement, backing=section(tmp_path, 'announcements', announcements))
+    assert table[1]['id'] == 2
+    del table[:2]
+    table.append({'id': 6, 'announcement': 'A6'})
+    assert [record['id'] for record in table] == [3, 4, 5, 6]
+    assert table.row_dict(1) == {'id': 4, 'announcement': 'A4'}
+
+
+def test_find_skips_deleted_rows(backed):
+    assert backed.find('0004') == 4
+    del backed[:3]
+    assert backed.find('0004') == 1
+    assert backed[backed.find('0004')]['name'] == 'Student 0004'
+    assert backed.find('0001') is None
+    assert backed.find('9999') is None
+
+
+def test_copy_is_not_changed_by_later_writes(backed):
+    backed[0]['name'] = 'Before'
+    copy = backed.copy()
+    backed[0]['name'] = 'After'
+    backed[0]['nickname'] = 'changed'
+    backed.set(2, 'name', 'Loaded later')
+    backed.append(student('0010'))
+
+    assert len(copy) == 10
+    assert copy[0]['name'] == 'Before'
+    assert copy[0]['nickname'] == 'n0'
+    assert copy.row_dict(2)['name'] == 'Student 0002'
+    assert len(backed) == 11
+
+
+def test_to_json_round_trip(backed):
+    backed[1]['read_state'] = '3'
+    text = json.dumps({'students': backed, 'one': backed[1]}, default=to_json)
+    loaded = json.loads(text)
+    assert loaded['one'] == student('0001', nickname='n1', read_state='3')
+    assert loaded['students'][1] == loaded['one']
+    assert loaded['students'] == [backed.row_dict(row) for row in range(len(backed))]
+    assert Table(Student, loaded['students'])[9].to_dict() == student('0009', nickname='n9')
+    with pytest.raises(TypeError):
+        to_json(object())
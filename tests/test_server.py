@@ -0,0 +1,116 @@
+import json
+import os
+import platform
+import queue
+import socket
+import subprocess
+import sys
+import time
+
+import pytest
+
+import auth
+import storage
+from client import ServerError, ServiceClient
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+# server.py in its own process, with its store in tmp_path
+@pytest.fixture
+def address(tmp_path):
+    # Saved cheap cost parameters, so the server neither calibrates nor takes long to hash
+    (tmp_path / auth.PARAMS_FILE).write_text(json.dumps(
+        {platform.node(): {'pbkdf2_iterations': 1000, 'scrypt_n': 16, 'budget_ms': auth.HASH_BUDGET_MS}}))
+    env = dict(os.environ, PYTHONPATH=ROOT, IEMS_STORAGE='json', IEMS_ANNOUNCEMENT_EMAIL='0',
+               IEMS_PERSIST_SESSIONS='0', PYTHONUNBUFFERED='1')
+    port = free_port()
+    process = subprocess.Popen([sys.executable, os.path.join(ROOT, 'server.py'), '--port', str(port)],
+                               cwd=str(tmp_path), env=env, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                               text=True)
+    try:
+        line = process.stdout.readline()
+        assert line.startswith('Serving on'), line
+        yield f'127.0.0.1:{port}'
+    finally:
+        process.terminate()
+        process.wait(10)
+        process.stdout.close()
+
+
+@pytest.fixture
+def service(address):
+    # One connection, so everything below shares it
+    service = ServiceClient(address, pool_size=1)
+    yield service
+    service.close()
+
+
+def call(service, operation, *args):
+    return service.call(operation, *args).result(timeout=10)
+
+
+def test_many_requests_in_flight_on_one_connection(service):
+    numbers = [str(1000 + i) for i in range(20)]
+    futures = [service.call('register_student', f'Student {number}', number, 'A', f'{number}@example.com',
+                            f'pw{number}', None) for number in numbers]
+    assert [future.result(timeout=10) for future in futures] == [None] * len(numbers)
+
+    # Each answer is matched up with its own request
+    futures = {number: service.call('login', 'student', number, f'pw{number}') for number in numbers}
+    for number, future in futures.items():
+        session, error = future.result(timeout=10)
+        assert error is None
+        assert session['user']['student_number'] == number
+    assert len([connection for connection in service.pool if connection is not None]) == 1
+
+
+def test_bad_arguments_are_rejected(service):
+    with pytest.raises(ServerError, match='Invalid arguments for mark_read'):
+        call(service, 'mark_read', 'token', ['1'])
+    with pytest.raises(ServerError, match='Invalid arguments for events_between'):
+        call(service, 'events_between', True, 10)
+    with pytest.raises(ServerError, match='Wrong number of arguments for login'):
+        call(service, 'login', 'student')
+    with pytest.raises(ServerError, match='Unknown operation'):
+        call(service, 'drop_tables')
+    # The connection is still good afterwards
+    assert call(service, 'session_stats')['sessions'] == 0
+
+
+def test_login_never_returns_the_password_hash(service, tmp_path):
+    assert call(service, 'register_student', 'Ana Cruz', '1001', 'A', 'ana@example.com', 'secret', None) is None
+    with open(tmp_path / storage.JOURNAL_FILE) as f:
+        stored = json.loads(f.readline())['record']['password']
+
+    session, error = call(service, 'login', 'student', '1001', 'secret')
+    assert error is None
+    assert 'password' not in session['user']
+    assert stored not in json.dumps(session)
+    assert call(service, 'resume', session['token'])['user'] == session['user']
+
+    session, error = call(service, 'login', 'student', '1001', 'wrong')
+    assert session is None and error == 'Invalid Student Number or Password'
+
+
+def test_subscribers_are_sent_new_announcements(service):
+    assert call(service, 'register_rep', 'Registrar', 'registrar', 'secret') is None
+    session, _ = call(service, 'login', 'representative', 'registrar', 'secret')
+
+    received = queue.Queue()
+    service.subscribe(received.put)
+    # Posted on the same connection, so the subscription is in place first
+    _, error = call(service, 'post_announcement', session['token'], 'No classes on Friday', None, '')
+    assert error is None
+
+    deadline = time.monotonic() + 10
+    while True:
+        announcements = received.get(timeout=max(0, deadline - time.monotonic()))
+        if any(a['announcement'] == 'No classes on Friday' for a in announcements):
+            break
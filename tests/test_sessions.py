@@ -0,0 +1,99 @@
+import json
+
+import pytest
+
+import auth
+import sessions
+
+STUDENT = {'student_number': '1001', 'name': 'Ana Cruz', 'section': 'A', 'email': 'ana@example.com',
+           'read_state': '3'}
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+@pytest.fixture
+def student():
+    return dict(STUDENT, password=auth.hash_password('secret'))
+
+
+@pytest.fixture(autouse=True)
+def cheap_params(monkeypatch):
+    monkeypatch.setattr(auth, '_params', {'pbkdf2_iterations': 1000, 'scrypt_n': 16})
+
+
+def test_session_keeps_the_record_without_the_hash(clock, student):
+    cache = sessions.SessionCache(clock=clock)
+    token, session = cache.create('student', student)
+    assert session['user'] == {field: value for field, value in student.items()
+                               if field not in ('password', 'read_state')}
+    assert cache.get(token) is session
+    assert cache.get('not a token') is None
+    assert token not in cache.sessions
+
+
+def test_sessions_expire_after_the_ttl_unused(clock, student):
+    cache = sessions.SessionCache(ttl=60, clock=clock)
+    token, _ = cache.create('student', student)
+    clock.now += 50
+    assert cache.get(token) is not None
+    # Using it pushed the expiry back
+    clock.now += 50
+    assert cache.get(token) is not None
+    clock.now += 61
+    assert cache.get(token) is None
+    assert cache.stats()['expirations'] == 1
+    assert len(cache.sessions) == 0
+
+
+def test_least_recently_used_sessions_are_evicted(clock, student):
+    cache = sessions.SessionCache(size=2, clock=clock)
+    first, _ = cache.create('student', student)
+    second, _ = cache.create('student', student)
+    assert cache.get(first) is not None
+    third, _ = cache.create('student', student)
+
+    assert cache.get(second) is None
+    assert cache.get(first) is not None
+    assert cache.get(third) is not None
+    stats = cache.stats()
+    assert (stats['sessions'], stats['evictions']) == (2, 1)
+
+
+def test_logout_revokes_the_session(clock, student):
+    cache = sessions.SessionCache(clock=clock)
+    token, _ = cache.create('student', student)
+    assert cache.revoke(token)
+    assert cache.get(token) is None
+    assert not cache.revoke(token)
+
+
+def test_sessions_survive_a_restart(tmp_path, clock, student):
+    path = str(tmp_path / 'sessions.json')
+    cache = sessions.SessionCache(ttl=60, path=path, clock=clock)
+    token, session = cache.create('student', student)
+    revoked, _ = cache.create('representative', {'username': 'registrar', 'password': student['password']})
+    cache.revoke(revoked)
+
+    text = (tmp_path / 'sessions.json').read_text()
+    assert token not in text and revoked not in text
+    assert student['password'] not in text
+    assert 'password' not in json.dumps(list(json.loads(text).values()))
+
+    reopened = sessions.SessionCache(ttl=60, path=path, clock=clock)
+    assert reopened.get(token) == session
+    assert reopened.get(revoked) is None
+
+    # Sessions that expired while it was down aren't loaded
+    clock.now += 61
+    assert len(sessions.SessionCache(ttl=60, path=path, clock=clock).sessions) == 0